@@ -0,0 +1,59 @@
+"""
+Compare rows/s of the per-record DocumentFactory path and the columnar path.
+
+Run from code/Mondu with: python -m benchmarks.bench_columnar [ROWS]
+"""
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, Any, Callable
+
+from benchmarks.generators import write_amazfit_bip, write_flow
+from src.columnar import iter_columnar_samples
+from src.config import DEFAULT_CONFIG
+from src.document_factory import DocumentFactory
+from src.file_parser import iter_records
+from src.sample_processor import iter_samples, aggregate_bucket_stream
+
+def measure(name: str, rows: int, run: Callable[[], int]) -> float:
+    """
+    Time one ingestion path and print its throughput.
+
+    :param name: Label of the path
+    :param rows: Number of input rows
+    :param run: Function running the path and returning the number of bucket updates
+    :return: Rows per second
+    """
+    start = time.perf_counter()
+    updates = run()
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<11} {rows / elapsed:>12,.0f} rows/s  ({updates} bucket updates, {elapsed:.2f}s)")
+    return rows / elapsed
+
+def benchmark(device: str, writer: Callable[[str, int], None], rows: int, directory: str):
+    """
+    Benchmark the per-record and columnar paths on one synthetic device export.
+
+    :param device: Device name
+    :param writer: Function writing the synthetic export
+    :param rows: Number of rows to generate
+    :param directory: Directory for the generated file
+    """
+    config: Dict[str, Any] = {**DEFAULT_CONFIG, 'DEVICE': device, 'USERNAME': "anonymous"}
+    file_path = os.path.join(directory, f"{device}.csv")
+    writer(file_path, rows)
+    factory = DocumentFactory(config)
+
+    print(f"{device} ({rows} rows)")
+    per_record = measure("per-record", rows, lambda: sum(1 for _ in aggregate_bucket_stream(
+        iter_samples(iter_records(file_path), factory, config, progress=False),
+        config['MAX_SAMPLES'], config['AGGREGATE_WINDOW'])))
+    columnar = measure("columnar", rows, lambda: sum(1 for _ in iter_columnar_samples(file_path, config)))
+    print(f"  speedup     {columnar / per_record:>12.1f}x")
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as directory:
+        benchmark("amazfit_bip", write_amazfit_bip, rows, directory)
+        benchmark("flow", write_flow, rows, directory)
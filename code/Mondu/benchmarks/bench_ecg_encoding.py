@@ -0,0 +1,153 @@
+"""
+Compare move_ecg signal storage as strings and as encoded binary (ENCODE_SIGNALS).
+
+Run from code/Mondu with: python -m benchmarks.bench_ecg_encoding [--rows N] [--live]
+
+Both variants ingest the same synthetic ECG export: 30 second recordings at
+300 Hz of an ECG-like waveform with noise, as integer microvolts. The report
+gives ingest throughput (transform and prepare, per-record and columnar) and
+the BSON size of the resulting bucket documents. With --live the buckets are
+also written to a scratch database and its storage statistics reported, which
+needs a MongoDB server at MONGO_URI.
+"""
+import csv
+import os
+import tempfile
+import time
+from datetime import timedelta
+from typing import Dict, Any, List
+
+import bson
+import click
+import numpy as np
+
+from benchmarks.generators import START
+from src.columnar import iter_columnar_samples
+from src.config import DEFAULT_CONFIG
+from src.document_factory import DocumentFactory
+from src.file_parser import iter_records
+from src.sample_processor import aggregate_buckets, iter_samples
+from src.signal_codec import decode_value, parse_signal
+
+def write_ecg_recordings(file_path: str, rows: int, frequency: int = 300, seconds: int = 30):
+    """
+    Write a synthetic Withings Move ECG export with realistic signal payloads.
+
+    :param file_path: Path of the CSV file to write
+    :param rows: Number of recordings
+    :param frequency: Sampling frequency in Hz
+    :param seconds: Duration of each recording
+    """
+    rng = np.random.default_rng(0)
+    samples = frequency * seconds
+    t = np.arange(samples) / frequency
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["date", "type", "frequency", "duration", "wearposition", "signal",
+                         "format", "size", "totalsize"])
+        for row in range(rows):
+            beat = (t * rng.uniform(1.0, 1.6)) % 1.0
+            waveform = (900 * np.exp(-((beat - 0.3) / 0.012) ** 2) + 120 * np.exp(-((beat - 0.6) / 0.05) ** 2)
+                        + 60 * np.sin(2 * np.pi * 0.3 * t) + rng.normal(0, 8, samples))
+            signal = ",".join(map(str, np.round(waveform).astype(int).tolist()))
+            writer.writerow([(START + timedelta(minutes=30 * row)).isoformat() + "+00:00", "ECG", frequency,
+                             seconds, "left wrist", f"[{signal}]", "raw", samples, samples])
+
+def bucket_documents(samples: List[Dict[str, Any]], max_samples: int) -> List[Dict[str, Any]]:
+    """
+    Bucket documents the prepared samples would create in an empty collection.
+
+    :param samples: Prepared samples
+    :param max_samples: Maximum number of samples per MongoDB document
+    :return: List of bucket documents
+    """
+    documents = []
+    for sample in aggregate_buckets(samples, max_samples):
+        update = sample['collection_dict']
+        pushed = update['$push']['measurements']
+        documents.append({
+            **{k: v for k, v in sample['sample_dict'].items() if k != 'n_samples'},
+            "measurements": pushed['$each'] if '$each' in pushed else [pushed],
+            **update.get('$min', {}), **update.get('$max', {}), **update.get('$inc', {})
+        })
+    return documents
+
+def run_variant(file_path: str, rows: int, config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Ingest the export with one configuration and measure it.
+
+    :param file_path: Path of the ECG export
+    :param rows: Number of recordings in the export
+    :param config: Configuration dictionary
+    :return: Dictionary with records/s per path, the bucket documents and their BSON bytes
+    """
+    start = time.perf_counter()
+    samples = list(iter_samples(iter_records(file_path), DocumentFactory(config), config))
+    records_per_second = rows / (time.perf_counter() - start)
+    start = time.perf_counter()
+    columnar_samples = list(iter_columnar_samples(file_path, config))
+    columnar_per_second = rows / (time.perf_counter() - start)
+    documents = bucket_documents(samples, config['MAX_SAMPLES'])
+    return {"records_per_second": records_per_second, "columnar_per_second": columnar_per_second,
+            "documents": documents, "bson_bytes": sum(len(bson.encode(d)) for d in documents),
+            "columnar_bson_bytes": sum(len(bson.encode(d))
+                                       for d in bucket_documents(columnar_samples, config['MAX_SAMPLES']))}
+
+def check_round_trip(strings: List[Dict[str, Any]], encoded: List[Dict[str, Any]]):
+    """
+    Check that every decoded signal equals the parsed string it was encoded from.
+
+    :param strings: Bucket documents of the string variant
+    :param encoded: Bucket documents of the encoded variant
+    :raises AssertionError: If a signal differs
+    """
+    for plain, packed in zip(strings, encoded):
+        for a, b in zip(plain['measurements'], packed['measurements']):
+            assert np.array_equal(parse_signal(a['value']), decode_value(b['value'])), "signal round trip failed"
+
+@click.command()
+@click.option("-n", "--rows", type=int, default=500, help="Number of 30 second recordings.")
+@click.option("--live", is_flag=True, default=False, help="Also write both variants to a scratch database.")
+@click.option("-db", "--database", default="mondu_bench", help="Scratch database for --live, dropped after the run.")
+def main(rows: int, live: bool, database: str):
+    """
+    Run the ECG encoding comparison.
+
+    :param rows: Number of recordings
+    :param live: Whether to measure storage on a MongoDB server
+    :param database: Scratch database name
+    """
+    config = {**DEFAULT_CONFIG, 'DEVICE': "move_ecg", 'USERNAME': "anonymous"}
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "move_ecg.csv")
+        write_ecg_recordings(file_path, rows)
+        csv_bytes = os.path.getsize(file_path)
+        results = {"string": run_variant(file_path, rows, {**config, 'ENCODE_SIGNALS': False}),
+                   "encoded": run_variant(file_path, rows, {**config, 'ENCODE_SIGNALS': True})}
+    check_round_trip(results["string"]["documents"], results["encoded"]["documents"])
+
+    print(f"{rows} recordings, {csv_bytes / 2 ** 20:.2f} MB of CSV")
+    print(f"{'variant':<9} {'records/s':>10} {'columnar/s':>11} {'BSON MB':>9} {'columnar BSON MB':>17}")
+    for variant, result in results.items():
+        print(f"{variant:<9} {result['records_per_second']:>10,.0f} {result['columnar_per_second']:>11,.0f} "
+              f"{result['bson_bytes'] / 2 ** 20:>9.2f} {result['columnar_bson_bytes'] / 2 ** 20:>17.2f}")
+    print(f"BSON size ratio (encoded / string): {results['encoded']['bson_bytes'] / results['string']['bson_bytes']:.3f}")
+
+    if live:
+        from benchmarks.bench_timeseries import storage_stats
+        from src.db_utils import get_client, close_client
+        client = get_client(config)
+        client.drop_database(database)
+        try:
+            db = client[database]
+            print(f"{'variant':<9} {'storage MB':>11} {'data MB':>9}")
+            for variant, result in results.items():
+                db[variant].insert_many(result['documents'])
+                stats = storage_stats(db[variant])
+                print(f"{variant:<9} {stats['storageSize'] / 2 ** 20:>11.2f} {stats['size'] / 2 ** 20:>9.2f}")
+        finally:
+            client.drop_database(database)
+            close_client()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Measure records/s and peak memory of the parse, transform and prepare stages per device.
+
+Run from code/Mondu with: python -m benchmarks.bench_stages [--rows N] [--device NAME] [--save]
+
+Results are compared with the stored baseline (benchmarks/baseline.json by
+default); --save replaces the baseline with the current run.
+"""
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, Any, Callable, List, Optional
+
+import click
+
+from benchmarks.generators import GENERATORS
+from src.config import DEFAULT_CONFIG
+from src.document_factory import DocumentFactory
+from src.file_parser import iter_records
+from src.sample_processor import iter_samples
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Relative throughput drop reported as a regression
+REGRESSION_THRESHOLD = 0.10
+
+def measure(run: Callable[[], Any], rows: int, repeat: int) -> Dict[str, float]:
+    """
+    Time a stage and measure its peak traced memory.
+
+    The stage is timed on its own (best of repeat runs) and then run once more
+    under tracemalloc, so tracing overhead does not skew the throughput.
+
+    :param run: Function running the stage over all records
+    :param rows: Number of input records
+    :param repeat: Number of timed runs
+    :return: Dictionary with records_per_second, seconds and peak_memory_mb
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"records_per_second": rows / best, "seconds": best, "peak_memory_mb": peak / 2 ** 20}
+
+def benchmark_device(device: str, rows: int, repeat: int, directory: str) -> Dict[str, Dict[str, float]]:
+    """
+    Benchmark the stages of one device on a synthetic export.
+
+    Stages the DocumentFactory cannot run for the device are left out.
+
+    :param device: Device name
+    :param rows: Number of records to generate
+    :param repeat: Number of timed runs per stage
+    :param directory: Directory for the generated file
+    :return: Dictionary of stage name to its measurements
+    """
+    config: Dict[str, Any] = {**DEFAULT_CONFIG, 'DEVICE': device, 'USERNAME': "anonymous"}
+    file_path = os.path.join(directory, f"{device}.csv")
+    GENERATORS[device](file_path, rows)
+    factory = DocumentFactory(config)
+    device_id = config['devices'][device]
+
+    results = {"parse": measure(lambda: sum(1 for _ in iter_records(file_path)), rows, repeat)}
+    try:
+        factory.get_document_creator(device_id)
+    except ValueError:
+        return results
+
+    records = list(iter_records(file_path))
+    results["transform"] = measure(
+        lambda: [factory.create_samples(device_id=device_id, record_data=record) for record in records],
+        rows, repeat)
+    results["prepare"] = measure(
+        lambda: sum(1 for _ in iter_samples(records, factory, config, progress=False)), rows, repeat)
+    return results
+
+def load_baseline(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Load stored benchmark results.
+
+    :param path: Path of the baseline file
+    :return: Stored results, or None if there is no baseline
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def compare(current: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> List[str]:
+    """
+    Print the results next to the baseline and collect regressions.
+
+    :param current: Results of this run
+    :param baseline: Stored results, or None
+    :return: Descriptions of the stages whose throughput regressed beyond REGRESSION_THRESHOLD
+    """
+    regressions = []
+    print(f"{'device':<20} {'stage':<10} {'records/s':>12} {'peak MB':>9} {'vs baseline':>12}")
+    for device, stages in current['results'].items():
+        for stage, result in stages.items():
+            change = ""
+            base = (baseline or {}).get('results', {}).get(device, {}).get(stage)
+            if base:
+                ratio = result['records_per_second'] / base['records_per_second'] - 1
+                change = f"{ratio:+.1%}"
+                if ratio < -REGRESSION_THRESHOLD:
+                    regressions.append(f"{device} {stage}: {ratio:+.1%} records/s")
+            print(f"{device:<20} {stage:<10} {result['records_per_second']:>12,.0f} "
+                  f"{result['peak_memory_mb']:>9.2f} {change:>12}")
+    return regressions
+
+@click.command()
+@click.option("-n", "--rows", type=int, default=20000, help="Number of synthetic records per device.")
+@click.option("-d", "--device", "devices", multiple=True, type=click.Choice(list(GENERATORS)),
+              help="Device to benchmark, repeatable. Defaults to every device with a generator.")
+@click.option("--repeat", type=int, default=3, help="Timed runs per stage; the best one is kept.")
+@click.option("--baseline", "baseline_path", type=click.Path(), default=BASELINE_FILE,
+              help="Baseline results file.")
+@click.option("--save", is_flag=True, default=False, help="Store this run as the new baseline.")
+def main(rows: int, devices: List[str], repeat: int, baseline_path: str, save: bool):
+    """
+    Run the stage benchmarks and compare them with the baseline.
+
+    :param rows: Number of synthetic records per device
+    :param devices: Devices to benchmark
+    :param repeat: Timed runs per stage
+    :param baseline_path: Baseline results file
+    :param save: Whether to store this run as the new baseline
+    """
+    current = {
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "rows": rows,
+        "results": {}
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for device in devices or GENERATORS:
+            current['results'][device] = benchmark_device(device, rows, repeat, directory)
+
+    baseline = load_baseline(baseline_path)
+    if baseline and baseline.get('rows') != rows:
+        print(f"Baseline was run with {baseline.get('rows')} rows, this run used {rows}")
+    regressions = compare(current, baseline)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+
+    if save:
+        if baseline:
+            current['results'] = {**baseline.get('results', {}), **current['results']}
+        with open(baseline_path, 'w') as file:
+            json.dump(current, file, indent=2)
+        print(f"Saved baseline to {baseline_path}")
+
+if __name__ == "__main__":
+    main()
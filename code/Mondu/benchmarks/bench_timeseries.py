@@ -0,0 +1,94 @@
+"""
+Compare insert throughput and storage size of the bucket layout and a time-series collection.
+
+Needs a MongoDB server at MONGO_URI (5.0 or later). Run from code/Mondu with:
+python -m benchmarks.bench_timeseries [--rows N]
+
+Both layouts receive the same prepared samples of a synthetic Amazfit Bip
+export in a scratch database, which is dropped afterwards unless --keep is set.
+"""
+import os
+import tempfile
+import time
+from typing import Dict, Any, List
+
+import click
+
+from benchmarks.generators import write_amazfit_bip
+from src.columnar import iter_columnar_samples
+from src.config import load_config
+from src.db_utils import get_client, close_client, ensure_indexes
+from src.sample_processor import upload_prepared_samples
+from src.timeseries import setup_timeseries_collection
+
+def storage_stats(collection) -> Dict[str, Any]:
+    """
+    Storage statistics of a collection, including time-series collections.
+
+    :param collection: MongoDB collection object
+    :return: Dictionary with storageSize, totalIndexSize and size in bytes
+    """
+    stats = next(collection.aggregate([{"$collStats": {"storageStats": {}}}]))['storageStats']
+    return {"storageSize": stats.get('storageSize', 0), "totalIndexSize": stats.get('totalIndexSize', 0),
+            "size": stats.get('size', 0)}
+
+def run_backend(backend: str, samples: List[Dict[str, Any]], config: Dict[str, Any], db) -> Dict[str, Any]:
+    """
+    Upload the samples with one storage backend and measure it.
+
+    :param backend: 'buckets' or 'timeseries'
+    :param samples: Prepared samples for MongoDB insertion
+    :param config: Configuration dictionary
+    :param db: Scratch database object
+    :return: Dictionary with measurements/s and storage statistics
+    """
+    config = {**config, 'STORAGE_BACKENDS': {config['DEVICE']: backend}}
+    collection = db[config['COLLECTION_NAME']]
+    if backend == 'timeseries':
+        collection = setup_timeseries_collection(db, config)
+    ensure_indexes(collection, config)
+
+    start = time.perf_counter()
+    report = upload_prepared_samples(iter(samples), config, db[config['COLLECTION_NAME']])
+    elapsed = time.perf_counter() - start
+    measurements = sum(sample['collection_dict']['$inc']['n_samples'] for sample in samples)
+    return {"measurements_per_second": measurements / elapsed, "seconds": elapsed,
+            "errors": len(report.errors), **storage_stats(collection)}
+
+@click.command()
+@click.option("-n", "--rows", type=int, default=200000, help="Number of synthetic records.")
+@click.option("-db", "--database", default="mondu_bench", help="Scratch database, dropped after the run.")
+@click.option("--keep", is_flag=True, default=False, help="Keep the scratch database.")
+def main(rows: int, database: str, keep: bool):
+    """
+    Run the storage backend comparison.
+
+    :param rows: Number of synthetic records
+    :param database: Scratch database name
+    :param keep: Whether to keep the scratch database
+    """
+    config = {**load_config(), 'DEVICE': "amazfit_bip", 'USERNAME': "anonymous",
+              'COLLECTION_NAME': "measurements", 'TIMESERIES_COLLECTION': "measurements_ts",
+              'DEDUPLICATE': False}
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "amazfit_bip.csv")
+        write_amazfit_bip(file_path, rows)
+        samples = list(iter_columnar_samples(file_path, config))
+
+    client = get_client(config)
+    client.drop_database(database)
+    try:
+        db = client[database]
+        results = {backend: run_backend(backend, samples, config, db) for backend in ("buckets", "timeseries")}
+        print(f"{'backend':<12} {'measurements/s':>15} {'storage MB':>11} {'index MB':>9} {'data MB':>9}")
+        for backend, result in results.items():
+            print(f"{backend:<12} {result['measurements_per_second']:>15,.0f} "
+                  f"{result['storageSize'] / 2 ** 20:>11.2f} {result['totalIndexSize'] / 2 ** 20:>9.2f} "
+                  f"{result['size'] / 2 ** 20:>9.2f}")
+    finally:
+        if not keep:
+            client.drop_database(database)
+        close_client()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Synthetic input files shaped like the export of each supported device.
+
+Every writer produces a CSV with the columns the matching DocumentFactory
+creator reads, with deterministic values so runs are comparable.
+"""
+import csv
+from datetime import datetime, timedelta
+from typing import Callable, Dict
+
+SEPSIS_COLUMNS = [
+    "subject_id", "icustay_id", "hadm_id", "suspected_infection_time_poe", "suspected_infection_time_poe_days",
+    "specimen_poe", "positiveculture_poe", "antibiotic_time_poe", "blood_culture_time", "blood_culture_positive",
+    "ethnicity", "race_white", "race_black", "race_hispanic", "race_other", "metastatic_cancer", "diabetes",
+    "bmi", "first_service", "hospital_expire_flag", "thirtyday_expire_flag", "sepsis_angus", "sepsis_martin",
+    "sepsis_explicit", "septic_shock_explicit", "severe_sepsis_explicit", "sepsis_nqf", "sepsis_cdc",
+    "sepsis_cdc_simple", "elixhauser_hospital", "vent", "sofa", "lods", "sirs", "qsofa", "qsofa_sysbp_score",
+    "qsofa_gcs_score", "qsofa_resprate_score", "blood culture", "suspicion_poe", "abx_poe", "sepsis-3",
+    "sofa>=2", "excluded", "intime", "outtime", "dbsource", "age", "gender", "is_male", "height", "weight",
+    "icu_los", "hosp_los"
+]
+
+START = datetime(2019, 5, 1)
+
+def write_amazfit_bip(file_path: str, rows: int):
+    """
+    Write a synthetic minute-resolution Gadgetbridge MI_BAND_ACTIVITY_SAMPLE export.
+
+    :param file_path: Path of the CSV file to write
+    :param rows: Number of rows to write
+    """
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["TIMESTAMP", "DEVICE_ID", "USER_ID", "RAW_INTENSITY", "STEPS", "RAW_KIND", "HEART_RATE"])
+        for row in range(rows):
+            writer.writerow([1556668800 + 60 * row, 1, 1, row % 120, row % 30, 1, 255 if row % 10 == 0 else 60 + row % 40])
+
+def write_flow(file_path: str, rows: int):
+    """
+    Write a synthetic minute-resolution Plume Flow export.
+
+    :param file_path: Path of the CSV file to write
+    :param rows: Number of rows to write
+    """
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["date", "NO2", "VOC", "PM 10", "PM25", "AQI NO2", "AQI VOC", "AQI PM 10", "AQI PM 25"])
+        for row in range(rows):
+            writer.writerow([(START + timedelta(minutes=row)).strftime('%Y-%m-%d %H:%M:%S'),
+                             row % 40, row % 300, row % 25, row % 15, row % 20, row % 30, row % 10, row % 12])
+
+def write_move_ecg(file_path: str, rows: int):
+    """
+    Write a synthetic Withings Move ECG export, one 30 second recording per row.
+
+    :param file_path: Path of the CSV file to write
+    :param rows: Number of rows to write
+    """
+    signal = ",".join(str((sample * 37) % 400 - 200) for sample in range(300))
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["date", "type", "frequency", "duration", "wearposition", "signal",
+                         "format", "size", "totalsize"])
+        for row in range(rows):
+            writer.writerow([(START + timedelta(minutes=30 * row)).isoformat() + "+00:00", "ECG", 300, 30,
+                             "left wrist", f"[{signal}]", "raw", 300, 9000])
+
+def write_mimic_chartevents(file_path: str, rows: int):
+    """
+    Write a synthetic MIMIC-III CHARTEVENTS extract joined with D_ITEMS labels.
+
+    :param file_path: Path of the CSV file to write
+    :param rows: Number of rows to write
+    """
+    items = [("Heart Rate", "bpm"), ("Respiratory Rate", "insp/min"), ("O2 saturation pulseoxymetry", "%"),
+             ("Temperature Celsius", "?C"), ("Arterial Blood Pressure mean", "mmHg")]
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["subject_id", "hadm_id", "icustay_id", "itemid", "charttime", "label", "value",
+                         "valuenum", "valueuom"])
+        for row in range(rows):
+            label, unit = items[row % len(items)]
+            value = 60 + row % 50
+            writer.writerow([10000 + row // 5000, 100000 + row // 5000, 200000 + row // 5000, 220045 + row % 5,
+                             (START + timedelta(minutes=row // len(items))).isoformat(sep=' '),
+                             label, value, value, unit])
+
+def write_mimic_prescriptions(file_path: str, rows: int):
+    """
+    Write a synthetic MIMIC-III PRESCRIPTIONS extract, grouped by subject.
+
+    :param file_path: Path of the CSV file to write
+    :param rows: Number of rows to write
+    """
+    drugs = [("Heparin", "5000", "UNIT"), ("Insulin", "10", "UNIT"), ("Furosemide", "40", "mg"),
+             ("Acetaminophen", "650", "mg"), ("Vancomycin", "1000", "mg")]
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["subject_id", "hadm_id", "startdate", "enddate", "drug", "dose_val_rx", "dose_unit_rx"])
+        for row in range(rows):
+            drug, dose, unit = drugs[row % len(drugs)]
+            start = START + timedelta(days=(row // len(drugs)) % 30)
+            writer.writerow([10000 + row // 200, 100000 + row // 200, start.isoformat(sep=' '),
+                             (start + timedelta(days=1 + row % 3)).isoformat(sep=' '), drug, dose, unit])
+
+def write_mimic_sepsis(file_path: str, rows: int):
+    """
+    Write a synthetic sepsis-3 cohort extract, one ICU stay per row.
+
+    :param file_path: Path of the CSV file to write
+    :param rows: Number of rows to write
+    """
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(SEPSIS_COLUMNS)
+        for row in range(rows):
+            intime = START + timedelta(hours=row)
+            values = {column: row % 2 for column in SEPSIS_COLUMNS}
+            values.update({
+                "subject_id": 10000 + row, "icustay_id": 200000 + row, "hadm_id": 100000 + row,
+                "suspected_infection_time_poe": intime.isoformat(sep=' '), "suspected_infection_time_poe_days": 0.5,
+                "specimen_poe": "BLOOD CULTURE", "antibiotic_time_poe": intime.isoformat(sep=' '),
+                "blood_culture_time": intime.isoformat(sep=' '), "ethnicity": "WHITE", "bmi": 20 + row % 15,
+                "first_service": "MICU", "elixhauser_hospital": row % 20, "sofa": row % 12, "lods": row % 8,
+                "sirs": row % 4, "qsofa": row % 3, "intime": intime.isoformat(sep=' '),
+                "outtime": (intime + timedelta(days=2)).isoformat(sep=' '), "dbsource": "metavision",
+                "age": 40 + row % 50, "gender": "M" if row % 2 else "F", "height": 170, "weight": 70 + row % 30,
+                "icu_los": 2.0, "hosp_los": 5.0
+            })
+            writer.writerow([values[column] for column in SEPSIS_COLUMNS])
+
+# Synthetic writer per device name in DEFAULT_CONFIG['devices']
+GENERATORS: Dict[str, Callable[[str, int], None]] = {
+    "amazfit_bip": write_amazfit_bip,
+    "flow": write_flow,
+    "move_ecg": write_move_ecg,
+    "mimic_chartevents": write_mimic_chartevents,
+    "mimic_prescriptions": write_mimic_prescriptions,
+    "mimic_sepsis": write_mimic_sepsis
+}
@@ -0,0 +1,112 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Iterable, Iterator, Optional, Tuple
+
+import pymongo as pm
+
+from src.dedup import Deduplicator
+from src.document_factory import DocumentFactory
+from src.sample_processor import UploadReport, batched, stream_samples, upload_prepared_samples
+
+class Checkpoint:
+    """
+    Committed input offset of one (file, user, device) ingest, kept in a state collection.
+
+    A file is identified by its absolute path and size, so an export that grew since
+    the last run starts from scratch instead of resuming at a stale offset.
+    """
+
+    def __init__(self, collection: pm.collection.Collection, file_path: str, config: Dict[str, Any]):
+        """
+        Initialize the Checkpoint and load its committed offset.
+
+        :param collection: MongoDB collection holding the checkpoints
+        :param file_path: Path of the file being ingested
+        :param config: Configuration dictionary
+        """
+        self.collection = collection
+        file_path = os.path.abspath(file_path)
+        self.state = {
+            "file_path": file_path,
+            "file_size": os.path.getsize(file_path),
+            "user_id": config['users'][config['USERNAME'].lower()],
+            "device_id": config['devices'][config['DEVICE'].lower()]
+        }
+        self.id = hashlib.sha256(repr(sorted(self.state.items())).encode()).hexdigest()
+        stored = collection.find_one({"_id": self.id}) or {}
+        self.committed = stored.get('committed', 0)
+        self.completed = stored.get('completed', False)
+
+    def reset(self):
+        """
+        Start the ingest of the file from its first record.
+        """
+        self._save(committed=0, completed=False)
+
+    def commit(self, offset: int):
+        """
+        Record that every input record before offset has been written.
+
+        :param offset: Number of input records fully uploaded
+        """
+        self._save(committed=offset, completed=False)
+
+    def complete(self):
+        """
+        Record that the whole file has been uploaded.
+        """
+        self._save(committed=self.committed, completed=True)
+
+    def _save(self, committed: int, completed: bool):
+        self.committed = committed
+        self.completed = completed
+        self.collection.update_one(
+            {"_id": self.id},
+            {"$set": {**self.state, "committed": committed, "completed": completed,
+                      "updated": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+def record_batches(data: Iterable[Dict[str, Any]], document_factory: DocumentFactory, config: Dict[str, Any],
+                   executor: Optional[ProcessPoolExecutor] = None) -> Iterator[Tuple[int, Iterator[Dict[str, Any]]]]:
+    """
+    Prepare input records in checkpoint batches.
+
+    :param data: Iterable of dictionaries containing the input data after the committed records,
+                 as read by iter_records with skip=checkpoint.committed
+    :param document_factory: DocumentFactory object
+    :param config: Configuration dictionary
+    :param executor: Transformation pool from transform_pool, shared by every batch
+    :yield: Tuples of (number of input records, prepared samples of those records)
+    """
+    for batch in batched(data, config['CHECKPOINT_RECORDS']):
+        yield len(batch), stream_samples(batch, document_factory, config, executor)
+
+def upload_checkpointed(batches: Iterable[Tuple[int, Iterable[Dict[str, Any]]]], config: Dict[str, Any],
+                        collection, checkpoint: Checkpoint,
+                        deduplicator: Optional[Deduplicator] = None) -> UploadReport:
+    """
+    Upload batches of prepared samples, committing the input offset after each one.
+
+    The upload stops at the first batch with errors so that a resumed run starts
+    again from that batch; everything committed before it is skipped.
+
+    :param batches: Tuples of (number of input records, prepared samples for those records)
+    :param config: Configuration dictionary
+    :param collection: MongoDB collection object
+    :param checkpoint: Checkpoint of the file being ingested
+    :param deduplicator: Deduplicator shared by every batch, if config['DEDUPLICATE'] is set
+    :return: UploadReport of the run
+    """
+    report = UploadReport()
+    for n_records, samples in batches:
+        batch_report = upload_prepared_samples(samples, config, collection, deduplicator)
+        report.merge(batch_report)
+        if batch_report.errors:
+            print(f"Stopping at input record {checkpoint.committed}: batch had {len(batch_report.errors)} errors")
+            return report
+        checkpoint.commit(checkpoint.committed + n_records)
+    checkpoint.complete()
+    return report
@@ -0,0 +1,237 @@
+import csv
+import time
+import warnings
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Any, List, Iterator, Optional, Tuple
+
+import numpy as np
+
+from src.device_schemas import DEVICE_SCHEMAS, device_schema, timestamp_parser
+from src.metrics import get_metrics
+from src.signal_codec import encode_signal_value
+from src.models import MeasurementBlock
+
+# Devices whose uniform, timestamped CSV exports are read column-wise
+COLUMNAR_DEVICES = {name: schema for name, schema in DEVICE_SCHEMAS.items() if schema.columnar}
+
+# Values dropped before upload, per metric type
+INVALID_VALUES = {
+    "HEART_RATE": 255
+}
+
+def read_columns(file_path: str, columns: List[str], chunk_rows: int,
+                 skip_rows: int = 0) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Read selected CSV columns into arrays of strings, chunk_rows rows at a time.
+
+    :param file_path: Path to the CSV file
+    :param columns: Names of the columns to read
+    :param chunk_rows: Maximum number of rows per chunk
+    :param skip_rows: Number of data rows to skip after the header
+    :yield: Dictionary of column name to array of raw values
+    :raises ValueError: If a requested column is missing from the header
+    """
+    with open(file_path, 'r', newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise ValueError(f"Missing columns in {file_path}: {', '.join(missing)}")
+        positions = [header.index(column) for column in columns]
+        for _ in islice(reader, skip_rows):
+            pass
+        while True:
+            rows = list(islice(reader, chunk_rows))
+            if not rows:
+                return
+            transposed = list(zip(*rows))
+            yield {column: np.array(transposed[position]) for column, position in zip(columns, positions)}
+
+def to_datetime64(column: np.ndarray, timestamp_format: Optional[str]) -> np.ndarray:
+    """
+    Convert a column of raw timestamps to datetime64[ms].
+
+    Timestamps with a UTC offset are converted to UTC, as timestamp_parser does
+    on the per-record path.
+
+    :param column: Array of timestamp strings
+    :param timestamp_format: 'epoch', a strptime format, or None for ISO 8601
+    :return: Array of datetime64[ms] values
+    """
+    if timestamp_format == "epoch":
+        seconds = column.astype(np.int64)
+        return (seconds + _local_offsets(seconds)).astype('datetime64[s]').astype('datetime64[ms]')
+    if timestamp_format in (None, "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            # NumPy only warns when it drops a UTC offset; such columns are parsed below
+            with warnings.catch_warnings():
+                warnings.simplefilter("error")
+                return column.astype('datetime64[ms]')
+        except (ValueError, UserWarning, DeprecationWarning):
+            pass
+    # Fall back to parsing each distinct string once
+    uniques, inverse = np.unique(column, return_inverse=True)
+    parse = timestamp_parser(timestamp_format)
+    return np.array([parse(value) for value in uniques.tolist()], dtype='datetime64[ms]')[inverse]
+
+def _local_offsets(seconds: np.ndarray) -> np.ndarray:
+    """
+    Local UTC offsets in seconds, so epoch conversion matches datetime.fromtimestamp.
+
+    The offset is looked up once per distinct hour, which covers DST transitions.
+
+    :param seconds: Array of Unix timestamps
+    :return: Array of offsets in seconds
+    """
+    hours, inverse = np.unique(seconds // 3600, return_inverse=True)
+    offsets = np.array([time.localtime(hour * 3600).tm_gmtoff for hour in hours.tolist()], dtype=np.int64)
+    return offsets[inverse]
+
+def to_float64(column: np.ndarray) -> np.ndarray:
+    """
+    Convert a column of raw values to float64, mapping empty strings to NaN.
+
+    :param column: Array of value strings
+    :return: Array of float64 values
+    """
+    return np.where(column == '', 'nan', column).astype(np.float64)
+
+def group_indices(keys: List[np.ndarray]) -> Iterator[np.ndarray]:
+    """
+    Group row positions by the combination of several key columns.
+
+    Rows keep their original order inside each group.
+
+    :param keys: Equal-length key arrays
+    :yield: Array of row positions for each distinct key combination
+    """
+    codes = np.zeros(len(keys[0]), dtype=np.int64)
+    for key in keys:
+        uniques, inverse = np.unique(key, return_inverse=True)
+        codes = codes * len(uniques) + inverse
+    _, inverse, counts = np.unique(codes, return_inverse=True, return_counts=True)
+    order = np.argsort(inverse, kind='stable')
+    yield from np.split(order, np.cumsum(counts)[:-1])
+
+def iter_columnar_samples(file_path: str, config: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Read a wearable CSV export column-wise and yield one bucket update per day and metric.
+
+    :param file_path: Path to the CSV file
+    :param config: Configuration dictionary
+    :yield: Prepared samples for MongoDB insertion
+    :raises ValueError: If the device schema is not columnar
+    """
+    for _, samples in iter_columnar_batches(file_path, config):
+        yield from samples
+
+def iter_columnar_batches(file_path: str, config: Dict[str, Any],
+                          skip_rows: int = 0) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    Read a wearable CSV export column-wise, one chunk of rows at a time.
+
+    Each chunk of config['COLUMNAR_CHUNK_ROWS'] rows is converted to typed arrays,
+    split per metric column and grouped by day (and context), and every group is
+    emitted in slices of at most MAX_SAMPLES measurements using $push/$each, as
+    aggregate_buckets does for the per-record path.
+
+    :param file_path: Path to the CSV file
+    :param config: Configuration dictionary
+    :param skip_rows: Number of data rows already ingested
+    :yield: Tuples of (number of rows, prepared samples of those rows)
+    :raises ValueError: If the device schema is not columnar
+    """
+    device = config['DEVICE'].lower()
+    spec = device_schema(device, config)
+    if spec is None or not spec.columnar:
+        raise ValueError(f"No columnar ingestion for device: {device}")
+    max_samples = config['MAX_SAMPLES']
+    columns = [spec.timestamp_field] + list(spec.metrics.values()) + list(spec.context.values())
+    base_filter = {
+        "user_id": config['users'][config['USERNAME'].lower()],
+        "period": spec.period,
+        "device_id": config['devices'][device]
+    }
+
+    metrics = get_metrics()
+    chunks = metrics.timed(read_columns(file_path, columns, config['COLUMNAR_CHUNK_ROWS'], skip_rows),
+                           "parse", "columnar_chunks")
+    for chunk in chunks:
+        transform_start = time.perf_counter()
+        samples = []
+        timestamps = to_datetime64(chunk[spec.timestamp_field], spec.timestamp_format)
+        days = timestamps.astype('datetime64[D]')
+        context_columns = [chunk[column] for column in spec.context.values()]
+
+        for metric, column in spec.metrics.items():
+            values = to_float64(chunk[column]) if spec.numeric else chunk[column]
+            if spec.signal and config.get('ENCODE_SIGNALS'):
+                values = encode_signals(values)
+            valid = ~np.isnan(values) if spec.numeric else np.ones(len(values), dtype=bool)
+            if metric in INVALID_VALUES:
+                valid &= values != INVALID_VALUES[metric]
+            metric_rows = np.flatnonzero(valid)
+            if not len(metric_rows):
+                continue
+
+            for group in group_indices([days[metric_rows]] + [c[metric_rows] for c in context_columns]):
+                rows = metric_rows[group]
+                context = {name: c[rows[0]].item() for name, c in zip(spec.context, context_columns)}
+                day = days[rows[0]].astype('datetime64[ms]').item()
+                for start in range(0, len(rows), max_samples):
+                    samples.append(_bucket_update(base_filter, metric, day, context,
+                                                  timestamps[rows[start:start + max_samples]],
+                                                  values[rows[start:start + max_samples]], max_samples))
+        metrics.count("stage_seconds", time.perf_counter() - transform_start, stage="transform")
+        metrics.count("records", len(timestamps))
+        yield len(timestamps), samples
+
+def encode_signals(column: np.ndarray) -> np.ndarray:
+    """
+    Encode a column of signal strings with signal_codec.
+
+    :param column: Array of signal strings
+    :return: Object array of encoded signals (strings that do not parse are kept)
+    """
+    encoded = np.empty(len(column), dtype=object)
+    for index, value in enumerate(column.tolist()):
+        encoded[index] = encode_signal_value(value)
+    return encoded
+
+def _bucket_update(base_filter: Dict[str, Any], metric: str, day: datetime, context: Dict[str, Any],
+                   timestamps: np.ndarray, values: np.ndarray, max_samples: int) -> Dict[str, Any]:
+    """
+    Build the upsert for one slice of a bucket from its timestamp and value arrays.
+
+    :param base_filter: User, period and device fields of the bucket filter
+    :param metric: Metric type of the bucket
+    :param day: Day of the bucket
+    :param context: Context fields of the bucket
+    :param timestamps: datetime64[ms] array of the slice
+    :param values: Value array of the slice
+    :param max_samples: Maximum number of samples per MongoDB document
+    :return: Prepared sample for MongoDB insertion
+    """
+    sample_dict = {
+        **base_filter,
+        "n_samples": {"$lte": max_samples - len(values)},
+        "type": metric,
+        "day": day,
+        **context
+    }
+    if values.dtype.kind == 'f':
+        return {"sample_dict": sample_dict, "collection_dict": MeasurementBlock(timestamps, values).to_bucket_update()}
+
+    # Non-numeric payloads (such as raw ECG signal strings) cannot live in a MeasurementBlock
+    timestamps = timestamps.tolist()
+    return {
+        "sample_dict": sample_dict,
+        "collection_dict": {
+            "$push": {'measurements': {"$each": [{'timestamp': timestamp, 'value': value}
+                                                 for timestamp, value in zip(timestamps, values.tolist())]}},
+            "$min": {"first": min(timestamps)},
+            "$max": {"last": max(timestamps)},
+            "$inc": {"n_samples": len(timestamps)}
+        }
+    }
@@ -17,10 +17,56 @@ FILE_NAME = "/diagnoses.csv"
 DEFAULT_CONFIG = {
     'DEBUG_MODE': True,
     'MAX_SAMPLES': 1500,
+    'UPLOAD_MODE': 'bulk',
+    'BATCH_SIZE': 1000,
+    'ASYNC_IN_FLIGHT': 4,
+    'ASYNC_QUEUE_SIZE': 8,
+    'AGGREGATE_BUCKETS': True,
+    'AGGREGATE_WINDOW': 100000,
+    'WORKERS': 1,
+    'FILE_WORKERS': 1,
+    'PARALLEL_CHUNK_SIZE': 5000,
+    'COLUMNAR': False,
+    'COLUMNAR_CHUNK_ROWS': 200000,
+    'CHECKPOINT_RECORDS': 50000,
+    'CHECKPOINT_COLLECTION': 'ingest_checkpoints',
+    'DEDUPLICATE': True,
+    'METRICS_FILE': None,
+    'STORAGE_BACKENDS': {},
+    'TIMESERIES_COLLECTION': 'measurements_ts',
+    'TIMESERIES_GRANULARITY': 'minutes',
+    'MIGRATION_STATE_COLLECTION': 'timeseries_migrations',
+    'AUTO_INDEX': True,
+    'DEVICE_SCHEMAS': {},
+    'ENCODE_SIGNALS': False,
+    'READ_BATCH_SIZE': 100,
+    'ROLLUPS': False,
+    'ROLLUP_DEVICES': ["move_ecg", "amazfit_bip", "flow"],
+    'ROLLUP_RESOLUTIONS': ["minute", "hour", "day"],
+    'ROLLUP_PREFIX': 'rollup_',
+    'ROLLUP_FLUSH_WINDOWS': 100000,
     'SAMPLE_PERIOD': '',
     'ONTO_PATH': '/path/to/ontologies',
+    'ONTO_CACHE_DIR': '~/.cache/mondu/ontology',
+    'INTERACTIVE_MAPPING': True,
+    'MAPPING_RULES': None,
+    'MAPPING_MIN_SCORE': 1.5,
+    'MAPPING_REPORT': 'unmapped_fields.json',
+    'OLS_URL': 'https://www.ebi.ac.uk/ols/api/search',
+    'OLS_TIMEOUT': 10,
+    'OLS_WORKERS': 8,
+    'OLS_CACHE_FILE': '~/.cache/mondu/ols.sqlite3',
+    'OLS_CACHE_TTL': 30 * 24 * 3600,
+    'OLS_CACHE_MAX_BYTES': 64 * 1024 * 1024,
     'COPH_IRI': COPH_IRI,
     'DATABASE': DATABASE,
+    'MONGO_URI': 'mongodb://localhost:27017',
+    'MONGO_POOL_SIZE': 50,
+    'MONGO_WRITE_CONCERN': 1,
+    'MONGO_COMPRESSORS': None,
+    'MONGO_CONNECT_TIMEOUT_MS': 10000,
+    'MONGO_SOCKET_TIMEOUT_MS': 120000,
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': 30000,
     'devices': {
         "move_ecg": "0",
         "flow": "1",
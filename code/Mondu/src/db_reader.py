@@ -0,0 +1,125 @@
+from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+import pymongo as pm
+
+from src.dedup import timestamp_key
+from src.models import MeasurementBlock
+from src.signal_codec import decode_signal, is_encoded_signal, parse_signal
+
+def measurement_arrays(measurements: Iterable[Dict[str, Any]], frequency: Any = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Epoch milliseconds and float values of the numeric content of measurements.
+
+    Numeric values give one point each. Signals, as strings or encoded with
+    config['ENCODE_SIGNALS'], give one point per sample, spaced by 1/frequency
+    seconds from the measurement timestamp (all at the timestamp when the
+    frequency is unknown). Other values are skipped.
+
+    :param measurements: Measurement dictionaries with timestamp and value
+    :param frequency: Sampling frequency of signal values in Hz, such as move_ecg's context field
+    :return: Tuple of (int64 timestamps, float64 values)
+    """
+    try:
+        step = 1000.0 / float(frequency)
+    except (TypeError, ValueError, ZeroDivisionError):
+        step = 0.0
+    # Numeric points are gathered in lists and converted once per run between signals
+    timestamps, values = [], []
+    run_timestamps, run_values = [], []
+    for measurement in measurements:
+        if not isinstance(measurement, dict) or measurement.get('timestamp') is None:
+            continue
+        value = measurement.get('value')
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            run_timestamps.append(timestamp_key(measurement['timestamp']))
+            run_values.append(value)
+        elif (isinstance(value, str) and value.startswith("[")) or is_encoded_signal(value):
+            signal = decode_signal(value) if is_encoded_signal(value) else parse_signal(value)
+            if signal is not None:
+                if run_values:
+                    timestamps.append(np.array(run_timestamps, dtype=np.int64))
+                    values.append(np.array(run_values, dtype=np.float64))
+                    run_timestamps, run_values = [], []
+                offsets = (np.arange(len(signal)) * step).astype(np.int64)
+                timestamps.append(timestamp_key(measurement['timestamp']) + offsets)
+                values.append(signal)
+    if run_values:
+        timestamps.append(np.array(run_timestamps, dtype=np.int64))
+        values.append(np.array(run_values, dtype=np.float64))
+    if not values:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    timestamps, values = np.concatenate(timestamps), np.concatenate(values)
+    keep = ~np.isnan(values)
+    return timestamps[keep], values[keep]
+
+def series_query(user_id: str, device_id: str, measurement_type: str, start: datetime, end: datetime,
+                 context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Filter selecting the buckets of a series that overlap a time range.
+
+    :param user_id: Stored user identifier (see config['users'])
+    :param device_id: Stored device identifier (see config['devices'])
+    :param measurement_type: Metric type, such as HEART_RATE
+    :param start: Start of the range
+    :param end: End of the range (exclusive)
+    :param context: Optional further bucket fields, such as period or a context field
+    :return: Query filter
+    """
+    return {"user_id": user_id, "device_id": device_id, "type": measurement_type,
+            "first": {"$lt": end}, "last": {"$gte": start}, **(context or {})}
+
+def iter_series(collection: pm.collection.Collection, user_id: str, device_id: str, measurement_type: str,
+                start: datetime, end: datetime, config: Dict[str, Any],
+                context: Optional[Dict[str, Any]] = None) -> Iterator[MeasurementBlock]:
+    """
+    Stream the measurements of a series within a time range, one block per bucket.
+
+    Only buckets whose first/last range overlaps the time range are read, with
+    only the measurement timestamps and values (and the signal frequency)
+    projected, config['READ_BATCH_SIZE'] buckets per cursor batch.
+
+    :param collection: Collection of bucket documents
+    :param user_id: Stored user identifier
+    :param device_id: Stored device identifier
+    :param measurement_type: Metric type
+    :param start: Start of the range
+    :param end: End of the range (exclusive)
+    :param config: Configuration dictionary
+    :param context: Optional further bucket fields
+    :yield: MeasurementBlock of the range's points in each bucket, in stored order
+    """
+    start_key, end_key = timestamp_key(start), timestamp_key(end)
+    cursor = collection.find(series_query(user_id, device_id, measurement_type, start, end, context),
+                             {"_id": 0, "measurements.timestamp": 1, "measurements.value": 1, "frequency": 1},
+                             batch_size=config['READ_BATCH_SIZE'])
+    for bucket in cursor:
+        timestamps, values = measurement_arrays(bucket.get('measurements', []), bucket.get('frequency'))
+        inside = (timestamps >= start_key) & (timestamps < end_key)
+        if inside.any():
+            yield MeasurementBlock(timestamps[inside], values[inside])
+
+def read_series(collection: pm.collection.Collection, user_id: str, device_id: str, measurement_type: str,
+                start: datetime, end: datetime, config: Dict[str, Any],
+                context: Optional[Dict[str, Any]] = None) -> MeasurementBlock:
+    """
+    Read the measurements of a series within a time range into contiguous arrays.
+
+    :param collection: Collection of bucket documents
+    :param user_id: Stored user identifier
+    :param device_id: Stored device identifier
+    :param measurement_type: Metric type
+    :param start: Start of the range
+    :param end: End of the range (exclusive)
+    :param config: Configuration dictionary
+    :param context: Optional further bucket fields
+    :return: MeasurementBlock ordered by timestamp, with int64 epoch millisecond timestamps and float64 values
+    """
+    blocks = list(iter_series(collection, user_id, device_id, measurement_type, start, end, config, context))
+    if not blocks:
+        return MeasurementBlock(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+    timestamps = np.concatenate([block.timestamps for block in blocks])
+    values = np.concatenate([block.values for block in blocks])
+    order = np.argsort(timestamps, kind='stable')
+    return MeasurementBlock(timestamps[order], values[order])
@@ -1,5 +1,68 @@
 import pymongo as pm
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Tuple
+
+# Index serving the bucket upsert filter: user_id, device_id, type, period, day and n_samples
+BUCKET_INDEX_FIELDS = ["user_id", "device_id", "type", "period", "day", "n_samples"]
+
+# Index serving time-range reads of a series by its buckets' last and first timestamps
+RANGE_INDEX_FIELDS = ["user_id", "device_id", "type", "last", "first"]
+
+# Devices whose documents are not daily buckets, with the index of their filter
+INDEX_FIELDS = {
+    "mimic_sepsis": ["user_id", "device_id", "type"],
+    "mimic_admission": ["user_id", "device_id", "type"]
+}
+
+# Process-wide client shared by every database helper, see get_client
+_client: Optional[pm.MongoClient] = None
+_client_options: Optional[Dict[str, Any]] = None
+
+def client_options(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    MongoClient keyword arguments for the connection settings in the configuration.
+
+    :param config: Configuration dictionary
+    :return: Dictionary of MongoClient options
+    """
+    options = {
+        "host": config['MONGO_URI'],
+        "maxPoolSize": config['MONGO_POOL_SIZE'],
+        "w": config['MONGO_WRITE_CONCERN'],
+        "connectTimeoutMS": config['MONGO_CONNECT_TIMEOUT_MS'],
+        "socketTimeoutMS": config['MONGO_SOCKET_TIMEOUT_MS'],
+        "serverSelectionTimeoutMS": config['MONGO_SERVER_SELECTION_TIMEOUT_MS']
+    }
+    if config.get('MONGO_COMPRESSORS'):
+        options["compressors"] = config['MONGO_COMPRESSORS']
+    return options
+
+def get_client(config: Dict[str, Any]) -> pm.MongoClient:
+    """
+    Get the shared MongoClient, creating it on first use.
+
+    The client is only replaced when the connection settings change, so every
+    caller reuses the same connection pool and server discovery.
+
+    :param config: Configuration dictionary
+    :return: Shared MongoClient
+    """
+    global _client, _client_options
+    options = client_options(config)
+    if _client is None or options != _client_options:
+        close_client()
+        _client = pm.MongoClient(**options)
+        _client_options = options
+    return _client
+
+def close_client():
+    """
+    Close the shared MongoClient, if one was created.
+    """
+    global _client, _client_options
+    if _client is not None:
+        _client.close()
+    _client = None
+    _client_options = None
 
 def setup_database(config: Dict[str, Any]) -> Tuple[pm.database.Database, pm.collection.Collection]:
     """
@@ -8,7 +71,7 @@ def setup_database(config: Dict[str, Any]) -> Tuple[pm.database.Database, pm.col
     :param config: Configuration dictionary
     :return: Tuple of (Database object, Collection object)
     """
-    client = pm.MongoClient()
+    client = get_client(config)
     db = client[config['DATABASE']]
     collection = db[config['COLLECTION_NAME']]
     return db, collection
@@ -22,8 +85,7 @@ def upload_mappings(mappings: Dict[str, Any], config: Dict[str, Any]):
     """
     try:
         # Connect to the database
-        client = pm.MongoClient()
-        db = client[config['DATABASE']]
+        db = get_client(config)[config['DATABASE']]
         mappings_collection = db['mappings']
 
         # The document name is the device name
@@ -54,8 +116,6 @@ def upload_mappings(mappings: Dict[str, Any], config: Dict[str, Any]):
 
     except Exception as e:
         print(f"Error uploading mappings: {str(e)}")
-    finally:
-        client.close()
 
 def get_existing_prescriptions(collection: pm.collection.Collection, config: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
@@ -74,11 +134,78 @@ def get_existing_prescriptions(collection: pm.collection.Collection, config: Dic
         {"measurements": 1}
     ))
 
-def create_index(collection: pm.collection.Collection, fields: List[str]):
+def create_index(collection: pm.collection.Collection, fields: List[str]) -> str:
     """
     Create an index on the specified fields in the collection.
 
     :param collection: MongoDB collection object
     :param fields: List of field names to index
+    :return: Name of the index
+    """
+    return collection.create_index([(field, pm.ASCENDING) for field in fields])
+
+def index_fields(config: Dict[str, Any]) -> List[List[str]]:
+    """
+    Compound indexes serving the writes and lookups of the configured device and storage layout.
+
+    Equality fields of the filters come first and the n_samples range last, so
+    the bucket upsert and the deduplication lookups (by series, or series and
+    day) use an index prefix. Time-range reads (see db_reader) select buckets
+    by last and first, which get their own index.
+
+    :param config: Configuration dictionary
+    :return: List of indexes, each a list of field names
+    """
+    if config['STORAGE_BACKENDS'].get(config['DEVICE'].lower(), 'buckets') == 'timeseries':
+        return [["meta.user_id", "meta.device_id", "meta.type", "timestamp"]]
+    if config['DEVICE'].lower() in INDEX_FIELDS:
+        return [INDEX_FIELDS[config['DEVICE'].lower()]]
+    return [BUCKET_INDEX_FIELDS, RANGE_INDEX_FIELDS]
+
+def ensure_indexes(collection: pm.collection.Collection, config: Dict[str, Any]) -> List[str]:
+    """
+    Create the indexes the ingest of the configured device relies on, if missing.
+
+    Creating an index that already exists is a no-op on the server, so this is
+    safe to call before every upload.
+
+    :param collection: Collection the device is written to
+    :param config: Configuration dictionary
+    :return: Names of the ensured indexes
+    """
+    return [create_index(collection, fields) for fields in index_fields(config)]
+
+def explain_plan(collection: pm.collection.Collection, query: Dict[str, Any],
+                 update: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Explain the winning plan of a query, or of an upsert when an update is given.
+
+    :param collection: MongoDB collection object
+    :param query: Query filter
+    :param update: Optional update document, explained as an upsert
+    :return: queryPlanner section of the explain output
+    """
+    if update is None:
+        command = {"find": collection.name, "filter": query}
+    else:
+        command = {"update": collection.name, "updates": [{"q": query, "u": update, "upsert": True}]}
+    return collection.database.command({"explain": command, "verbosity": "queryPlanner"})['queryPlanner']
+
+def plan_stages(plan: Any) -> List[str]:
+    """
+    Every stage in an explained plan, outermost first.
+
+    :param plan: Plan document, or any part of it
+    :return: List of stage names such as FETCH or COLLSCAN, index scans followed by the index name
     """
-    collection.create_index(fields)
\ No newline at end of file
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(f"{plan['stage']} {plan['indexName']}" if 'indexName' in plan else plan['stage'])
+        for key, value in plan.items():
+            if key != 'rejectedPlans':
+                stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
@@ -0,0 +1,189 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
+
+from src.metrics import get_metrics
+from src.summaries import add_summary
+
+EPOCH = datetime(1970, 1, 1)
+MILLISECOND = timedelta(milliseconds=1)
+# Range covering every timestamp of a day, for days whose stored buckets changed since their ranges were read
+WHOLE_DAY = (float('-inf'), float('inf'))
+
+def timestamp_key(timestamp: datetime) -> int:
+    """
+    Milliseconds since the epoch, the precision MongoDB stores dates with.
+
+    Aware datetimes (ISO timestamps with an offset) are stored in UTC and read
+    back naive, so they are converted to naive UTC first.
+
+    :param timestamp: Naive or aware datetime
+    :return: Integer milliseconds
+    """
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return (timestamp - EPOCH) // MILLISECOND
+
+class Deduplicator:
+    """
+    Drops measurements that are already stored before they are uploaded.
+
+    Cumulative exports repeat every row of the previous export. For each series
+    (the bucket filter without its day) the first/last range of every stored
+    bucket is loaded once; a day whose incoming timestamps all fall outside those
+    ranges is passed through untouched. Only when a timestamp lands inside a stored
+    range are the stored timestamps of that day loaded into an exact set.
+
+    One Deduplicator filters every batch of an ingest, so the ranges of a series
+    are read once. The days a batch writes to are checked against their stored
+    timestamps in the following batches, which therefore also drop the
+    measurements written by the batches before them.
+    """
+
+    def __init__(self, collection, config: Dict[str, Any]):
+        """
+        Initialize the Deduplicator.
+
+        :param collection: MongoDB collection the samples are uploaded to
+        :param config: Configuration dictionary
+        """
+        self.collection = collection
+        self.max_samples = config['MAX_SAMPLES']
+        self.ranges: Dict[Tuple, Dict[datetime, List[Tuple[int, int]]]] = {}
+        self.stored: Dict[Tuple, Set[int]] = {}
+        self.written: Set[Tuple] = set()
+        self.dropped = 0
+
+    def filter(self, samples: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Remove already stored measurements from a stream of prepared samples.
+
+        Samples that do not push timestamped measurements into a day bucket are
+        passed through unchanged. Each call filters one batch, which is written
+        before the next call starts.
+
+        :param samples: Prepared samples for MongoDB insertion
+        :yield: Prepared samples without the stored measurements
+        """
+        # The earlier batches are written by now, so the days they touched are read again
+        for series, day in self.written:
+            self.ranges[series][day] = [WHOLE_DAY]
+        self.written.clear()
+        self.stored.clear()
+        for sample in samples:
+            sample_dict = sample['sample_dict']
+            pushed = sample['collection_dict'].get('$push', {}).get('measurements')
+            if 'day' not in sample_dict or not isinstance(pushed, dict):
+                yield sample
+                continue
+            measurements = pushed['$each'] if '$each' in pushed else [pushed]
+            if not all(isinstance(m, dict) and 'timestamp' in m for m in measurements):
+                yield sample
+                continue
+
+            series_filter = {k: v for k, v in sample_dict.items() if k not in ('n_samples', 'day')}
+            try:
+                series = tuple(sorted(series_filter.items()))
+            except TypeError:
+                yield sample
+                continue
+
+            kept = self._new_measurements(series, series_filter, sample_dict['day'], measurements)
+            self.dropped += len(measurements) - len(kept)
+            if len(kept) == len(measurements):
+                yield sample
+            elif kept:
+                yield _rebuild_sample(sample, kept, '$each' in pushed, self.max_samples)
+
+    def _new_measurements(self, series: Tuple, series_filter: Dict[str, Any], day: datetime,
+                          measurements: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Measurements of one day bucket that are not stored yet.
+
+        :param series: Hashable key of the series
+        :param series_filter: Bucket filter without n_samples and day
+        :param day: Day of the bucket
+        :param measurements: Incoming measurements
+        :return: Measurements whose timestamp is not stored
+        """
+        if series not in self.ranges:
+            self.ranges[series] = self._load_ranges(series_filter)
+        day_ranges = self.ranges[series].get(day)
+        if not day_ranges:
+            self.written.add((series, day))
+            return measurements
+
+        keys = [timestamp_key(m['timestamp']) for m in measurements]
+        if not any(first <= key <= last for key in keys for first, last in day_ranges):
+            self.written.add((series, day))
+            return measurements
+
+        stored = self.stored.get((series, day))
+        if stored is None:
+            stored = self._load_timestamps(series_filter, day)
+            self.stored[(series, day)] = stored
+        kept = []
+        for key, measurement in zip(keys, measurements):
+            if key not in stored:
+                stored.add(key)
+                kept.append(measurement)
+        if kept:
+            self.written.add((series, day))
+        return kept
+
+    def _load_ranges(self, series_filter: Dict[str, Any]) -> Dict[datetime, List[Tuple[int, int]]]:
+        """
+        Load the first/last range of every stored bucket of a series.
+
+        :param series_filter: Bucket filter without n_samples and day
+        :return: Dictionary of day to (first, last) millisecond ranges
+        """
+        ranges: Dict[datetime, List[Tuple[int, int]]] = {}
+        with get_metrics().timer("dedup"):
+            for bucket in self.collection.find(series_filter, {"day": 1, "first": 1, "last": 1}):
+                if bucket.get('first') is None or bucket.get('last') is None:
+                    continue
+                ranges.setdefault(bucket['day'], []).append((timestamp_key(bucket['first']),
+                                                             timestamp_key(bucket['last'])))
+        return ranges
+
+    def _load_timestamps(self, series_filter: Dict[str, Any], day: datetime) -> Set[int]:
+        """
+        Load the stored timestamps of one day of a series.
+
+        :param series_filter: Bucket filter without n_samples and day
+        :param day: Day of the buckets
+        :return: Set of stored timestamps in milliseconds
+        """
+        stored = set()
+        with get_metrics().timer("dedup"):
+            for bucket in self.collection.find({**series_filter, "day": day}, {"measurements.timestamp": 1}):
+                for measurement in bucket.get('measurements', []):
+                    if isinstance(measurement, dict) and 'timestamp' in measurement:
+                        stored.add(timestamp_key(measurement['timestamp']))
+        return stored
+
+def _rebuild_sample(sample: Dict[str, Any], kept: List[Dict[str, Any]], each: bool,
+                    max_samples: Optional[int]) -> Dict[str, Any]:
+    """
+    Rebuild a prepared sample for the measurements left after deduplication.
+
+    :param sample: Original prepared sample
+    :param kept: Measurements to upload
+    :param each: Whether the original sample pushed with $each
+    :param max_samples: Maximum number of samples per MongoDB document
+    :return: Prepared sample pushing only the kept measurements, with their summary
+    """
+    sample_dict = dict(sample['sample_dict'])
+    guard = sample_dict.get('n_samples')
+    if isinstance(guard, dict) and '$lte' in guard:
+        sample_dict['n_samples'] = {"$lte": max_samples - len(kept)}
+
+    timestamps = [m['timestamp'] for m in kept]
+    collection_dict = dict(sample['collection_dict'])
+    collection_dict['$push'] = {**collection_dict['$push'],
+                                'measurements': {"$each": kept} if each else kept[0]}
+    collection_dict['$min'] = {**collection_dict.get('$min', {}), "first": min(timestamps)}
+    collection_dict['$max'] = {**collection_dict.get('$max', {}), "last": max(timestamps)}
+    collection_dict['$inc'] = {**collection_dict.get('$inc', {}), "n_samples": len(kept)}
+    add_summary(collection_dict, [m.get('value') for m in kept])
+    return {"sample_dict": sample_dict, "collection_dict": collection_dict}
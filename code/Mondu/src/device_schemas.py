@@ -0,0 +1,273 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from operator import itemgetter
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from src.models import Document, Measurement
+from src.signal_codec import encode_signal_value
+
+SEPSIS_FIELDS = [
+    "icustay_id", "hadm_id", "suspected_infection_time_poe", "suspected_infection_time_poe_days",
+    "specimen_poe", "positiveculture_poe", "antibiotic_time_poe", "blood_culture_time", "blood_culture_positive",
+    "ethnicity", "race_white", "race_black", "race_hispanic", "race_other", "metastatic_cancer", "diabetes",
+    "bmi", "first_service", "hospital_expire_flag", "thirtyday_expire_flag", "sepsis_angus", "sepsis_martin",
+    "sepsis_explicit", "septic_shock_explicit", "severe_sepsis_explicit", "sepsis_nqf", "sepsis_cdc",
+    "sepsis_cdc_simple", "elixhauser_hospital", "vent", "sofa", "lods", "sirs", "qsofa", "qsofa_sysbp_score",
+    "qsofa_gcs_score", "qsofa_resprate_score", "blood culture", "suspicion_poe", "abx_poe", "sepsis-3",
+    "sofa>=2", "excluded", "intime", "outtime", "dbsource", "age", "gender", "is_male", "height", "weight",
+    "icu_los", "hosp_los"
+]
+
+ADMISSION_FIELDS = [
+    "hadm_id", "admittime", "dischtime", "deathtime", "admission_type", "admission_location",
+    "insurance", "ethnicity", "diagnosis", "hospital_expire_flag"
+]
+
+@dataclass
+class DeviceSchema:
+    """
+    Declarative description of how the records of a device become Documents.
+
+    A schema describes one of three record shapes: a timestamped row of several
+    metrics (metrics), a timestamped row holding one metric whose type is read
+    from a field (type_field and value_field), or an untimed record copied as a
+    whole (fields).
+
+    :param period: Sampling period stored on the buckets
+    :param timestamp_field: Name of the field holding the record time
+    :param timestamp_format: 'epoch' for Unix seconds (local time, as datetime.fromtimestamp),
+                             otherwise a strptime format, or None for ISO 8601 strings
+    :param metrics: Dictionary of metric type to record field
+    :param context: Dictionary of context field to record field, added to the bucket filter
+    :param type_field: Field naming the metric type, for one-metric-per-record devices
+    :param value_field: Field holding the value, for one-metric-per-record devices
+    :param valueuom_field: Optional field holding the unit of measurement
+    :param fields: Record fields copied into a single value, for untimed records
+    :param record_type: Document type of untimed records
+    :param numeric: Whether metric values are converted to numbers (float64 on the columnar path),
+                    so they are included in the bucket summaries
+    :param signal: Whether metric values are signal strings, stored as encoded binary
+                   (see signal_codec) with config['ENCODE_SIGNALS'], which is off by default
+    :param columnar: Whether the device's CSV exports can be read column-wise
+    """
+    period: str
+    timestamp_field: Optional[str] = None
+    timestamp_format: Optional[str] = None
+    metrics: Dict[str, str] = field(default_factory=dict)
+    context: Dict[str, str] = field(default_factory=dict)
+    type_field: Optional[str] = None
+    value_field: Optional[str] = None
+    valueuom_field: Optional[str] = None
+    fields: List[str] = field(default_factory=list)
+    record_type: Optional[str] = None
+    numeric: bool = True
+    signal: bool = False
+    columnar: bool = False
+
+DEVICE_SCHEMAS = {
+    "amazfit_bip": DeviceSchema(
+        period="1/min",
+        timestamp_field="TIMESTAMP",
+        timestamp_format="epoch",
+        metrics={"RAW_INTENSITY": "RAW_INTENSITY", "STEPS": "STEPS",
+                 "HEART_RATE": "HEART_RATE", "RAW_KIND": "RAW_KIND"},
+        columnar=True
+    ),
+    "flow": DeviceSchema(
+        period="1/min",
+        timestamp_field="date",
+        timestamp_format="%Y-%m-%d %H:%M:%S",
+        metrics={"NO2": "NO2", "VOC": "VOC", "PM10": "PM 10", "PM25": "PM25",
+                 "AQI NO2": "AQI NO2", "AQI VOC": "AQI VOC",
+                 "AQI PM10": "AQI PM 10", "AQI PM25": "AQI PM 25"},
+        columnar=True
+    ),
+    "move_ecg": DeviceSchema(
+        period="30 seconds",
+        timestamp_field="date",
+        metrics={"ECG": "signal"},
+        context={"format": "format", "frequency": "frequency", "size": "size",
+                 "total_size": "totalsize", "wear_position": "wearposition"},
+        numeric=False,
+        signal=True,
+        columnar=True
+    ),
+    "mimic_chartevents": DeviceSchema(
+        period="Manual/day",
+        timestamp_field="charttime",
+        type_field="label",
+        value_field="value",
+        valueuom_field="valueuom",
+        context={"user_id": "subject_id", "valueuom": "valueuom"}
+    ),
+    "mimic_sepsis": DeviceSchema(
+        period="Various",
+        fields=SEPSIS_FIELDS,
+        record_type="mimic_sepsis",
+        context={"user_id": "subject_id"}
+    ),
+    "mimic_admission": DeviceSchema(
+        period="Admission",
+        fields=ADMISSION_FIELDS,
+        record_type="mimic_admission",
+        context={"subject_id": "subject_id"}
+    )
+}
+
+def device_schema(device: str, config: Dict[str, Any]) -> Optional[DeviceSchema]:
+    """
+    Schema of a device, from config['DEVICE_SCHEMAS'] or the built-in definitions.
+
+    Schemas in the configuration are dictionaries of DeviceSchema arguments, so
+    a device can be added in config.json alongside its entry in 'devices'.
+
+    :param device: Device name
+    :param config: Configuration dictionary
+    :return: DeviceSchema, or None if the device has none
+    """
+    configured = config.get('DEVICE_SCHEMAS', {}).get(device)
+    if configured is not None:
+        return DeviceSchema(**configured)
+    return DEVICE_SCHEMAS.get(device)
+
+def naive_utc(timestamp: datetime) -> datetime:
+    """
+    Convert a timestamp with a UTC offset to naive UTC, as MongoDB reads it back.
+
+    :param timestamp: Naive or aware datetime
+    :return: The naive datetime itself, or the aware one converted to UTC without tzinfo
+    """
+    offset = timestamp.utcoffset()
+    if offset is None:
+        return timestamp
+    # Rebuilding from date() and time() drops tzinfo several times faster than replace(tzinfo=None)
+    utc = timestamp - offset
+    return datetime.combine(utc.date(), utc.time())
+
+def parse_iso_timestamp(value: str) -> datetime:
+    """
+    Parse an ISO 8601 timestamp to naive UTC.
+
+    UTC timestamps such as move_ecg's "...+00:00" are parsed without their
+    offset, which saves converting each aware datetime.
+
+    :param value: ISO 8601 string, with or without a UTC offset
+    :return: Naive datetime
+    """
+    if value.endswith("+00:00"):
+        return datetime.fromisoformat(value[:-6])
+    return naive_utc(datetime.fromisoformat(value))
+
+def timestamp_parser(timestamp_format: Optional[str]) -> Callable[[str], datetime]:
+    """
+    Build the function parsing the raw timestamps of a schema.
+
+    Timestamps with a UTC offset are returned as naive UTC, so their day bucket
+    is the UTC day on both the per-record and the columnar path.
+
+    :param timestamp_format: 'epoch', a strptime format, or None for ISO 8601
+    :return: Function from a raw timestamp to a naive datetime
+    """
+    if timestamp_format == "epoch":
+        return lambda value: datetime.fromtimestamp(int(value))
+    if timestamp_format is None:
+        return parse_iso_timestamp
+    return lambda value: naive_utc(datetime.strptime(value, timestamp_format))
+
+def to_number(value: Any) -> Any:
+    """
+    Convert a raw metric value to a float, keeping values that are not numbers as they are.
+
+    :param value: Raw value of a record field
+    :return: Float value, or the raw value
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+def _tuple_getter(fields: List[str]) -> Callable[[Dict[str, Any]], Tuple]:
+    """
+    itemgetter that always returns a tuple, whatever the number of fields.
+    """
+    fields = list(fields)
+    if not fields:
+        return lambda record: ()
+    if len(fields) == 1:
+        getter = itemgetter(fields[0])
+        return lambda record: (getter(record),)
+    return itemgetter(*fields)
+
+def compile_schema(schema: DeviceSchema, device: str, config: Dict[str, Any]) -> Callable[[Dict[str, Any]], List[Document]]:
+    """
+    Compile a schema into a function creating the Documents of one record.
+
+    Everything that does not depend on the record (field getters, the timestamp
+    parser, user and device identifiers) is resolved here once, so the returned
+    function only reads the record and builds the Documents.
+
+    :param schema: Schema of the device
+    :param device: Device name
+    :param config: Configuration dictionary
+    :return: Function from a record to its list of Documents
+    """
+    user_id = config['users'][config['USERNAME'].lower()]
+    device_id = config['devices'][device]
+    period = schema.period
+    context_names = tuple(schema.context)
+    get_context = _tuple_getter(list(schema.context.values()))
+    get_valueuom = itemgetter(schema.valueuom_field) if schema.valueuom_field else lambda record: ""
+
+    if schema.fields:
+        names = tuple(schema.fields)
+        get_fields = _tuple_getter(schema.fields)
+        record_type = schema.record_type or device
+
+        def create_record(record_data: Dict[str, Any]) -> List[Document]:
+            return [Document(user_id=user_id, type=record_type, device_id=device_id, period=period, day=None,
+                             valueuom=get_valueuom(record_data),
+                             measurements=[Measurement(timestamp=None,
+                                                       value=dict(zip(names, get_fields(record_data))))],
+                             context=dict(zip(context_names, get_context(record_data))))]
+        return create_record
+
+    parse_timestamp = timestamp_parser(schema.timestamp_format)
+    get_timestamp = itemgetter(schema.timestamp_field)
+    if schema.signal and config.get('ENCODE_SIGNALS'):
+        convert = encode_signal_value
+    elif schema.numeric:
+        convert = to_number
+    else:
+        convert = None
+    # Values stored as they are read skip the conversion call altogether
+    if schema.type_field:
+        get_metric = itemgetter(schema.type_field, schema.value_field)
+
+        if convert is None:
+            def metric_values(record_data: Dict[str, Any]) -> List[Tuple[str, Any]]:
+                return [get_metric(record_data)]
+        else:
+            def metric_values(record_data: Dict[str, Any]) -> List[Tuple[str, Any]]:
+                metric, value = get_metric(record_data)
+                return [(metric, convert(value))]
+    else:
+        metric_names = tuple(schema.metrics)
+        get_values = _tuple_getter(list(schema.metrics.values()))
+
+        if convert is None:
+            def metric_values(record_data: Dict[str, Any]) -> List[Tuple[str, Any]]:
+                return list(zip(metric_names, get_values(record_data)))
+        else:
+            def metric_values(record_data: Dict[str, Any]) -> List[Tuple[str, Any]]:
+                return list(zip(metric_names, map(convert, get_values(record_data))))
+
+    def create_metrics(record_data: Dict[str, Any]) -> List[Document]:
+        timestamp = parse_timestamp(get_timestamp(record_data))
+        day = datetime(timestamp.year, timestamp.month, timestamp.day)
+        context = dict(zip(context_names, get_context(record_data)))
+        valueuom = get_valueuom(record_data)
+        return [Document(user_id=user_id, type=metric, device_id=device_id, period=period, day=day,
+                         valueuom=valueuom, measurements=[Measurement(timestamp=timestamp, value=value)],
+                         context=context)
+                for metric, value in metric_values(record_data)]
+    return create_metrics
@@ -0,0 +1,116 @@
+import sys
+from datetime import timedelta
+from itertools import islice
+from typing import Dict, Any, List, Tuple
+
+import click
+
+from src.config import load_config
+from src.db_reader import series_query
+from src.db_utils import setup_database, ensure_indexes, explain_plan, plan_stages, close_client
+from src.document_factory import DocumentFactory
+from src.file_parser import iter_records
+from src.rollups import mark_rollup_buckets
+from src.sample_processor import stream_samples
+from src.timeseries import storage_backend, setup_timeseries_collection, BUCKET_FIELDS
+
+def diagnostic_queries(samples: List[Dict[str, Any]], config: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any], Any]]:
+    """
+    The filters the ingest of a device sends, built from its prepared samples.
+
+    For the bucket layout these are the upsert filters, the deduplication
+    lookups and a day-range read by db_reader; for a time-series collection,
+    a day-range read of each series. The upsert filters carry the rollup mark
+    of mark_rollup_buckets, as upload_prepared_samples sends them; the
+    deduplication lookups run before marking and do not.
+
+    :param samples: Prepared samples of the first input records
+    :param config: Configuration dictionary
+    :return: List of (description, filter, update or None)
+    """
+    queries = []
+    for sample, marked in zip(samples, mark_rollup_buckets(samples, config)):
+        sample_dict = sample['sample_dict']
+        series = {k: v for k, v in sample_dict.items() if k not in ('n_samples', 'day')}
+        if storage_backend(config) == 'timeseries':
+            if 'day' in sample_dict:
+                queries.append(("time-series day read", {
+                    **{f"meta.{k}": v for k, v in series.items() if k not in BUCKET_FIELDS},
+                    "timestamp": {"$gte": sample_dict['day'], "$lt": sample_dict['day'] + timedelta(days=1)}
+                }, None))
+            continue
+        queries.append(("bucket upsert", marked['sample_dict'], marked['collection_dict']))
+        if 'day' in sample_dict:
+            queries.append(("dedup series ranges", series, None))
+            queries.append(("dedup day timestamps", {**series, "day": sample_dict['day']}, None))
+            queries.append(("time-range read", series_query(
+                series['user_id'], series['device_id'], series['type'],
+                sample_dict['day'], sample_dict['day'] + timedelta(days=1)), None))
+    return queries
+
+@click.command()
+@click.argument("filepath", type=click.Path(exists=True))
+@click.option("-u", "--username", help="Name of the user the data belongs to.", default='anonymous')
+@click.option("-d", "--device", prompt="Device", help="Device the data is from.")
+@click.option("-db", "--database", help="Database to check.", default='COPH')
+@click.option("-c", "--collection", help="Collection to check.", default='measurements')
+@click.option("-n", "--records", type=int, default=20, help="Input records used to build the filters.")
+@click.option("--storage", type=click.Choice(['buckets', 'timeseries']), default=None,
+              help="Storage layout to check (default from STORAGE_BACKENDS).")
+@click.option("--ensure", is_flag=True, default=False, help="Create the missing indexes before explaining.")
+def main(filepath: str, username: str, device: str, database: str, collection: str, records: int,
+         storage: str, ensure: bool):
+    """
+    Explain the filters the ingest of a file would send and warn about collection scans.
+
+    :param filepath: Path to the input file
+    :param username: Name of the user the data belongs to
+    :param device: Name of the device
+    :param database: Database to check
+    :param collection: Collection to check
+    :param records: Number of input records used to build the filters
+    :param storage: Storage layout to check
+    :param ensure: Whether to create the missing indexes first
+    """
+    config = load_config()
+    config.update({
+        'USERNAME': username,
+        'DEVICE': device,
+        'DATABASE': database,
+        'COLLECTION_NAME': collection,
+        'WORKERS': 1
+    })
+    if storage:
+        config['STORAGE_BACKENDS'] = {**config['STORAGE_BACKENDS'], device.lower(): storage}
+
+    try:
+        db, target = setup_database(config)
+        if storage_backend(config) == 'timeseries':
+            target = setup_timeseries_collection(db, config)
+        if ensure:
+            print(f"Ensured indexes: {', '.join(ensure_indexes(target, config))}")
+
+        samples = list(stream_samples(islice(iter_records(filepath), records), DocumentFactory(config), config))
+        seen, scans = set(), 0
+        for description, query, update in diagnostic_queries(samples, config):
+            key = (description, repr(sorted(query)))
+            if key in seen:
+                continue
+            seen.add(key)
+            stages = plan_stages(explain_plan(target, query, update)['winningPlan'])
+            print(f"{description}: {' > '.join(stages)}")
+            print(f"  filter fields: {', '.join(query)}")
+            if any(stage.startswith("COLLSCAN") for stage in stages):
+                scans += 1
+                print("  WARNING: collection scan; run with --ensure or call ensure_indexes")
+            elif stages == ["EOF"]:
+                print(f"  note: {target.name} does not exist yet, so the plan is empty")
+    finally:
+        close_client()
+
+    if scans:
+        print(f"{scans} filter shapes use a collection scan")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
-from typing import Dict, Any, List, Union
-from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, List, Union
+import fnmatch
+import json
+import os
 import owlready2 as owl
 import pymongo as pm
 import requests
 
-from src.models import Document, Measurement, DeviceID
+from src.models import Document, DeviceID
 from src.config import load_config
+from src.device_schemas import compile_schema, device_schema
+from src.ontology_index import get_ontology_index
+from src.ontology_utils import search_coph_ontology
 
 class DocumentFactory:
     """
@@ -19,6 +24,7 @@ class DocumentFactory:
         :param config: Configuration dictionary
         """
         self.config = config
+        self._creators: Dict[DeviceID, Callable[[Dict[str, Any]], List[Document]]] = {}
 
     def create_samples(self, device_id: DeviceID, record_data: Dict[str, Any]) -> Union[Document, List[Document]]:
         """
@@ -34,70 +40,147 @@ class DocumentFactory:
 
     def get_document_creator(self, device_id: DeviceID):
         """
-        Get the appropriate document creator function for the given device ID.
+        Get the compiled document creator function for the given device ID.
+
+        Creators are compiled from the device schema on first use and cached,
+        so the per-record cost is only the record extraction itself.
 
         :param device_id: Identifier for the device
-        :return: Function to create a document for the specified device
+        :return: Function to create the documents of a record for the specified device
         :raises ValueError: If an unsupported device type is provided
         """
-        creators = {
-            self.config['devices']['move_ecg']: self._create_move_ecg,
-            self.config['devices']['flow']: self._create_flow,
-            self.config['devices']['amazfit_bip']: self._create_amazfit_bip,
-            self.config['devices']['mimic_chartevents']: self._create_mimic_chartevents,
-            self.config['devices']['mimic_mortality']: self._create_mimic_mortality,
-            self.config['devices']['mimic_diagnoses']: self._create_mimic_diagnoses,
-            self.config['devices']['mimic_prescriptions']: self._create_mimic_prescriptions,
-            self.config['devices']['mimic_procedures']: self._create_mimic_procedures,
-            self.config['devices']['mimic_sepsis']: self._create_mimic_sepsis,
-            self.config['devices']['mimic_admission']: self._create_mimic_admission,
-        }
-        creator = creators.get(device_id)
-        if not creator:
-            raise ValueError(f"Unsupported device type: {device_id}")
+        creator = self._creators.get(device_id)
+        if creator is None:
+            device_names = {device_code: name for name, device_code in self.config['devices'].items()}
+            device = device_names.get(device_id)
+            schema = device_schema(device, self.config) if device else None
+            if schema is None:
+                raise ValueError(f"Unsupported device type: {device_id}")
+            creator = compile_schema(schema, device, self.config)
+            self._creators[device_id] = creator
         return creator
 
-    def _create_amazfit_bip(self, record_data: Dict[str, Any]) -> Document:
-        """
-        Create a Document for Amazfit Bip data.
-
-        :param record_data: Dictionary containing the record data
-        :return: Document object
-        """
-        timestamp = datetime.fromtimestamp(int(record_data['TIMESTAMP']))
-        measurements = [
-            Measurement(timestamp=timestamp, value=record_data['RAW_INTENSITY']),
-            Measurement(timestamp=timestamp, value=record_data['STEPS']),
-            Measurement(timestamp=timestamp, value=record_data['HEART_RATE']),
-            Measurement(timestamp=timestamp, value=record_data['RAW_KIND'])
-        ]
-        return Document(
-            user_id=record_data['user_id'],
-            type="amazfit_bip",
-            device_id=record_data['device_id'],
-            period="1/min",
-            day=timestamp.date(),
-            valueuom="",
-            measurements=measurements
-        )
-
-    # ... Other _create_* methods would be implemented here ...
-
     def create_mappings(self, device_id: DeviceID, record_data: Dict[str, Any], 
                         database: pm.database.Database, ontology: owl.Ontology) -> Dict[str, Any]:
         """
         Create mappings for the given device and record data.
 
+        Every field of the record is resolved in one pass, in order, from the mapping
+        rules file (config['MAPPING_RULES']), the device's document in the mappings
+        collection and the ontology term index. Fields still unresolved are searched
+        interactively, or with config['INTERACTIVE_MAPPING'] disabled written to the
+        config['MAPPING_REPORT'] file so that nothing waits on input().
+
         :param device_id: Identifier for the device
         :param record_data: Dictionary containing the record data
         :param database: MongoDB database object
         :param ontology: Owlready2 ontology object
         :return: Dictionary of created mappings
         """
-        # Implementation remains the same as in the original script
-        pass
+        fields = [field for field in record_data if field not in ("user_id", "device_id")]
+        mappings = {}
+        for resolve in (self._rule_mappings, self._ask_mongodb_mappings, self._index_mappings):
+            unresolved = [field for field in fields if field not in mappings]
+            if not unresolved:
+                break
+            mappings.update(resolve(device_id, unresolved, database, ontology))
+
+        unresolved = [field for field in fields if field not in mappings]
+        if unresolved:
+            if self.config.get('INTERACTIVE_MAPPING', True):
+                mappings.update(search_coph_ontology(unresolved, ontology))
+            else:
+                self._report_unmapped(device_id, unresolved, ontology)
+        return mappings
+
+    def _rule_mappings(self, device_id: DeviceID, fields: List[str],
+                       database: pm.database.Database, ontology: owl.Ontology) -> Dict[str, str]:
+        """
+        Resolve fields from the mapping rules file.
+
+        The file is a JSON object of device name (or "*" for any device) to an object of
+        field name or fnmatch pattern to IRI; device rules take precedence.
+
+        :param device_id: Identifier for the device
+        :param fields: Fields to resolve
+        :param database: MongoDB database object
+        :param ontology: Owlready2 ontology object
+        :return: Dictionary of field to IRI for the fields matched by a rule
+        """
+        rules_path = self.config.get('MAPPING_RULES')
+        if not rules_path:
+            return {}
+        with open(rules_path, 'r') as rules_file:
+            rules = json.load(rules_file)
+
+        mappings = {}
+        for device_rules in (rules.get(str(device_id).lower(), {}), rules.get("*", {})):
+            for field in fields:
+                if field in mappings:
+                    continue
+                if field in device_rules:
+                    mappings[field] = device_rules[field]
+                    continue
+                for pattern, iri in device_rules.items():
+                    if fnmatch.fnmatch(field.lower(), pattern.lower()):
+                        mappings[field] = iri
+                        break
+        return mappings
+
+    def _ask_mongodb_mappings(self, device_id: DeviceID, fields: List[str],
+                              database: pm.database.Database, ontology: owl.Ontology) -> Dict[str, str]:
+        """
+        Resolve fields from the mappings already stored for the device.
+
+        :param device_id: Identifier for the device
+        :param fields: Fields to resolve
+        :param database: MongoDB database object
+        :param ontology: Owlready2 ontology object
+        :return: Dictionary of field to IRI for the fields with a stored mapping
+        """
+        stored = database['mappings'].find_one({"_id": device_id}) or {}
+        return {field: stored[field] for field in fields if field in stored}
+
+    def _index_mappings(self, device_id: DeviceID, fields: List[str],
+                        database: pm.database.Database, ontology: owl.Ontology) -> Dict[str, str]:
+        """
+        Resolve fields whose best ontology index match scores at least config['MAPPING_MIN_SCORE'].
+
+        :param device_id: Identifier for the device
+        :param fields: Fields to resolve
+        :param database: MongoDB database object
+        :param ontology: Owlready2 ontology object
+        :return: Dictionary of field to IRI for the confidently matched fields
+        """
+        index = get_ontology_index(ontology)
+        mappings = {}
+        for field in fields:
+            candidates = index.search(field, limit=1)
+            if candidates and candidates[0].score >= self.config['MAPPING_MIN_SCORE']:
+                mappings[field] = candidates[0].iri
+        return mappings
+
+    def _report_unmapped(self, device_id: DeviceID, fields: List[str], ontology: owl.Ontology):
+        """
+        Record unresolved fields, with their best index candidates, in the mapping report.
 
-    # ... Other helper methods (_ask_mongodb_mappings, _search_coph_ontology, etc.) ...
+        :param device_id: Identifier for the device
+        :param fields: Unresolved fields
+        :param ontology: Owlready2 ontology object
+        """
+        report_path = self.config['MAPPING_REPORT']
+        report = {}
+        if os.path.exists(report_path):
+            with open(report_path, 'r') as report_file:
+                report = json.load(report_file)
+        index = get_ontology_index(ontology)
+        report[str(device_id)] = {
+            field: [candidate._asdict() for candidate in index.search(field, limit=3)]
+            for field in fields
+        }
+        with open(report_path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"{len(fields)} unmapped field(s) for {device_id} written to {report_path}")
 
     def print_mappings(self, mappings: Dict[str, Any]):
         """
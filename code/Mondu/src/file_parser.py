@@ -1,30 +1,145 @@
 import csv
+import glob
 import json
-from typing import List, Dict, Any
+import os
+from collections import deque
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator, TextIO
+
+JSON_FORMATS = ("json", "ndjson", "jsonl")
+SUPPORTED_FORMATS = ("csv",) + JSON_FORMATS
+
+def expand_paths(paths: Iterable[str]) -> List[str]:
+    """
+    Expand files, directories and glob patterns into the input files they name.
+
+    Directories (searched recursively) and glob patterns (which may use ** to
+    match subdirectories) contribute their files of a supported format. Files
+    named directly are kept whatever their extension, so iter_records reports
+    unsupported ones.
+
+    :param paths: Files, directories or glob patterns
+    :return: Sorted list of distinct file paths
+    """
+    def supported(name: str) -> bool:
+        return name.lower().rpartition('.')[-1] in SUPPORTED_FORMATS
+
+    files = set()
+    for path in paths:
+        if os.path.isfile(path):
+            files.add(path)
+            continue
+        for match in glob.glob(path, recursive=True) if glob.has_magic(path) else [path]:
+            if os.path.isdir(match):
+                for directory, _, names in os.walk(match):
+                    files.update(os.path.join(directory, name) for name in names if supported(name))
+            elif os.path.isfile(match) and supported(match):
+                files.add(match)
+    return sorted(files)
 
 def parse_file(file_path: str) -> List[Dict[str, Any]]:
     """
     Parse a CSV or JSON file and return its contents as a list of dictionaries.
 
+    This loads the whole file into memory; use iter_records for large exports.
+
     :param file_path: Path to the file to be parsed
     :return: List of dictionaries containing the file data
     :raises ValueError: If an unsupported file format is provided
     """
-    file_data = []
+    return list(iter_records(file_path))
+
+def iter_records(file_path: str, skip: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily read the records of a CSV, JSON array or newline-delimited JSON file.
+
+    Only one record (plus a read buffer) is held in memory at a time. Skipped
+    CSV rows are not turned into dictionaries, and skipped lines of a .ndjson
+    or .jsonl file (one value per line) are not decoded; a .json file is
+    decoded up to the first record returned.
+
+    :param file_path: Path to the file to be parsed
+    :param skip: Number of leading records to skip, such as those committed by an earlier run
+    :return: Iterator of dictionaries containing the file data
+    :raises ValueError: If an unsupported file format is provided
+    """
     file_format = file_path.lower().rpartition('.')[-1]
-    
-    if file_format == "csv":
-        with open(file_path, 'r') as file:
-            csv_reader = csv.DictReader(file)
-            for row in csv_reader:
-                file_data.append(dict(row))
-    elif file_format == "json":
-        with open(file_path, 'r') as file:
-            file_data = json.load(file)
-    else:
+    if file_format not in SUPPORTED_FORMATS:
         raise ValueError(f"Unsupported file format: {file_format}")
+    return _iter_file(file_path, file_format, skip)
+
+def _iter_file(file_path: str, file_format: str, skip: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Generator behind iter_records, kept separate so format errors are raised eagerly.
+
+    :param file_path: Path to the file to be parsed
+    :param file_format: Lower-case file extension
+    :param skip: Number of leading records to skip
+    :yield: Each record of the file after the skipped ones
+    """
+    with open(file_path, 'r', newline='' if file_format == "csv" else None) as file:
+        if file_format == "csv":
+            reader = csv.DictReader(file)
+            if skip and reader.fieldnames:
+                # DictReader passes over blank rows, so they are not counted here either
+                deque(islice(filter(None, reader.reader), skip), maxlen=0)
+            for row in reader:
+                yield dict(row)
+        elif file_format == "json":
+            yield from islice(iter_json(file), skip, None)
+        else:
+            deque(islice(filter(str.strip, file), skip), maxlen=0)
+            yield from iter_json(file)
+
+def iter_json(file: TextIO, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    Incrementally decode a top-level JSON array or a stream of JSON values (NDJSON).
+
+    :param file: Open text file positioned at the start of the JSON data
+    :param chunk_size: Number of characters to read per chunk
+    :yield: Each element of the array, or each value of the stream
+    :raises json.JSONDecodeError: If the file is not valid JSON
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+    in_array = None
 
-    return file_data
+    while True:
+        buffer = buffer.lstrip()
+        if in_array and buffer[:1] == ",":
+            buffer = buffer[1:].lstrip()
+        if not buffer:
+            if eof:
+                if in_array:
+                    raise json.JSONDecodeError("Unterminated array", buffer, 0)
+                return
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        if in_array is None:
+            in_array = buffer[0] == "["
+            if in_array:
+                buffer = buffer[1:]
+            continue
+        if in_array and buffer[0] == "]":
+            return
+        try:
+            record, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            end = None
+        # A value reaching the end of the buffer, such as a number, may go on in the next chunk
+        if end is None or (end == len(buffer) and not eof):
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield record
+        buffer = buffer[end:]
 
 def get_days(start_date: datetime, end_date: datetime) -> List[str]:
     """
@@ -1,31 +1,228 @@
+import atexit
 import click
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+from typing import Dict, Any, List, Optional, Tuple
 from src.config import load_config
-from src.file_parser import parse_file
+from src.file_parser import iter_records, expand_paths
 from src.document_factory import DocumentFactory
-from src.sample_processor import upload_samples, print_samples
-from src.db_utils import setup_database
+from src.sample_processor import print_samples, transform_pool, UploadReport
+from src.columnar import iter_columnar_batches
+from src.device_schemas import device_schema
+from src.checkpoint import Checkpoint, record_batches, upload_checkpointed
+from src.dedup import Deduplicator
+from src.metrics import get_metrics
+from src.rollups import setup_rollup_collections
+from src.timeseries import storage_backend, setup_timeseries_collection
+from src.db_utils import setup_database, upload_mappings, ensure_indexes, close_client
 from src.ontology_utils import setup_ontology
 
+# Per-process state of the file ingest pool, set by _init_file_worker
+_worker_config = None
+_worker_collection = None
+_worker_factory = None
+
+def ingest_file(filepath: str, config: Dict[str, Any], db, collection,
+                document_factory: DocumentFactory, resume: bool,
+                executor: Optional[ProcessPoolExecutor] = None) -> UploadReport:
+    """
+    Upload one input file, committing checkpoints as its batches are written.
+
+    :param filepath: Path to the input file
+    :param config: Configuration dictionary
+    :param db: MongoDB database object
+    :param collection: Collection to upload to
+    :param document_factory: DocumentFactory object
+    :param resume: Whether to continue from the file's last committed checkpoint
+    :param executor: Transformation pool from transform_pool, reused across batches and files
+    :return: UploadReport of the file
+    """
+    checkpoint = Checkpoint(db[config['CHECKPOINT_COLLECTION']], filepath, config)
+    if not resume:
+        checkpoint.reset()
+    elif checkpoint.committed or checkpoint.completed:
+        print(f"Resuming {filepath} after {checkpoint.committed} committed records")
+    if checkpoint.completed:
+        batches = iter(())
+    elif config['COLUMNAR'] and getattr(device_schema(config['DEVICE'].lower(), config), 'columnar', False):
+        batches = iter_columnar_batches(filepath, config, skip_rows=checkpoint.committed)
+    else:
+        data = get_metrics().timed(iter_records(filepath, skip=checkpoint.committed), "parse", "records")
+        batches = record_batches(data, document_factory, config, executor=executor)
+    deduplicator = None
+    if config['DEDUPLICATE'] and storage_backend(config) == 'buckets':
+        deduplicator = Deduplicator(collection, config)
+    return upload_checkpointed(batches, config, collection, checkpoint, deduplicator)
+
+def _init_file_worker(config: Dict[str, Any]):
+    """
+    Set up a file ingest worker process.
+
+    The database client and DocumentFactory (with its compiled creators) are
+    created once per process and reused for every file the worker ingests. The
+    client is closed when the worker process exits.
+
+    :param config: Configuration dictionary
+    """
+    global _worker_config, _worker_collection, _worker_factory
+    _worker_config = config
+    _, _worker_collection = setup_database(config)
+    atexit.register(close_client)
+    _worker_factory = DocumentFactory(config)
+
+def _ingest_file_worker(filepath: str, resume: bool) -> Tuple[str, UploadReport, Dict[str, Any]]:
+    """
+    Ingest one file in a worker process.
+
+    :param filepath: Path to the input file
+    :param resume: Whether to continue from the file's last committed checkpoint
+    :return: Tuple of (file path, UploadReport, exported metrics of the file)
+    """
+    metrics = get_metrics()
+    metrics.reset()
+    report = ingest_file(filepath, _worker_config, _worker_collection.database, _worker_collection,
+                         _worker_factory, resume)
+    return filepath, report, metrics.to_dict()
+
+def ingest_files(filepaths: List[str], config: Dict[str, Any], db, collection,
+                 document_factory: DocumentFactory, resume: bool) -> UploadReport:
+    """
+    Upload input files, across config['FILE_WORKERS'] processes when there are several.
+
+    Each worker process keeps its own client and DocumentFactory. Record
+    transformation then runs inside the workers, so config['WORKERS'] is set to 1
+    there. Their metrics are merged into this process's, and a file that fails is
+    recorded as an error of the combined report without stopping the others.
+
+    Deduplication (config['DEDUPLICATE']) only sees measurements stored before a
+    file's series is first read. Files ingested concurrently are not deduplicated
+    against each other, so overlapping exports of the same series should be run
+    with a single file worker.
+
+    :param filepaths: Paths of the input files
+    :param config: Configuration dictionary
+    :param db: MongoDB database object
+    :param collection: Collection to upload to
+    :param document_factory: DocumentFactory object used when ingesting in this process
+    :param resume: Whether to continue each file from its last committed checkpoint
+    :return: Combined UploadReport, with the wall-clock time of the whole run
+    """
+    metrics = get_metrics()
+    report = UploadReport()
+    start = time.perf_counter()
+    file_workers = min(config['FILE_WORKERS'], len(filepaths))
+    if file_workers <= 1:
+        with transform_pool(config) as executor:
+            for filepath in filepaths:
+                try:
+                    file_report = ingest_file(filepath, config, db, collection, document_factory, resume, executor)
+                except Exception as e:
+                    metrics.error("ingest", e)
+                    report.errors.append({"file": filepath, "errmsg": str(e)})
+                    print(f"Error ingesting {filepath}: {e}")
+                    continue
+                if len(filepaths) > 1:
+                    print(f"{filepath}: {file_report.summary()}")
+                report.merge(file_report)
+    else:
+        if config['DEDUPLICATE']:
+            print(f"Deduplicating against stored data only: files ingested by the {file_workers} file workers "
+                  "are not deduplicated against each other")
+        # Spawned rather than forked, so no worker inherits this process's MongoClient
+        with ProcessPoolExecutor(max_workers=file_workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_file_worker, initargs=({**config, 'WORKERS': 1},)) as pool:
+            futures = {pool.submit(_ingest_file_worker, filepath, resume): filepath for filepath in filepaths}
+            for future in as_completed(futures):
+                try:
+                    filepath, file_report, file_metrics = future.result()
+                except Exception as e:
+                    metrics.error("ingest", e)
+                    report.errors.append({"file": futures[future], "errmsg": str(e)})
+                    print(f"Error ingesting {futures[future]}: {e}")
+                    continue
+                print(f"{filepath}: {file_report.summary()}")
+                report.merge(file_report)
+                metrics.merge(file_metrics)
+    report.elapsed = time.perf_counter() - start
+    return report
+
 @click.command()
-@click.argument("filepath", type=click.Path(exists=True))
+@click.argument("filepaths", nargs=-1, required=True)
 @click.option("-u", "--username", prompt="Monitoring device user's name", help="Name of monitoring device user")
 @click.option("-d", "--device", prompt="Device name", help="Name of monitoring device")
 @click.option("-s", "--sample_period", prompt="Interval of sample period", help="The interval a sample period represents.")
 @click.option("-m", "--max_samples", prompt="Maximum samples per document", help="Most samples to upload per MongoDB document.", default=1500)
 @click.option("-db", "--database", help="Database to upload to.", default='COPH')
 @click.option("-c", "--collection", help="Collection to upload to.", default='measurements')
-def main(filepath: str, username: str, device: str, sample_period: str,
-         max_samples: int, database: str, collection: str):
+@click.option("--upload_mode", type=click.Choice(['bulk', 'single', 'async']), default='bulk',
+              help="Send upserts as unordered bulk writes, one at a time, or as concurrent bulk writes.")
+@click.option("-b", "--batch_size", type=int, default=1000, help="Operations per bulk write.")
+@click.option("--in_flight", type=int, default=4, help="Concurrent bulk writes in async upload mode.")
+@click.option("--queue_size", type=int, default=8, help="Prepared batches queued ahead of the writers in async upload mode.")
+@click.option("--aggregate/--no-aggregate", default=True,
+              help="Merge measurements into one update per bucket before uploading.")
+@click.option("-w", "--workers", type=int, default=1, help="Processes used to transform records.")
+@click.option("-j", "--file_workers", type=int, default=1, help="Processes ingesting input files in parallel. Files ingested at the same time are "
+                   "not deduplicated against each other, so use 1 for overlapping exports.")
+@click.option("--columnar/--no-columnar", default=False,
+              help="Read wearable CSV exports column-wise into arrays (amazfit_bip, flow, move_ecg).")
+@click.option("--interactive/--non-interactive", default=True,
+              help="Prompt for fields that cannot be mapped automatically, or report them to a file.")
+@click.option("-r", "--mapping_rules", type=click.Path(exists=True), default=None,
+              help="JSON file of field mapping rules, checked before any other source.")
+@click.option("--resume", is_flag=True, default=False,
+              help="Skip the input records committed by a previous run of the same file, user and device.")
+@click.option("--dedup/--no-dedup", default=True,
+              help="Drop measurements whose timestamp is already stored for the same series "
+                   "(by an earlier file or run, not a file ingested concurrently with --file_workers). "
+                   "Bucket storage only.")
+@click.option("--storage", type=click.Choice(['buckets', 'timeseries']), default=None,
+              help="Store the device in bucket documents or a time-series collection (default from STORAGE_BACKENDS).")
+@click.option("--encode_signals", is_flag=True, default=False,
+              help="Experimental: store signal payloads (move_ecg) as delta-encoded, compressed binary instead of "
+                   "strings. Ingest is several times slower and the storage saving on a live server is not yet "
+                   "measured (benchmarks/bench_ecg_encoding.py --live).")
+@click.option("--rollups", is_flag=True, default=False,
+              help="Also write per-minute, per-hour and per-day rollups of the device (see ROLLUP_DEVICES).")
+@click.option("--metrics_file", type=click.Path(), default=None,
+              help="Write run metrics to this file, as JSON for a .json path and Prometheus text otherwise.")
+def main(filepaths: Tuple[str, ...], username: str, device: str, sample_period: str,
+         max_samples: int, database: str, collection: str, upload_mode: str, batch_size: int,
+         in_flight: int, queue_size: int,
+         aggregate: bool, workers: int, file_workers: int, columnar: bool, interactive: bool, mapping_rules: str,
+         resume: bool, dedup: bool, storage: str, encode_signals: bool, rollups: bool, metrics_file: str):
     """
     Main function to process and upload data.
 
-    :param filepath: Path to the input file
+    Input files, directories and glob patterns are expanded into the files to
+    ingest; the ontology, indexes and mappings are set up once for all of them.
+
+    :param filepaths: Input files, directories or glob patterns
     :param username: Name of the monitoring device user
     :param device: Name of the monitoring device
     :param sample_period: Interval of the sample period
     :param max_samples: Maximum number of samples per document
     :param database: Name of the database to upload to
     :param collection: Name of the collection to upload to
+    :param upload_mode: 'bulk' for unordered bulk writes, 'single' for one update per sample,
+                        'async' for concurrent bulk writes fed through a bounded queue
+    :param batch_size: Number of operations per bulk write
+    :param in_flight: Maximum number of concurrent bulk writes in async mode
+    :param queue_size: Maximum number of prepared batches queued in async mode
+    :param aggregate: Whether to merge measurements into one update per bucket
+    :param workers: Number of processes used to transform records
+    :param file_workers: Number of processes ingesting input files in parallel
+    :param columnar: Whether to use the columnar path for supported wearable devices
+    :param interactive: Whether to prompt for fields that cannot be mapped automatically
+    :param mapping_rules: Path to a JSON file of field mapping rules
+    :param resume: Whether to continue from the last committed checkpoint
+    :param dedup: Whether to drop measurements that are already stored
+    :param storage: Storage backend of the device for this run
+    :param encode_signals: Whether to store signal payloads as encoded binary
+    :param rollups: Whether to write rollups during ingest
+    :param metrics_file: Path to export the run metrics to
     """
     config = load_config()
     config.update({
@@ -34,28 +231,82 @@ def main(filepath: str, username: str, device: str, sample_period: str,
         'SAMPLE_PERIOD': sample_period,
         'MAX_SAMPLES': max_samples,
         'DATABASE': database,
-        'COLLECTION_NAME': collection
+        'COLLECTION_NAME': collection,
+        'UPLOAD_MODE': upload_mode,
+        'BATCH_SIZE': batch_size,
+        'ASYNC_IN_FLIGHT': in_flight,
+        'ASYNC_QUEUE_SIZE': queue_size,
+        'AGGREGATE_BUCKETS': aggregate,
+        'WORKERS': workers,
+        'FILE_WORKERS': file_workers,
+        'COLUMNAR': columnar,
+        'DEDUPLICATE': dedup,
+        'ENCODE_SIGNALS': encode_signals or config['ENCODE_SIGNALS'],
+        'ROLLUPS': rollups or config['ROLLUPS'],
+        'INTERACTIVE_MAPPING': interactive,
+        'MAPPING_RULES': mapping_rules or config['MAPPING_RULES'],
+        'METRICS_FILE': metrics_file or config['METRICS_FILE']
     })
+    if storage:
+        config['STORAGE_BACKENDS'] = {**config['STORAGE_BACKENDS'], device.lower(): storage}
+    try:
+        backend = storage_backend(config)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--storage")
+    if backend == 'timeseries' and config['DEDUPLICATE']:
+        print(f"Warning: measurements of {device} already stored in the time-series collection are not "
+              "deduplicated; run with --no-dedup to silence this warning")
+    files = expand_paths(filepaths)
+    if not files:
+        raise click.BadParameter(f"No input files found in {', '.join(filepaths)}", param_hint="FILEPATHS")
+    metrics = get_metrics()
+    metrics.reset()
 
-    onto = setup_ontology(config)
+    with metrics.timer("ontology"):
+        onto = setup_ontology(config)
     db, collection = setup_database(config)
-    
-    data = parse_file(filepath)
+    target = collection
+    if backend == 'timeseries':
+        target = setup_timeseries_collection(db, config)
+    if config['AUTO_INDEX'] and not config['DEBUG_MODE']:
+        ensure_indexes(target, config)
+        if config['ROLLUPS']:
+            setup_rollup_collections(db, config)
+
+    # Mappings cover the fields of every file, from the first record of each
+    first_record = {}
+    for filepath in files:
+        try:
+            first_record.update(next(iter_records(filepath), {}))
+        except ValueError:
+            continue
     document_factory = DocumentFactory(config)
 
     try:
         if config['DEBUG_MODE']:
-            print_samples(data=data[:100], document_factory=document_factory, config=config)
-            mappings = document_factory.create_mappings(config['DEVICE'], record_data=data,
+            data = metrics.timed(iter_records(files[0]), "parse", "records")
+            print_samples(data=islice(data, 100), document_factory=document_factory, config=config)
+            mappings = document_factory.create_mappings(config['DEVICE'], record_data=first_record,
                                         database=db, ontology=onto)
             document_factory.print_mappings(mappings)
         else:
-            upload_samples(data=data, document_factory=document_factory, config=config)
-            mappings = document_factory.create_mappings(config['DEVICE'], record_data=data,
-                                        database=db, ontology=onto)
-            upload_mappings(mappings, config)
+            report = ingest_files(files, config, db, collection, document_factory, resume)
+            if len(files) > 1:
+                print(f"{len(files)} files: {report.summary()}")
+            else:
+                print(report.summary())
+            for error in report.errors:
+                print(f"Error uploading sample: {error}")
+            with metrics.timer("mapping"):
+                mappings = document_factory.create_mappings(config['DEVICE'], record_data=first_record,
+                                            database=db, ontology=onto)
+                upload_mappings(mappings, config)
+            print(metrics.summary())
     finally:
-        db.client.close()
+        close_client()
+        if config['METRICS_FILE']:
+            metrics.export(config['METRICS_FILE'])
+            print(f"Metrics written to {config['METRICS_FILE']}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,295 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
+
+# Upper bounds in seconds of the write latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prefix of every exported metric name
+PREFIX = "mondu"
+
+# Items a per-record loop counts locally before adding them to the shared counters
+FLUSH_ITEMS = 1000
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+def _key(name: str, labels: Dict[str, Any]) -> LabelKey:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+class Histogram:
+    """
+    Cumulative-bucket histogram of observed values, as exported by Prometheus.
+    """
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        Initialize the Histogram.
+
+        :param bounds: Increasing upper bounds of the buckets; an implicit +Inf bucket follows
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """
+        Record one observation.
+
+        :param value: Observed value
+        """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile as the upper bound of the bucket containing it.
+
+        :param q: Quantile between 0 and 1
+        :return: Estimated value, or 0.0 without observations
+        """
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"bounds": list(self.bounds), "counts": list(self.counts), "sum": self.total, "count": self.count}
+
+    def merge(self, other: Dict[str, Any]):
+        """
+        Add the observations of a histogram exported with to_dict.
+
+        :param other: Exported histogram with the same bounds
+        """
+        self.counts = [a + b for a, b in zip(self.counts, other['counts'])]
+        self.total += other['sum']
+        self.count += other['count']
+
+class Metrics:
+    """
+    Counters, per-stage timers and histograms of an ingest run.
+
+    Counters and histograms are identified by a name and optional labels, such
+    as errors by stage and exception type. Stage time is kept as the labelled
+    counter stage_seconds so every stage is exported the same way. Updates are
+    thread-safe, as writes may run on several threads.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters: Dict[LabelKey, float] = {}
+        self.histograms: Dict[LabelKey, Histogram] = {}
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """
+        Clear all counters and histograms.
+        """
+        self.__init__()
+
+    def count(self, name: str, value: float = 1, **labels):
+        """
+        Increase a counter.
+
+        :param name: Counter name
+        :param value: Amount to add
+        :param labels: Labels of the counter
+        """
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def error(self, stage: str, error: Any):
+        """
+        Count an error of a stage by its type.
+
+        :param stage: Stage the error occurred in
+        :param error: Exception, or the name of the error type
+        """
+        self.count("errors", stage=stage, type=error if isinstance(error, str) else type(error).__name__)
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Record a value in a histogram.
+
+        :param name: Histogram name
+        :param value: Observed value
+        :param labels: Labels of the histogram
+        """
+        key = _key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Add the time spent in a block to a stage.
+
+        :param stage: Stage name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.count("stage_seconds", time.perf_counter() - start, stage=stage)
+
+    def timed(self, items: Iterable[Any], stage: str, counter: str) -> Iterator[Any]:
+        """
+        Time the production of each item of a lazy iterable and count the items.
+
+        Only the time spent inside the iterable is added to the stage, not the
+        time the consumer spends between items. Time and count are summed locally
+        and added to the counters every FLUSH_ITEMS items and when iteration ends.
+
+        :param items: Iterable to wrap
+        :param stage: Stage the production time is added to
+        :param counter: Counter increased for each item
+        :yield: Items of the iterable
+        """
+        iterator = iter(items)
+        seconds, n_items = 0.0, 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    seconds += time.perf_counter() - start
+                    return
+                seconds += time.perf_counter() - start
+                n_items += 1
+                if n_items >= FLUSH_ITEMS:
+                    self.count("stage_seconds", seconds, stage=stage)
+                    self.count(counter, n_items)
+                    seconds, n_items = 0.0, 0
+                yield item
+        finally:
+            self.count("stage_seconds", seconds, stage=stage)
+            if n_items:
+                self.count(counter, n_items)
+
+    def get(self, name: str, **labels) -> float:
+        """
+        :return: Value of a counter, 0 if it was never increased
+        """
+        return self.counters.get(_key(name, labels), 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Export every metric to JSON-serializable form.
+
+        :return: Dictionary with the run start time, counters and histograms
+        """
+        return {
+            "started": self.started,
+            "elapsed": time.time() - self.started,
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(self.counters.items())],
+            "histograms": [{"name": name, "labels": dict(labels), **histogram.to_dict()}
+                           for (name, labels), histogram in sorted(self.histograms.items())]
+        }
+
+    def merge(self, other: Dict[str, Any]):
+        """
+        Add metrics exported with to_dict, such as those of a worker process.
+
+        :param other: Exported metrics
+        """
+        for counter in other['counters']:
+            self.count(counter['name'], counter['value'], **counter['labels'])
+        for exported in other['histograms']:
+            key = _key(exported['name'], exported['labels'])
+            with self.lock:
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(tuple(exported['bounds']))
+                self.histograms[key].merge(exported)
+
+    def summary(self) -> str:
+        """
+        Human-readable summary of stage times, counts, errors and write latency.
+
+        :return: Multi-line summary
+        """
+        lines = [f"Ingest run: {time.time() - self.started:.2f}s"]
+        stages = [(dict(labels)['stage'], value) for (name, labels), value in self.counters.items()
+                  if name == "stage_seconds"]
+        for stage, seconds in sorted(stages, key=lambda item: item[1], reverse=True):
+            lines.append(f"  {stage:<16} {seconds:>9.2f}s")
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in ("stage_seconds", "errors") and not labels:
+                lines.append(f"  {name:<16} {value:>10,.0f}")
+        for (name, labels), value in sorted(self.counters.items()):
+            if name == "errors":
+                labels = dict(labels)
+                lines.append(f"  errors           {value:>10,.0f} in {labels['stage']} ({labels['type']})")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            lines.append(f"  {name}{_format_labels(labels)}: {histogram.count} observations, p50 <= {histogram.quantile(0.5)}s, "
+                         f"p99 <= {histogram.quantile(0.99)}s, mean {histogram.total / max(histogram.count, 1):.4f}s")
+        return "\n".join(lines)
+
+    def to_prometheus(self) -> str:
+        """
+        Export every metric in the Prometheus text exposition format.
+
+        :return: Exposition text
+        """
+        lines: List[str] = []
+        names = sorted({name for name, _ in self.counters})
+        for name in names:
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            for (counter_name, labels), value in sorted(self.counters.items()):
+                if counter_name == name:
+                    lines.append(f"{PREFIX}_{name}_total{_format_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {PREFIX}_{name} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f"{PREFIX}_{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{PREFIX}_{name}_sum{_format_labels(labels)} {histogram.total}")
+            lines.append(f"{PREFIX}_{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, file_path: str):
+        """
+        Write the metrics to a file, as JSON for a .json path and Prometheus text otherwise.
+
+        :param file_path: Destination path
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        with open(file_path, 'w') as file:
+            if file_path.endswith(".json"):
+                json.dump(self.to_dict(), file, indent=2)
+            else:
+                file.write(self.to_prometheus())
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (label + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for label, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+# Metrics of the ingest run in this process
+_metrics = Metrics()
+
+def get_metrics() -> Metrics:
+    """
+    Get the process-wide metrics registry.
+
+    :return: Shared Metrics
+    """
+    return _metrics
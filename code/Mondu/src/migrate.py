@@ -0,0 +1,123 @@
+import time
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+import click
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from tqdm import tqdm
+
+from src.config import load_config
+from src.db_utils import get_client, close_client
+from src.sample_processor import UploadReport, batched, written_items
+from src.timeseries import bucket_to_timeseries, setup_timeseries_collection
+
+def migrate_buckets(source, target, batch_size: int, query: Optional[Dict[str, Any]] = None,
+                    state=None) -> UploadReport:
+    """
+    Copy the measurements of bucket documents into a time-series collection.
+
+    The source collection is left untouched, so the migration can be checked
+    before the bucket documents are dropped. Buckets without timestamped
+    measurements are skipped.
+
+    With a state collection, the number of measurements of each bucket copied
+    to the target is recorded once all of them are inserted, and later runs only
+    copy the measurements appended since, so running the migration again does
+    not duplicate them. The measurements of a bucket with a failed insert, or
+    of a run stopped between an insert and its record, are copied again.
+
+    :param source: Collection of bucket documents
+    :param target: Time-series collection object
+    :param batch_size: Maximum number of documents per insert_many call
+    :param query: Optional filter selecting the buckets to migrate
+    :param state: Optional collection recording the migrated measurements of each bucket
+    :return: UploadReport of the migration
+    """
+    report = UploadReport()
+    start = time.perf_counter()
+    migrated = {}
+    if state is not None:
+        migrated = {record['_id']['bucket']: record['n_measurements']
+                    for record in state.find({"_id.source": source.name, "_id.target": target.name})}
+    # Bucket _id -> [documents not yet inserted, whether one failed, measurements once migrated]
+    pending: Dict[Any, List[Any]] = {}
+
+    def documents() -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        for bucket in source.find(query or {}, batch_size=max(1, batch_size // 100)):
+            measurements = bucket.get('measurements', [])
+            done = migrated.get(bucket['_id'], 0)
+            if len(measurements) <= done:
+                continue
+            bucket_documents = list(bucket_to_timeseries({**bucket, "measurements": measurements[done:]}))
+            if bucket_documents:
+                pending[bucket['_id']] = [len(bucket_documents), False, len(measurements)]
+            for document in bucket_documents:
+                yield bucket['_id'], document
+
+    for batch_num, batch in enumerate(tqdm(batched(documents(), batch_size))):
+        errors = []
+        try:
+            target.insert_many([document for _, document in batch], ordered=False)
+        except BulkWriteError as e:
+            errors = [{"batch": batch_num, "index": error.get('index'),
+                       "code": error.get('code'), "errmsg": error.get('errmsg')}
+                      for error in e.details.get('writeErrors', [])]
+        except PyMongoError as e:
+            errors = [{"batch": batch_num, "index": None, "errmsg": str(e)}]
+        written = written_items(batch, errors)
+        report.n_ops += len(written)
+        report.errors.extend(errors)
+        report.n_batches += 1
+
+        written_ids = {id(document) for _, document in written}
+        completed = []
+        for bucket_id, document in batch:
+            progress = pending[bucket_id]
+            progress[0] -= 1
+            progress[1] = progress[1] or id(document) not in written_ids
+            if progress[0] == 0:
+                if not progress[1]:
+                    completed.append((bucket_id, progress[2]))
+                del pending[bucket_id]
+        if state is not None and completed:
+            state.bulk_write([UpdateOne({"_id": {"source": source.name, "target": target.name, "bucket": bucket_id}},
+                                        {"$set": {"n_measurements": n_measurements}}, upsert=True)
+                              for bucket_id, n_measurements in completed], ordered=False)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+@click.command()
+@click.option("-db", "--database", help="Database holding both collections.", default='COPH')
+@click.option("-c", "--collection", help="Collection of bucket documents to migrate.", default='measurements')
+@click.option("-t", "--target", help="Time-series collection to create or fill (default TIMESERIES_COLLECTION).",
+              default=None)
+@click.option("-d", "--device", help="Only migrate the buckets of this device.", default=None)
+@click.option("-b", "--batch_size", type=int, default=1000, help="Documents per insert.")
+def main(database: str, collection: str, target: str, device: str, batch_size: int):
+    """
+    Migrate bucket documents to a MongoDB time-series collection.
+
+    Progress is kept in MIGRATION_STATE_COLLECTION, so running the command
+    again only copies the measurements added to the buckets since.
+
+    :param database: Database holding both collections
+    :param collection: Collection of bucket documents
+    :param target: Name of the time-series collection
+    :param device: Optional device whose buckets are migrated
+    :param batch_size: Number of documents per insert
+    """
+    config = load_config()
+    config['TIMESERIES_COLLECTION'] = target or config['TIMESERIES_COLLECTION']
+    query = {"device_id": config['devices'][device.lower()]} if device else None
+    try:
+        db = get_client(config)[database]
+        report = migrate_buckets(db[collection], setup_timeseries_collection(db, config), batch_size, query,
+                                 db[config['MIGRATION_STATE_COLLECTION']])
+        print(report.summary())
+        for error in report.errors:
+            print(f"Error migrating measurement: {error}")
+    finally:
+        close_client()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Union
 import mongoengine as me
+import numpy as np
+
+from src.summaries import block_summary_update
 
 # Type aliases for clarity
 DeviceID = str
@@ -20,6 +23,93 @@ class Measurement:
     value: float
     risk_score: Optional[int] = None
 
+class MeasurementBlock:
+    """
+    Compact, array-backed sequence of measurements.
+
+    Timestamps are stored as int64 milliseconds since the epoch and values as
+    float64, with optional float64 risk scores (NaN where a measurement has none).
+    Indexing with a slice or boolean mask returns a new block over the selection.
+
+    :param timestamps: Array-like of int64 epoch milliseconds or datetime64 values
+    :param values: Array-like of numeric values
+    :param risk_scores: Optional array-like of risk scores
+    """
+    __slots__ = ('timestamps', 'values', 'risk_scores')
+
+    def __init__(self, timestamps, values, risk_scores=None):
+        timestamps = np.asarray(timestamps)
+        if np.issubdtype(timestamps.dtype, np.datetime64):
+            timestamps = timestamps.astype('datetime64[ms]').astype(np.int64)
+        self.timestamps = timestamps.astype(np.int64, copy=False)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.risk_scores = None if risk_scores is None else np.asarray(risk_scores, dtype=np.float64)
+        if len(self.timestamps) != len(self.values):
+            raise ValueError("timestamps and values must have the same length")
+
+    @classmethod
+    def from_measurements(cls, measurements: List[Measurement]) -> 'MeasurementBlock':
+        """
+        Build a block from Measurement objects.
+
+        :param measurements: List of measurements with numeric values
+        :return: MeasurementBlock holding the same data
+        """
+        risk_scores = None
+        if any(m.risk_score is not None for m in measurements):
+            risk_scores = [np.nan if m.risk_score is None else m.risk_score for m in measurements]
+        return cls(np.array([m.timestamp for m in measurements], dtype='datetime64[ms]'),
+                   [m.value for m in measurements], risk_scores)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, index) -> Union['MeasurementBlock', Measurement]:
+        if isinstance(index, (int, np.integer)):
+            return self._measurement(int(index))
+        return MeasurementBlock(self.timestamps[index], self.values[index],
+                                None if self.risk_scores is None else self.risk_scores[index])
+
+    def __iter__(self) -> Iterator[Measurement]:
+        for index in range(len(self)):
+            yield self._measurement(index)
+
+    def _measurement(self, index: int) -> Measurement:
+        risk_score = None
+        if self.risk_scores is not None and not np.isnan(self.risk_scores[index]):
+            risk_score = int(self.risk_scores[index])
+        return Measurement(timestamp=self.timestamps[index].astype('datetime64[ms]').item(),
+                           value=self.values[index].item(), risk_score=risk_score)
+
+    def datetimes(self) -> List[datetime]:
+        """
+        :return: Timestamps as a list of naive datetime objects
+        """
+        return self.timestamps.astype('datetime64[ms]').tolist()
+
+    def to_bucket_update(self, field_name: str = 'measurements') -> Dict[str, Any]:
+        """
+        Serialize the block to the update document of a bucket upsert.
+
+        :param field_name: Array field of the bucket the measurements are pushed to
+        :return: Update with $push/$each of the measurements, $min/$max of first/last, $inc of n_samples
+                 and the summary operators of the values
+        """
+        timestamps = self.datetimes()
+        measurements = [{'timestamp': timestamp, 'value': value}
+                        for timestamp, value in zip(timestamps, self.values.tolist())]
+        if self.risk_scores is not None:
+            for measurement, risk_score in zip(measurements, self.risk_scores.tolist()):
+                if risk_score == risk_score:
+                    measurement['risk_score'] = int(risk_score)
+        summary = block_summary_update(self.values)
+        return {
+            "$push": {field_name: {"$each": measurements}},
+            "$min": {"first": min(timestamps), **summary.get("$min", {})},
+            "$max": {"last": max(timestamps), **summary.get("$max", {})},
+            "$inc": {"n_samples": len(measurements), **summary.get("$inc", {})}
+        }
+
 @dataclass
 class Document:
     """
@@ -31,8 +121,9 @@ class Document:
     :param period: Sampling period
     :param day: Date of the measurements
     :param valueuom: Unit of measurement
-    :param measurements: List of measurements
+    :param measurements: List of measurements or a MeasurementBlock
     :param summaries: Optional dictionary of summary data
+    :param context: Optional dictionary of fields identifying the bucket alongside the type
     """
     user_id: UserID
     type: str
@@ -40,8 +131,9 @@ class Document:
     period: str
     day: datetime
     valueuom: str
-    measurements: List[Measurement]
+    measurements: Union[List[Measurement], MeasurementBlock]
     summaries: Dict[str, Any] = field(default_factory=dict)
+    context: Dict[str, Any] = field(default_factory=dict)
 
 class Metadata(me.Document):
     """
@@ -0,0 +1,159 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.config import load_config
+
+FIELD_LIST = "iri,label,ontology_name,description"
+
+# Clients already created in this process, keyed by cache file
+_clients: Dict[str, 'OLSClient'] = {}
+
+class OLSCache:
+    """
+    Persistent SQLite cache of OLS search responses with TTL and size-based eviction.
+    """
+
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        """
+        Initialize the OLSCache.
+
+        :param path: Path of the SQLite cache file
+        :param ttl: Seconds a cached response stays valid
+        :param max_bytes: Total size of cached responses above which the least recently used are evicted
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                               key TEXT PRIMARY KEY, response TEXT, size INTEGER,
+                               created REAL, last_used REAL)""")
+        self.db.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Get a cached response that has not expired.
+
+        :param key: Cache key
+        :return: Decoded response, or None if absent or expired
+        """
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.db.commit()
+                return None
+            self.db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.db.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, response: Any):
+        """
+        Store a response and evict expired or least recently used entries as needed.
+
+        :param key: Cache key
+        :param response: JSON-serializable response
+        """
+        now = time.time()
+        encoded = json.dumps(response)
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                            (key, encoded, len(encoded), now, now))
+            self.db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                for old_key, size in self.db.execute(
+                        "SELECT key, size FROM responses ORDER BY last_used").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self.db.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                    total -= size
+            self.db.commit()
+
+class OLSClient:
+    """
+    Client for the EBI OLS search API with a pooled HTTP session and a response cache.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Initialize the OLSClient.
+
+        :param config: Configuration dictionary
+        """
+        self.url = config['OLS_URL']
+        self.timeout = config['OLS_TIMEOUT']
+        self.workers = config['OLS_WORKERS']
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.cache = OLSCache(os.path.expanduser(config['OLS_CACHE_FILE']),
+                              config['OLS_CACHE_TTL'], config['OLS_CACHE_MAX_BYTES'])
+
+    def search(self, query: str, exact: bool = True, query_fields: str = "label,synonym") -> List[Dict[str, Any]]:
+        """
+        Search OLS, answering from the cache when possible.
+
+        :param query: Text to search for
+        :param exact: Whether to only return exact matches
+        :param query_fields: Comma-separated OLS fields to query on
+        :return: List of result documents with iri, label, ontology_name and description
+        :raises requests.RequestException: If the OLS search request fails
+        """
+        params = {"q": query, "queryFields": query_fields, "fieldList": FIELD_LIST}
+        if exact:
+            params["exact"] = "true"
+        key = json.dumps(params, sort_keys=True)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        response = self.session.get(self.url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        docs = response.json()['response']['docs']
+        self.cache.put(key, docs)
+        return docs
+
+    def search_many(self, queries: List[str], **options) -> Dict[str, Any]:
+        """
+        Resolve many queries concurrently.
+
+        :param queries: Texts to search for
+        :param options: Search options passed to search
+        :return: Dictionary of query to its result documents, or to the exception it raised
+        """
+        def search_one(query: str):
+            try:
+                return self.search(query, **options)
+            except requests.RequestException as e:
+                return e
+
+        unique_queries = list(dict.fromkeys(queries))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return dict(zip(unique_queries, executor.map(search_one, unique_queries)))
+
+def get_ols_client(config: Optional[Dict[str, Any]] = None) -> OLSClient:
+    """
+    Get the process-wide OLS client for a configuration.
+
+    :param config: Configuration dictionary, loaded with load_config if omitted
+    :return: Shared OLSClient
+    """
+    config = config or load_config()
+    cache_file = os.path.expanduser(config['OLS_CACHE_FILE'])
+    if cache_file not in _clients:
+        _clients[cache_file] = OLSClient(config)
+    return _clients[cache_file]
@@ -0,0 +1,170 @@
+import os
+import pickle
+import re
+import tempfile
+from collections import Counter, namedtuple
+from typing import Dict, Any, List, Tuple
+
+import owlready2 as owl
+
+# Annotation properties whose values are indexed as synonyms of a term
+SYNONYM_PROPERTIES = ("hasExactSynonym", "hasRelatedSynonym", "hasBroadSynonym", "hasNarrowSynonym",
+                      "synonym", "altLabel", "prefLabel")
+
+# Score weight of a match by the kind of text it matched
+TEXT_WEIGHTS = {
+    "label": 1.0,
+    "synonym": 0.9,
+    "comment": 0.5
+}
+
+IndexedTerm = namedtuple("IndexedTerm", ["label", "iri", "score"])
+
+# Indexes already loaded in this process, keyed by quadstore file
+_loaded_indexes: Dict[str, 'OntologyIndex'] = {}
+
+def normalize(text: str) -> str:
+    """
+    Lower-case a text and reduce it to space-separated alphanumeric tokens.
+
+    :param text: Text to normalize
+    :return: Normalized text
+    """
+    return " ".join(re.findall(r"[a-z0-9]+", str(text).lower()))
+
+def trigrams(text: str) -> set:
+    """
+    Character trigrams of a normalized text, padded so word boundaries count.
+
+    :param text: Normalized text
+    :return: Set of trigrams
+    """
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class OntologyIndex:
+    """
+    In-memory trigram index over the labels, synonyms and comments of ontology terms.
+    """
+
+    def __init__(self, terms: List[Tuple[str, str]], texts: List[Tuple[int, str, float]]):
+        """
+        Initialize the OntologyIndex.
+
+        :param terms: List of (label, iri) for each indexed term
+        :param texts: List of (term number, normalized text, weight) for each indexed text
+        """
+        self.terms = terms
+        self.texts = texts
+        self.text_sizes = [len(trigrams(text)) for _, text, _ in texts]
+        self.postings: Dict[str, List[int]] = {}
+        for text_id, (_, text, _) in enumerate(texts):
+            for gram in trigrams(text):
+                self.postings.setdefault(gram, []).append(text_id)
+
+    @classmethod
+    def from_ontology(cls, ontology: owl.Ontology) -> 'OntologyIndex':
+        """
+        Build the index from the classes, individuals and properties of an ontology.
+
+        :param ontology: Owlready2 ontology object
+        :return: OntologyIndex of the ontology's terms
+        """
+        synonym_properties = [prop for prop in ontology.world.annotation_properties()
+                              if prop.name in SYNONYM_PROPERTIES]
+        terms, texts = [], []
+        entities = list(ontology.classes()) + list(ontology.individuals()) + list(ontology.properties())
+        for entity in entities:
+            labels = [str(label) for label in entity.label] or [entity.name]
+            term_id = len(terms)
+            terms.append((labels[0], entity.iri))
+            kinds = [("label", labels), ("comment", owl.comment[entity])]
+            kinds += [("synonym", prop[entity]) for prop in synonym_properties]
+            for kind, values in kinds:
+                for value in values:
+                    if normalize(value):
+                        texts.append((term_id, normalize(value), TEXT_WEIGHTS[kind]))
+        return cls(terms, texts)
+
+    def search(self, query: str, limit: int = 10, min_score: float = 0.3) -> List[IndexedTerm]:
+        """
+        Rank the terms matching a free-text query.
+
+        Scores are the trigram Dice similarity times the weight of the matched text,
+        plus a bonus when the query is contained in it (or equals it). Terms with a
+        text containing the query, which a wildcard search would find, are kept
+        whatever their score and ranked before the other terms.
+
+        :param query: Text to search for
+        :param limit: Maximum number of results
+        :param min_score: Minimum score of a result that does not contain the query
+        :return: List of IndexedTerm, best match first
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        query_grams = trigrams(query)
+        overlaps = Counter()
+        for gram in query_grams:
+            overlaps.update(self.postings.get(gram, ()))
+
+        # Term number -> (whether a text contains the query, best score)
+        matches: Dict[int, Tuple[bool, float]] = {}
+        for text_id, overlap in overlaps.items():
+            term_id, text, weight = self.texts[text_id]
+            score = weight * 2 * overlap / (len(query_grams) + self.text_sizes[text_id])
+            contained = query in text
+            if contained:
+                score += weight * (1.0 if query == text else 0.5)
+            if (contained or score >= min_score) and (contained, score) > matches.get(term_id, (False, 0.0)):
+                matches[term_id] = (contained, score)
+
+        ranked = sorted(matches.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [IndexedTerm(*self.terms[term_id], score) for term_id, (_, score) in ranked]
+
+def get_ontology_index(ontology: owl.Ontology) -> OntologyIndex:
+    """
+    Get the term index of an ontology, building it at most once per ontology version.
+
+    For ontologies backed by a cached quadstore file (see setup_ontology) the index
+    is pickled next to that file, so it shares the quadstore's version key.
+
+    :param ontology: Owlready2 ontology object
+    :return: OntologyIndex of the ontology's terms
+    """
+    filename = ontology.world.filename
+    if filename in _loaded_indexes:
+        return _loaded_indexes[filename]
+
+    persistent = bool(filename) and filename != ":memory:" and os.path.isfile(filename)
+    index_file = os.path.splitext(filename)[0] + ".index.pickle" if persistent else None
+    index = None
+    if index_file and os.path.exists(index_file):
+        try:
+            with open(index_file, 'rb') as file:
+                index = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            index = None
+    if index is None:
+        index = OntologyIndex.from_ontology(ontology)
+        if index_file:
+            _save_index(index, index_file)
+
+    _loaded_indexes[filename] = index
+    return index
+
+def _save_index(index: OntologyIndex, index_file: str):
+    """
+    Atomically write a pickled index.
+
+    :param index: Index to save
+    :param index_file: Destination path
+    """
+    file_descriptor, temp_file = tempfile.mkstemp(dir=os.path.dirname(index_file), suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, index_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
@@ -1,34 +1,115 @@
+import glob
+import hashlib
+import os
 import owlready2 as owl
+import requests
 import tempfile
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+
+from src.ols_client import OLSClient, get_ols_client
+from src.ontology_index import OntologyIndex, get_ontology_index
+
+ONTOLOGY_EXTENSIONS = ("", ".owl", ".rdf", ".xml", ".nt", ".ntriples")
 
 def setup_ontology(config: Dict[str, Any]) -> owl.Ontology:
     """
     Set up the ontology based on the configuration.
 
+    The parsed quadstore is cached under config['ONTO_CACHE_DIR'], keyed by the IRI
+    and a hash of the ontology file, and opened read-only so runs and processes
+    can share it. It is rebuilt when the ontology file changes.
+
     :param config: Configuration dictionary
     :return: Loaded ontology object
     """
-    owl.onto_path.append(config['ONTO_PATH'])
-    world = owl.default_world
-    with tempfile.NamedTemporaryFile(mode='w+b', delete=False) as temp_file:
-        world.set_backend(filename=temp_file.name)
-        onto = world.get_ontology(config['COPH_IRI']).load()
-    return onto
+    if config['ONTO_PATH'] not in owl.onto_path:
+        owl.onto_path.append(config['ONTO_PATH'])
+    cache_file = ontology_cache_file(config)
+    if not os.path.exists(cache_file):
+        build_ontology_cache(config, cache_file)
+    world = owl.World(filename=cache_file, read_only=True, exclusive=False)
+    return world.get_ontology(config['COPH_IRI']).load()
+
+def find_ontology_file(config: Dict[str, Any]) -> Optional[str]:
+    """
+    Locate the local file owlready2 will load the ontology IRI from.
+
+    :param config: Configuration dictionary
+    :return: Path to the ontology file, or None if it will be fetched from the IRI
+    """
+    if config.get('ONTO_FILE'):
+        return config['ONTO_FILE']
+    name = config['COPH_IRI'].rstrip('/#').rpartition('/')[-1]
+    for directory in owl.onto_path:
+        for extension in ONTOLOGY_EXTENSIONS:
+            candidate = os.path.join(directory, name + extension)
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+def ontology_cache_file(config: Dict[str, Any]) -> str:
+    """
+    Path of the cached quadstore for the configured ontology IRI and file contents.
+
+    :param config: Configuration dictionary
+    :return: Path to the SQLite quadstore file
+    """
+    iri_key = hashlib.sha256(config['COPH_IRI'].encode()).hexdigest()[:16]
+    content_hash = hashlib.sha256(config['COPH_IRI'].encode())
+    ontology_file = find_ontology_file(config)
+    if ontology_file:
+        with open(ontology_file, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                content_hash.update(block)
+    return os.path.join(os.path.expanduser(config['ONTO_CACHE_DIR']),
+                        f"{iri_key}-{content_hash.hexdigest()[:16]}.sqlite3")
 
-def search_coph_ontology(onto_fields: List[str], ontology: owl.Ontology) -> Dict[str, Any]:
+def build_ontology_cache(config: Dict[str, Any], cache_file: str):
+    """
+    Parse the ontology into a new quadstore file and evict older versions of it.
+
+    The quadstore is written to a temporary file and renamed into place, so
+    concurrent builders never expose a partial cache.
+
+    :param config: Configuration dictionary
+    :param cache_file: Path returned by ontology_cache_file
+    """
+    cache_dir = os.path.dirname(cache_file)
+    os.makedirs(cache_dir, exist_ok=True)
+    file_descriptor, temp_file = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    os.close(file_descriptor)
+    try:
+        world = owl.World(filename=temp_file)
+        world.get_ontology(config['COPH_IRI']).load()
+        world.save()
+        world.close()
+        os.replace(temp_file, cache_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+    # Drop older quadstores of this IRI along with the term indexes built from them
+    iri_key = os.path.basename(cache_file).partition('-')[0]
+    for stale_file in glob.glob(os.path.join(cache_dir, f"{iri_key}-*")):
+        if stale_file != cache_file:
+            os.remove(stale_file)
+
+def search_coph_ontology(onto_fields: List[str], ontology: owl.Ontology,
+                         index: Optional[OntologyIndex] = None) -> Dict[str, Any]:
     """
     Search COPH ontology for suitable terms.
 
     :param onto_fields: List of fields to search for
     :param ontology: Owlready2 ontology object
+    :param index: Optional prebuilt term index, by default the ontology's cached index
     :return: Dictionary of new mappings
     """
+    index = index or get_ontology_index(ontology)
     new_mappings = {}
     for field in onto_fields:
         query = input(f"Type an alternative term to search for {field}, or leave blank to use field name: ") or field
-        onto_result = ontology.search(label=f"*{query}*") or ontology.search(comment=f"*{query}*")
-        
+        onto_result = index.search(query)
+
         if onto_result:
             print(f"Resulting option(s) for '{query}' is/are:\n")
             for num, result in enumerate(onto_result):
@@ -36,65 +117,66 @@ def search_coph_ontology(onto_fields: List[str], ontology: owl.Ontology) -> Dict
             chosen_match = input("Please type the number of the chosen response (empty implies none): ")
             if chosen_match:
                 mapping_choice = onto_result[int(chosen_match)]
-                new_mappings[mapping_choice.label[0]] = mapping_choice.iri
+                new_mappings[mapping_choice.label] = mapping_choice.iri
         else:
             print("No suitable option was found")
             new_mappings.update(prompt_manual_mapping(field))
     
     return new_mappings
 
-def search_ols(onto_fields: List[str], ontology: owl.Ontology) -> Dict[str, Any]:
+def search_ols(onto_fields: List[str], ontology: owl.Ontology, client: Optional[OLSClient] = None) -> Dict[str, Any]:
     """
     Search OLS (Ontology Lookup Service) for suitable terms.
 
+    The default searches of all fields are resolved concurrently up front, so the
+    interactive prompts are answered from the cache.
+
     :param onto_fields: List of fields to search for
     :param ontology: Owlready2 ontology object
+    :param client: Optional OLS client, by default the shared one
     :return: Dictionary of new mappings
     """
+    client = client or get_ols_client()
+    client.search_many(onto_fields)
     new_mappings = {}
     for field in onto_fields:
-        new_mapping = ols_search(field=field, ontology=ontology)
+        new_mapping = ols_search(field=field, ontology=ontology, client=client)
         new_mappings[new_mapping[field]] = new_mapping[field]
     return new_mappings
 
-def ols_search(field: str, ontology: owl.Ontology) -> Dict[str, str]:
+def ols_search(field: str, ontology: owl.Ontology, client: Optional[OLSClient] = None) -> Dict[str, str]:
     """
     Perform an OLS search for a given field.
 
     :param field: Field to search for
     :param ontology: Owlready2 ontology object
+    :param client: Optional OLS client, by default the shared one
     :return: Dictionary containing the mapping for the field
-    :raises requests.RequestException: If the OLS search request fails
     """
+    client = client or get_ols_client()
     print("\nField: "+field)
     query = input("Type an alternative term to search for, or leave blank to use field name: ") or field
     
-    url_queries = []
-    if input("\nWould you like to filter to exact matches? [Y/n]").lower() not in ('n', 'no'):
-        url_queries.append("exact=true")
+    exact = input("\nWould you like to filter to exact matches? [Y/n]").lower() not in ('n', 'no')
     
     query_field_query = input("\nWhat would you like to query on?: \n  1) Label\n  2) Synonym\n  3) Both\nOption: ")
     if query_field_query == "1":
-        url_queries.append("queryFields=label")
+        query_fields = "label"
     elif query_field_query == "2":
-        url_queries.append("queryFields=synonym")
+        query_fields = "synonym"
     else:
-        url_queries.append("queryFields=label,synonym")
-    
-    api_url = f"https://www.ebi.ac.uk/ols/api/search?q={query}&{'&'.join(url_queries)}&fieldList=iri,label,ontology_name,description"
+        query_fields = "label,synonym"
     
     try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        options = response.json()
+        docs = client.search(query, exact=exact, query_fields=query_fields)
 
         print("\nHere are the first 10 results:")
-        for num, result in enumerate(options['response']['docs'][:10]):
+        for num, result in enumerate(docs[:10]):
             print(f"{num}) IRI: {result['iri']}\n   label: {result['label']}\n   ontology: {result['ontology_name']}\n   Description: {result['description']}\n")
         
         selected_mapping = input("Please choose the number of the result you wish to use (leave blank for none): ")
         if selected_mapping and int(selected_mapping) < 10:
-            selected_result = options['response']['docs'][int(selected_mapping)]
+            selected_result = docs[int(selected_mapping)]
             if ontology.search(label=f"*{selected_result['label']}*") is None:
                 with ontology:
                     owl.types.new_class(selected_result['label'], (ontology['Thing'],))
@@ -0,0 +1,333 @@
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+import click
+import numpy as np
+import pymongo as pm
+from pymongo import UpdateOne
+
+from src.config import load_config
+from src.db_reader import measurement_arrays
+from src.db_utils import get_client, close_client
+from src.dedup import EPOCH, timestamp_key
+from src.metrics import get_metrics
+from src.summaries import SUMMARY_FIELD, summary_operators, summary_stats
+
+# Rollup resolutions, finest first, with their window length in milliseconds
+RESOLUTIONS = {
+    "minute": 60 * 1000,
+    "hour": 60 * 60 * 1000,
+    "day": 24 * 60 * 60 * 1000
+}
+
+# Fields identifying a rollup series
+SERIES_FIELDS = ("user_id", "device_id", "type")
+
+# Bucket field marking buckets whose measurements are rolled up as they are written.
+# It is part of the upsert filter of ROLLUP_DEVICES: "ingest" with config['ROLLUPS'],
+# null otherwise, so a bucket only ever receives measurements of one kind.
+ROLLUP_FIELD = "rollup"
+
+# Field of the other buckets counting the measurements catch_up has rolled up
+CAUGHT_UP_FIELD = "caught_up"
+
+def rollup_collection(db: pm.database.Database, config: Dict[str, Any], resolution: str) -> pm.collection.Collection:
+    """
+    Collection holding the rollup series of one resolution.
+
+    :param db: MongoDB database object
+    :param config: Configuration dictionary
+    :param resolution: Name of the resolution, a key of RESOLUTIONS
+    :return: MongoDB collection object
+    """
+    return db[f"{config['ROLLUP_PREFIX']}{resolution}"]
+
+def setup_rollup_collections(db: pm.database.Database, config: Dict[str, Any]):
+    """
+    Create the unique (user_id, device_id, type, start) index of every rollup collection.
+
+    :param db: MongoDB database object
+    :param config: Configuration dictionary
+    """
+    for resolution in config['ROLLUP_RESOLUTIONS']:
+        rollup_collection(db, config, resolution).create_index(
+            [(field, pm.ASCENDING) for field in (*SERIES_FIELDS, "start")], unique=True)
+
+def pushed_measurements(collection_dict: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Measurements pushed by a prepared bucket update.
+
+    :param collection_dict: Update document of a prepared sample
+    :return: List of pushed measurements, empty if the update pushes none
+    """
+    pushed = collection_dict.get('$push', {}).get('measurements')
+    if not isinstance(pushed, dict):
+        return []
+    return pushed['$each'] if '$each' in pushed else [pushed]
+
+def mark_rollup_buckets(samples: Iterable[Dict[str, Any]], config: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Add ROLLUP_FIELD to the bucket filters of a device in config['ROLLUP_DEVICES'].
+
+    With config['ROLLUPS'] the samples only go into buckets rolled up at ingest,
+    otherwise only into the buckets left to catch_up, so the two never mix.
+    Buckets written before the field existed have no value and count as null.
+
+    :param samples: Prepared samples for MongoDB insertion, after deduplication
+    :param config: Configuration dictionary
+    :yield: Prepared samples with the marked filter
+    """
+    if config['DEVICE'].lower() not in config['ROLLUP_DEVICES']:
+        yield from samples
+        return
+    mark = "ingest" if config['ROLLUPS'] else None
+    for sample in samples:
+        if pushed_measurements(sample['collection_dict']):
+            sample = {**sample, "sample_dict": {**sample['sample_dict'], ROLLUP_FIELD: mark}}
+        yield sample
+
+class RollupAccumulator:
+    """
+    Aggregates measurements into per-minute, per-hour and per-day windows and
+    upserts them into the rollup collections.
+
+    Each window holds the same count, sum, sum_sq, min and max summary as the
+    buckets, added with $inc/$min/$max, so windows flushed in several passes
+    combine exactly. At ingest, measurements are added once their write has
+    succeeded; a run that stops between a write and the following flush loses
+    the windows of those measurements.
+    """
+
+    def __init__(self, db: pm.database.Database, config: Dict[str, Any]):
+        """
+        Initialize the RollupAccumulator.
+
+        :param db: MongoDB database holding the rollup collections
+        :param config: Configuration dictionary
+        """
+        self.db = db
+        self.config = config
+        self.resolutions = config['ROLLUP_RESOLUTIONS']
+        self.windows: Dict[str, Dict[Tuple, List[float]]] = {resolution: {} for resolution in self.resolutions}
+        self.n_windows = 0
+
+    def add(self, series: Tuple, timestamps: np.ndarray, values: np.ndarray):
+        """
+        Add the points of one series.
+
+        :param series: Values of SERIES_FIELDS
+        :param timestamps: int64 epoch milliseconds
+        :param values: float64 values
+        """
+        if not len(values):
+            return
+        squares = values * values
+        for resolution in self.resolutions:
+            width = RESOLUTIONS[resolution]
+            starts, inverse = np.unique(timestamps // width * width, return_inverse=True)
+            counts = np.bincount(inverse)
+            totals = np.bincount(inverse, weights=values)
+            totals_sq = np.bincount(inverse, weights=squares)
+            minimums = np.full(len(starts), np.inf)
+            np.minimum.at(minimums, inverse, values)
+            maximums = np.full(len(starts), -np.inf)
+            np.maximum.at(maximums, inverse, values)
+
+            windows = self.windows[resolution]
+            for index, start in enumerate(starts.tolist()):
+                window = windows.get((series, start))
+                if window is None:
+                    windows[(series, start)] = [int(counts[index]), float(totals[index]), float(totals_sq[index]),
+                                                float(minimums[index]), float(maximums[index])]
+                    self.n_windows += 1
+                else:
+                    window[0] += int(counts[index])
+                    window[1] += float(totals[index])
+                    window[2] += float(totals_sq[index])
+                    window[3] = min(window[3], float(minimums[index]))
+                    window[4] = max(window[4], float(maximums[index]))
+
+    def add_measurements(self, fields: Dict[str, Any], measurements: Iterable[Dict[str, Any]]):
+        """
+        Add measurements of a bucket filter or stored bucket.
+
+        :param fields: Bucket fields, including SERIES_FIELDS and any frequency context
+        :param measurements: Measurement dictionaries
+        """
+        if not all(field in fields for field in SERIES_FIELDS):
+            return
+        series = tuple(fields[field] for field in SERIES_FIELDS)
+        self.add(series, *measurement_arrays(measurements, fields.get('frequency')))
+
+    def add_written(self, samples: Iterable[Dict[str, Any]]):
+        """
+        Add the measurements of prepared samples whose bucket upsert succeeded.
+
+        Windows are flushed whenever config['ROLLUP_FLUSH_WINDOWS'] are pending.
+
+        :param samples: Written samples, as passed to the on_written callback of the writers
+        """
+        for sample in samples:
+            self.add_measurements(sample['sample_dict'], pushed_measurements(sample['collection_dict']))
+        if self.n_windows >= self.config['ROLLUP_FLUSH_WINDOWS']:
+            self.flush()
+
+    def add_written_documents(self, documents: Iterable[Dict[str, Any]]):
+        """
+        Add time-series documents that were inserted.
+
+        :param documents: Inserted documents with timestamp, value and meta
+        """
+        by_series: Dict[Tuple, List[Dict[str, Any]]] = {}
+        for document in documents:
+            meta = document.get('meta', {})
+            by_series.setdefault(tuple(sorted(meta.items())), []).append(document)
+        for meta, series_documents in by_series.items():
+            self.add_measurements(dict(meta), series_documents)
+        if self.n_windows >= self.config['ROLLUP_FLUSH_WINDOWS']:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Upsert the pending windows.
+
+        :return: Number of windows written
+        """
+        n_windows = 0
+        with get_metrics().timer("rollup"):
+            for resolution, windows in self.windows.items():
+                if not windows:
+                    continue
+                operations = [
+                    UpdateOne({**dict(zip(SERIES_FIELDS, series)), "start": EPOCH + timedelta(milliseconds=start)},
+                              summary_operators(*window), upsert=True)
+                    for (series, start), window in windows.items()
+                ]
+                for offset in range(0, len(operations), self.config['BATCH_SIZE']):
+                    rollup_collection(self.db, self.config, resolution).bulk_write(
+                        operations[offset:offset + self.config['BATCH_SIZE']], ordered=False)
+                n_windows += len(operations)
+                windows.clear()
+        self.n_windows = 0
+        get_metrics().count("rollup_windows", n_windows)
+        return n_windows
+
+def rollup_accumulator(db: pm.database.Database, config: Dict[str, Any]) -> Optional[RollupAccumulator]:
+    """
+    Accumulator for ingest-time rollups of the configured device.
+
+    :param db: MongoDB database holding the rollup collections
+    :param config: Configuration dictionary
+    :return: RollupAccumulator, or None if rollups are disabled or the device is not rolled up
+    """
+    if not config['ROLLUPS'] or config['DEVICE'].lower() not in config['ROLLUP_DEVICES']:
+        return None
+    return RollupAccumulator(db, config)
+
+def catch_up(db: pm.database.Database, source: pm.collection.Collection, config: Dict[str, Any],
+             query: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Roll up the stored measurements that no rollup covers yet.
+
+    Only buckets written without ingest-time rollups are read (see
+    mark_rollup_buckets). Measurements are only ever appended to a bucket, so
+    each keeps in CAUGHT_UP_FIELD how many of its measurements are rolled up and
+    the rest are read from that position on. Buckets are first scanned without
+    their measurements; only those with more samples than they have caught up
+    are read in full. The count is raised after the windows are flushed, so an
+    interrupted job may count the measurements since its last flush twice, but
+    never skips any.
+
+    :param db: MongoDB database holding the rollup collections
+    :param source: Collection of bucket documents
+    :param config: Configuration dictionary
+    :param query: Optional filter narrowing the buckets, such as a device_id
+    :return: Number of windows written
+    """
+    devices = [config['devices'][device] for device in config['ROLLUP_DEVICES']]
+    query = {"device_id": {"$in": devices}, ROLLUP_FIELD: None, "n_samples": {"$gt": 0}, **(query or {})}
+    pending = [bucket['_id'] for bucket in source.find(query, {"n_samples": 1, CAUGHT_UP_FIELD: 1})
+               if bucket['n_samples'] > (bucket.get(CAUGHT_UP_FIELD) or 0)]
+
+    accumulator = RollupAccumulator(db, config)
+    covered: List[UpdateOne] = []
+    n_windows = 0
+
+    def flush() -> int:
+        written = accumulator.flush()
+        if covered:
+            source.bulk_write(covered, ordered=False)
+            covered.clear()
+        return written
+
+    for offset in range(0, len(pending), 100):
+        for bucket in source.find({"_id": {"$in": pending[offset:offset + 100]}}):
+            measurements = bucket.get('measurements', [])
+            accumulator.add_measurements(bucket, measurements[bucket.get(CAUGHT_UP_FIELD) or 0:])
+            covered.append(UpdateOne({"_id": bucket['_id']}, {"$max": {CAUGHT_UP_FIELD: len(measurements)}}))
+        if accumulator.n_windows >= config['ROLLUP_FLUSH_WINDOWS']:
+            n_windows += flush()
+    return n_windows + flush()
+
+def choose_resolution(start: datetime, end: datetime, max_points: int, resolutions: List[str]) -> str:
+    """
+    Finest resolution whose windows over a time range fit in a point budget.
+
+    :param start: Start of the range
+    :param end: End of the range (exclusive)
+    :param max_points: Maximum number of points to return
+    :param resolutions: Available resolutions, keys of RESOLUTIONS
+    :return: Name of the resolution, the coarsest available one if none fits
+    """
+    ordered = sorted(resolutions, key=RESOLUTIONS.get)
+    start_key, end_key = timestamp_key(start), timestamp_key(end)
+    for resolution in ordered:
+        width = RESOLUTIONS[resolution]
+        if end_key // width - start_key // width + 1 <= max_points:
+            return resolution
+    return ordered[-1]
+
+def read_rollup(db: pm.database.Database, config: Dict[str, Any], series: Dict[str, Any],
+                start: datetime, end: datetime, max_points: int) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Read a series over a time range at the resolution chosen by choose_resolution.
+
+    :param db: MongoDB database holding the rollup collections
+    :param config: Configuration dictionary
+    :param series: Values of SERIES_FIELDS
+    :param start: Start of the range
+    :param end: End of the range (exclusive)
+    :param max_points: Maximum number of points to return
+    :return: Tuple of (resolution, points with start, count, mean, std, min and max ordered by start)
+    """
+    resolution = choose_resolution(start, end, max_points, config['ROLLUP_RESOLUTIONS'])
+    width = RESOLUTIONS[resolution]
+    first = EPOCH + timedelta(milliseconds=timestamp_key(start) // width * width)
+    cursor = rollup_collection(db, config, resolution).find(
+        {**series, "start": {"$gte": first, "$lt": end}}).sort("start", pm.ASCENDING)
+    return resolution, [{"start": window['start'], **summary_stats(window.get(SUMMARY_FIELD))} for window in cursor]
+
+@click.command()
+@click.option("-db", "--database", help="Database holding the buckets and rollups.", default='COPH')
+@click.option("-c", "--collection", help="Collection of bucket documents.", default='measurements')
+@click.option("-d", "--device", help="Only roll up this device.", default=None)
+def main(database: str, collection: str, device: str):
+    """
+    Catch the rollup collections up with the stored buckets.
+
+    :param database: Database holding the buckets and rollups
+    :param collection: Collection of bucket documents
+    :param device: Optional device to roll up
+    """
+    config = load_config()
+    query = {"device_id": config['devices'][device.lower()]} if device else None
+    try:
+        db = get_client(config)[database]
+        setup_rollup_collections(db, config)
+        n_windows = catch_up(db, db[collection], config, query)
+        print(f"{n_windows} rollup windows written")
+    finally:
+        close_client()
+
+if __name__ == "__main__":
+    main()
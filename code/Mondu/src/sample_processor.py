@@ -1,110 +1,717 @@
-from typing import List, Dict, Any, Optional
+import asyncio
+import time
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Callable, Optional, Iterable, Iterator, Tuple
 from tqdm import tqdm
 from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 
-from src.models import Document, Measurement
+from src.models import Document, Measurement, MeasurementBlock
 from src.document_factory import DocumentFactory
+from src.dedup import Deduplicator
+from src.metrics import FLUSH_ITEMS, get_metrics
+from src.rollups import mark_rollup_buckets, rollup_accumulator
+from src.summaries import add_summary, value_summary_update
+from src.timeseries import storage_backend, to_timeseries_documents
 
-def prepare_samples(data: List[Dict[str, Any]], document_factory: DocumentFactory, config: Dict[str, Any]) -> List[Dict[str, Any]]:
+# Per-process state of the transformation pool, set by _init_worker
+_worker_factory = None
+_worker_config = None
+
+def prepare_samples(data: Iterable[Dict[str, Any]], document_factory: DocumentFactory, config: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Prepare samples for MongoDB insertion based on input data.
 
-    :param data: List of dictionaries containing the input data
+    :param data: Iterable of dictionaries containing the input data
     :param document_factory: DocumentFactory object
     :param config: Configuration dictionary
     :return: List of prepared samples for MongoDB insertion
     """
-    prepared_samples = []
-    
-    for record in tqdm(data):
-        if config['DEVICE'] == "mimic_prescriptions":
-            if record['startdate'] == '' and record['enddate'] == '':
-                continue
-        
-        try:
-            samples = document_factory.create_samples(device_id=config['devices'][config['DEVICE']], record_data=record)
-
-            if not isinstance(samples, list):
-                samples = [samples]
-
-            for sample in samples:
-                context = {}
-                if hasattr(sample, 'context'):
-                    context = sample.context
-
-                if config['devices'][config['DEVICE'].lower()] in ["8", "9"]:  # mimic_sepsis or mimic_admission
-                    prepared_samples.append({
-                        "sample_dict": {
-                            "user_id": config['users'][config['USERNAME'].lower()],
-                            "device_id": config['devices'][config['DEVICE'].lower()],
-                            "type": "mimic_sepsis" if config['devices'][config['DEVICE'].lower()] == "8" else "mimic_admission",
-                            **context
-                        },
-                        "collection_dict": {
-                            "$push": {'information' if config['devices'][config['DEVICE'].lower()] == "8" else 'admission': sample.measurements[0].value},
-                            "$inc": {"n_samples": int(1)}
-                        }
-                    })
-                else:
-                    for measurement in sample.measurements:
-                        if sample.type == "HEART_RATE" and measurement.value == 255:
-                            continue
+    return list(add_measurement_summaries(iter_samples(data, document_factory, config)))
+
+def iter_samples(data: Iterable[Dict[str, Any]], document_factory: DocumentFactory, config: Dict[str, Any],
+                 progress: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily prepare samples for MongoDB insertion, one input record at a time.
 
+    Single-measurement updates carry no summary; aggregate_buckets or
+    add_measurement_summaries add it (stream_samples applies either). Stage
+    times and counts are summed locally and added to the metrics every
+    FLUSH_ITEMS records; only errors are counted as they happen.
+
+    :param data: Iterable of dictionaries containing the input data
+    :param document_factory: DocumentFactory object
+    :param config: Configuration dictionary
+    :param progress: Whether to show a progress bar
+    :yield: Prepared samples for MongoDB insertion
+    """
+    metrics = get_metrics()
+    transform_seconds = prepare_seconds = 0.0
+    n_records = n_documents = n_samples = 0
+    try:
+        for record in tqdm(data, disable=not progress):
+            if config['DEVICE'] == "mimic_prescriptions":
+                if record['startdate'] == '' and record['enddate'] == '':
+                    continue
+
+            prepared_samples = []
+            stage = "transform"
+            try:
+                transform_start = time.perf_counter()
+                samples = document_factory.create_samples(device_id=config['devices'][config['DEVICE']], record_data=record)
+                prepare_start = time.perf_counter()
+                transform_seconds += prepare_start - transform_start
+
+                if not isinstance(samples, list):
+                    samples = [samples]
+                n_documents += len(samples)
+
+                stage = "prepare"
+                for sample in samples:
+                    context = {}
+                    if hasattr(sample, 'context'):
+                        context = sample.context
+
+                    if config['devices'][config['DEVICE'].lower()] in ["8", "9"]:  # mimic_sepsis or mimic_admission
                         prepared_samples.append({
                             "sample_dict": {
                                 "user_id": config['users'][config['USERNAME'].lower()],
-                                "period": sample.period,
                                 "device_id": config['devices'][config['DEVICE'].lower()],
-                                "n_samples": {"$lt": config['MAX_SAMPLES']},
-                                "type": sample.type,
-                                "day": sample.day,
+                                "type": "mimic_sepsis" if config['devices'][config['DEVICE'].lower()] == "8" else "mimic_admission",
                                 **context
                             },
                             "collection_dict": {
-                                "$push": {'measurements': {
-                                    'timestamp': measurement.timestamp,
-                                    'value': measurement.value
-                                }},
-                                "$min": {"first": measurement.timestamp},
-                                "$max": {"last": measurement.timestamp},
+                                "$push": {'information' if config['devices'][config['DEVICE'].lower()] == "8" else 'admission': sample.measurements[0].value},
                                 "$inc": {"n_samples": int(1)}
                             }
                         })
-        except Exception as e:
-            print(f"Error processing record: {e}")
+                    elif isinstance(sample.measurements, MeasurementBlock):
+                        block = sample.measurements
+                        if sample.type == "HEART_RATE":
+                            block = block[block.values != 255]
+                        for start in range(0, len(block), config['MAX_SAMPLES']):
+                            part = block[start:start + config['MAX_SAMPLES']]
+                            prepared_samples.append({
+                                "sample_dict": {
+                                    "user_id": config['users'][config['USERNAME'].lower()],
+                                    "period": sample.period,
+                                    "device_id": config['devices'][config['DEVICE'].lower()],
+                                    "n_samples": {"$lte": config['MAX_SAMPLES'] - len(part)},
+                                    "type": sample.type,
+                                    "day": sample.day,
+                                    **context
+                                },
+                                "collection_dict": part.to_bucket_update()
+                            })
+                    else:
+                        for measurement in sample.measurements:
+                            if sample.type == "HEART_RATE" and measurement.value == 255:
+                                continue
+                            prepared_samples.append({
+                                "sample_dict": {
+                                    "user_id": config['users'][config['USERNAME'].lower()],
+                                    "period": sample.period,
+                                    "device_id": config['devices'][config['DEVICE'].lower()],
+                                    "n_samples": {"$lt": config['MAX_SAMPLES']},
+                                    "type": sample.type,
+                                    "day": sample.day,
+                                    **context
+                                },
+                                "collection_dict": {
+                                    "$push": {'measurements': {
+                                        'timestamp': measurement.timestamp,
+                                        'value': measurement.value
+                                    }},
+                                    "$min": {"first": measurement.timestamp},
+                                    "$max": {"last": measurement.timestamp},
+                                    "$inc": {"n_samples": int(1)}
+                                }
+                            })
+                prepare_seconds += time.perf_counter() - prepare_start
+            except Exception as e:
+                metrics.error(stage, e)
+                print(f"Error processing record: {e}")
+                continue
 
-    return prepared_samples
+            n_records += 1
+            n_samples += len(prepared_samples)
+            if n_records >= FLUSH_ITEMS:
+                _count_prepared(transform_seconds, prepare_seconds, n_documents, n_samples)
+                transform_seconds = prepare_seconds = 0.0
+                n_records = n_documents = n_samples = 0
+            yield from prepared_samples
+    finally:
+        _count_prepared(transform_seconds, prepare_seconds, n_documents, n_samples)
 
-def upload_samples(data: List[Dict[str, Any]], document_factory: DocumentFactory, config: Dict[str, Any], collection):
+def _count_prepared(transform_seconds: float, prepare_seconds: float, n_documents: int, n_samples: int):
     """
-    Upload prepared samples to MongoDB.
+    Add the stage times and counts summed by iter_samples to the metrics.
+
+    :param transform_seconds: Time spent creating Documents
+    :param prepare_seconds: Time spent turning Documents into prepared samples
+    :param n_documents: Number of Documents created
+    :param n_samples: Number of prepared samples
+    """
+    metrics = get_metrics()
+    metrics.count("stage_seconds", transform_seconds, stage="transform")
+    metrics.count("stage_seconds", prepare_seconds, stage="prepare")
+    if n_documents:
+        metrics.count("documents", n_documents)
+    if n_samples:
+        metrics.count("samples", n_samples)
+
+def _init_worker(config: Dict[str, Any]):
+    """
+    Create the per-process DocumentFactory of a transformation worker.
+
+    :param config: Configuration dictionary
+    """
+    global _worker_factory, _worker_config
+    _worker_config = config
+    _worker_factory = DocumentFactory(config)
+
+def _prepare_chunk(records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Prepare the samples of one chunk inside a transformation worker.
+
+    :param records: Consecutive input records
+    :return: List of prepared samples for MongoDB insertion and the metrics of the chunk
+    """
+    metrics = get_metrics()
+    metrics.reset()
+    samples = list(iter_samples(records, _worker_factory, _worker_config, progress=False))
+    return samples, metrics.to_dict()
+
+@contextmanager
+def transform_pool(config: Dict[str, Any]) -> Iterator[Optional[ProcessPoolExecutor]]:
+    """
+    Pool of config['WORKERS'] transformation processes, shared by every batch of a run.
+
+    Each worker builds its DocumentFactory once, in _init_worker, so feeding
+    several batches through the same pool only pays for process start-up once.
+
+    :param config: Configuration dictionary
+    :yield: ProcessPoolExecutor, or None when records are transformed in this process
+    """
+    if config.get('WORKERS', 1) <= 1:
+        yield None
+        return
+    with ProcessPoolExecutor(max_workers=config['WORKERS'], initializer=_init_worker,
+                             initargs=(config,)) as executor:
+        yield executor
+
+def iter_samples_parallel(data: Iterable[Dict[str, Any]], config: Dict[str, Any],
+                          executor: ProcessPoolExecutor) -> Iterator[Dict[str, Any]]:
+    """
+    Prepare samples in a pool of worker processes.
+
+    The input is split into chunks of config['PARALLEL_CHUNK_SIZE'] records and
+    results are yielded in input order, so the output is identical to
+    iter_samples. Chunks can be split anywhere because the compiled device
+    schemas keep no state from one record to the next. At most two chunks per
+    worker are in flight at a time.
+
+    :param data: Iterable of dictionaries containing the input data
+    :param config: Configuration dictionary
+    :param executor: Pool created by transform_pool
+    :yield: Prepared samples for MongoDB insertion
+    """
+    chunks = batched(tqdm(data), config['PARALLEL_CHUNK_SIZE'])
+    metrics = get_metrics()
+    pending = deque()
+    for chunk in chunks:
+        pending.append(executor.submit(_prepare_chunk, chunk))
+        if len(pending) >= 2 * config['WORKERS']:
+            samples, chunk_metrics = pending.popleft().result()
+            metrics.merge(chunk_metrics)
+            yield from samples
+    while pending:
+        samples, chunk_metrics = pending.popleft().result()
+        metrics.merge(chunk_metrics)
+        yield from samples
 
-    :param data: List of dictionaries containing the input data
+def _iter_samples_pooled(data: Iterable[Dict[str, Any]], config: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    iter_samples_parallel in a pool that lives as long as the iteration.
+
+    :param data: Iterable of dictionaries containing the input data
+    :param config: Configuration dictionary
+    :yield: Prepared samples for MongoDB insertion
+    """
+    with transform_pool(config) as executor:
+        yield from iter_samples_parallel(data, config, executor)
+
+def stream_samples(data: Iterable[Dict[str, Any]], document_factory: DocumentFactory,
+                   config: Dict[str, Any], executor: Optional[ProcessPoolExecutor] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Prepare the samples to write, in parallel and/or bucket-aggregated as configured.
+
+    :param data: Iterable of dictionaries containing the input data
     :param document_factory: DocumentFactory object
     :param config: Configuration dictionary
+    :param executor: Optional pool from transform_pool to reuse; without one, a pool is
+                     started for this call when config['WORKERS'] > 1
+    :return: Iterator of prepared samples for MongoDB insertion
+    """
+    if executor is not None:
+        samples = iter_samples_parallel(data, config, executor)
+    elif config.get('WORKERS', 1) > 1:
+        samples = _iter_samples_pooled(data, config)
+    else:
+        samples = iter_samples(data, document_factory, config)
+    if config.get('AGGREGATE_BUCKETS', True):
+        samples = aggregate_bucket_stream(samples, config['MAX_SAMPLES'], config['AGGREGATE_WINDOW'])
+    else:
+        samples = add_measurement_summaries(samples)
+    return samples
+
+def add_measurement_summaries(samples: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Add the summary of its value to every single-measurement update, in place.
+
+    iter_samples leaves the summary out of per-measurement updates, because
+    aggregate_buckets computes it once per merged bucket. Samples written
+    without aggregation get theirs here.
+
+    :param samples: Prepared samples as returned by iter_samples
+    :yield: The same samples, with the summary operators of their pushed value
+    """
+    for sample in samples:
+        collection_dict = sample['collection_dict']
+        pushed = collection_dict.get('$push', {}).get('measurements')
+        if isinstance(pushed, dict) and '$each' not in pushed:
+            for operator, fields in value_summary_update(pushed.get('value')).items():
+                collection_dict.setdefault(operator, {}).update(fields)
+        yield sample
+
+@dataclass
+class UploadReport:
+    """
+    Outcome of an upload run.
+
+    :param n_ops: Number of update operations that were applied successfully
+    :param n_batches: Number of write batches sent to the server
+    :param elapsed: Wall-clock seconds spent writing
+    :param errors: Errors collected during the upload, one dictionary per failed operation
+    :param n_duplicates: Number of measurements dropped because they were already stored
+    """
+    n_ops: int = 0
+    n_batches: int = 0
+    elapsed: float = 0.0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    n_duplicates: int = 0
+
+    def merge(self, other: 'UploadReport'):
+        """
+        Add the counts and errors of another report to this one.
+
+        :param other: Report of a later part of the same run
+        """
+        self.n_ops += other.n_ops
+        self.n_batches += other.n_batches
+        self.elapsed += other.elapsed
+        self.errors.extend(other.errors)
+        self.n_duplicates += other.n_duplicates
+
+    @property
+    def ops_per_second(self) -> float:
+        return self.n_ops / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (f"Uploaded {self.n_ops} operations in {self.n_batches} batches "
+                f"({self.elapsed:.2f}s, {self.ops_per_second:.0f} ops/s), {len(self.errors)} errors, "
+                f"{self.n_duplicates} duplicate measurements dropped")
+
+def batched(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    """
+    Split an iterable into lists of at most batch_size items.
+
+    :param items: Iterable to split
+    :param batch_size: Maximum number of items per batch
+    :yield: Lists of consecutive items
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def aggregate_buckets(samples: Iterable[Dict[str, Any]], max_samples: int) -> List[Dict[str, Any]]:
+    """
+    Group prepared samples by bucket and merge each group into a single update.
+
+    Samples whose filters match apart from the n_samples guard belong to the same
+    bucket. Each group is split into chunks of at most max_samples and every chunk
+    becomes one upsert using $push/$each, an $inc by the chunk size, $min/$max
+    over first/last and the summary of the chunk's measurement values. The n_samples guard becomes $lte max_samples - chunk size so
+    an existing bucket is only reused when the whole chunk fits in it. Updates
+    that already push with $each are passed through unchanged.
+
+    :param samples: Prepared samples as returned by prepare_samples
+    :param max_samples: Maximum number of samples per MongoDB document
+    :return: List of aggregated samples for MongoDB insertion
+    """
+    groups = {}
+    for index, sample in enumerate(samples):
+        collection_dict = sample['collection_dict']
+        pushed = list(collection_dict.get('$push', {}).values())
+        try:
+            if (set(collection_dict) - {'$push', '$min', '$max', '$inc'} or len(pushed) != 1
+                    or (isinstance(pushed[0], dict) and '$each' in pushed[0])):
+                raise TypeError
+            key = (tuple(sorted((k, v) for k, v in sample['sample_dict'].items() if k != 'n_samples')),
+                   tuple(collection_dict['$push']))
+            hash(key)
+        except TypeError:
+            key = ('unaggregated', index)
+        groups.setdefault(key, []).append(sample)
+
+    aggregated = []
+    for key, group in groups.items():
+        if key[0] == 'unaggregated':
+            aggregated.extend(group)
+            continue
+        bounded = 'n_samples' in group[0]['sample_dict']
+        for chunk in batched(group, max_samples if bounded else len(group)):
+            aggregated.append(_merge_bucket(chunk, max_samples if bounded else None))
+    return aggregated
+
+def aggregate_bucket_stream(samples: Iterable[Dict[str, Any]], max_samples: int,
+                            window_size: int) -> Iterator[Dict[str, Any]]:
+    """
+    Apply aggregate_buckets to consecutive windows of a sample stream.
+
+    Memory is bounded by the window size; a bucket spanning two windows gets
+    one update per window.
+
+    :param samples: Iterable of prepared samples
+    :param max_samples: Maximum number of samples per MongoDB document
+    :param window_size: Number of prepared samples to aggregate at a time
+    :yield: Aggregated samples for MongoDB insertion
+    """
+    metrics = get_metrics()
+    for window in batched(samples, window_size):
+        with metrics.timer("aggregate"):
+            aggregated = aggregate_buckets(window, max_samples)
+        yield from aggregated
+
+def _merge_bucket(chunk: List[Dict[str, Any]], max_samples: Optional[int]) -> Dict[str, Any]:
+    """
+    Merge prepared samples of one bucket into a single upsert.
+
+    :param chunk: Prepared samples sharing the same bucket filter
+    :param max_samples: Maximum number of samples per MongoDB document, or None if the bucket is unbounded
+    :return: Prepared sample with the merged filter and update, with the summary of its measurements
+    """
+    sample_dict = {k: v for k, v in chunk[0]['sample_dict'].items() if k != 'n_samples'}
+    if max_samples is not None:
+        sample_dict['n_samples'] = {"$lte": max_samples - len(chunk)}
+
+    push_field = next(iter(chunk[0]['collection_dict']['$push']))
+    pushed = [sample['collection_dict']['$push'][push_field] for sample in chunk]
+    collection_dict = {"$push": {push_field: {"$each": pushed}}}
+    for operator, reduce in (("$min", min), ("$max", max), ("$inc", sum)):
+        fields = {}
+        for sample in chunk:
+            for name, value in sample['collection_dict'].get(operator, {}).items():
+                fields.setdefault(name, []).append(value)
+        if fields:
+            collection_dict[operator] = {name: reduce(values) for name, values in fields.items()}
+    if push_field == 'measurements':
+        add_summary(collection_dict, [measurement.get('value') for measurement in pushed])
+
+    return {"sample_dict": sample_dict, "collection_dict": collection_dict}
+
+def write_samples(samples: Iterable[Dict[str, Any]], collection,
+                  on_written: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> UploadReport:
+    """
+    Write prepared samples one update_one call at a time.
+
+    :param samples: Prepared samples for MongoDB insertion
     :param collection: MongoDB collection object
+    :param on_written: Optional callback receiving each successfully written sample, in a list
+    :return: UploadReport of the run
     """
-    samples = prepare_samples(data, document_factory, config)
-    for sample in tqdm(samples):
+    report = UploadReport()
+    metrics = get_metrics()
+    start = time.perf_counter()
+    for index, sample in enumerate(tqdm(samples)):
+        write_start = time.perf_counter()
         try:
             collection.update_one(
                 sample['sample_dict'],
                 sample['collection_dict'],
                 upsert=True
             )
-        except Exception as e:
-            print(f"Error uploading sample: {e}")
+            report.n_ops += 1
+            if on_written:
+                on_written([sample])
+        except PyMongoError as e:
+            metrics.error("write", e)
+            report.errors.append({"batch": index, "index": 0, "errmsg": str(e)})
+        latency = time.perf_counter() - write_start
+        metrics.observe("write_latency_seconds", latency, mode="single")
+        metrics.count("stage_seconds", latency, stage="write")
+        report.n_batches += 1
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def _bulk_write_batch(batch: List[Dict[str, Any]], collection, batch_num: int,
+                      mode: str) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Write one batch of prepared samples as an unordered bulk_write of upserts.
+
+    :param batch: Prepared samples for MongoDB insertion
+    :param collection: MongoDB collection object
+    :param batch_num: Number of the batch in the run, used in error reports
+    :param mode: Upload mode label of the write latency histogram
+    :return: Number of operations applied and the errors of the batch
+    """
+    metrics = get_metrics()
+    operations = [UpdateOne(sample['sample_dict'], sample['collection_dict'], upsert=True)
+                  for sample in batch]
+    n_ops, errors = len(operations), []
+    write_start = time.perf_counter()
+    try:
+        collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        write_errors = e.details.get('writeErrors', [])
+        n_ops -= len(write_errors)
+        for error in write_errors:
+            metrics.error("write", f"code {error.get('code')}")
+            errors.append({"batch": batch_num, "index": error.get('index'),
+                           "code": error.get('code'), "errmsg": error.get('errmsg')})
+    except PyMongoError as e:
+        metrics.error("write", e)
+        n_ops = 0
+        errors.append({"batch": batch_num, "index": None, "errmsg": str(e)})
+    latency = time.perf_counter() - write_start
+    metrics.observe("write_latency_seconds", latency, mode=mode)
+    metrics.count("stage_seconds", latency, stage="write")
+    return n_ops, errors
+
+def written_items(batch: List[Any], errors: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Items of a write batch that were applied, given the errors reported for it.
+
+    :param batch: Items of one bulk write, in the order they were sent
+    :param errors: Errors of the batch; an error without an index failed the whole batch
+    :return: List of the items without a write error
+    """
+    failed = {error.get('index') for error in errors}
+    if None in failed:
+        return []
+    return [item for index, item in enumerate(batch) if index not in failed]
+
+def bulk_write_samples(samples: Iterable[Dict[str, Any]], collection, batch_size: int,
+                       on_written: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> UploadReport:
+    """
+    Write prepared samples as unordered bulk_write batches of upserts.
+
+    :param samples: Prepared samples for MongoDB insertion
+    :param collection: MongoDB collection object
+    :param batch_size: Maximum number of operations per bulk_write call
+    :param on_written: Optional callback receiving the successfully written samples of each batch
+    :return: UploadReport of the run
+    """
+    report = UploadReport()
+    start = time.perf_counter()
+    for batch_num, batch in enumerate(tqdm(batched(samples, batch_size))):
+        n_ops, errors = _bulk_write_batch(batch, collection, batch_num, "bulk")
+        if on_written:
+            on_written(written_items(batch, errors))
+        report.n_ops += n_ops
+        report.errors.extend(errors)
+        report.n_batches += 1
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def async_write_samples(samples: Iterable[Dict[str, Any]], collection, batch_size: int,
+                        in_flight: int, queue_size: int,
+                        on_written: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> UploadReport:
+    """
+    Write prepared samples with several bulk_write batches in flight at once.
+
+    Preparation runs on a producer thread that fills a bounded queue of batches,
+    so it overlaps with the writes while at most queue_size batches wait in
+    memory; when MongoDB falls behind the producer blocks. in_flight coroutines
+    take batches off the queue and run bulk_write on a thread pool sharing the
+    pooled client. As with unordered bulk writes, the order in which batches
+    are applied is not guaranteed.
+
+    :param samples: Prepared samples for MongoDB insertion
+    :param collection: MongoDB collection object
+    :param batch_size: Maximum number of operations per bulk_write call
+    :param in_flight: Maximum number of concurrent bulk_write calls
+    :param queue_size: Maximum number of prepared batches waiting to be written
+    :param on_written: Optional callback receiving the successfully written samples of each batch,
+                       called from the event loop thread
+    :return: UploadReport of the run
+    """
+    return asyncio.run(_async_write_samples(samples, collection, batch_size, in_flight, queue_size, on_written))
+
+async def _async_write_samples(samples: Iterable[Dict[str, Any]], collection, batch_size: int,
+                               in_flight: int, queue_size: int,
+                               on_written: Optional[Callable[[List[Dict[str, Any]]], None]]) -> UploadReport:
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    report = UploadReport()
+
+    def produce():
+        try:
+            for batch_num, batch in enumerate(tqdm(batched(samples, batch_size))):
+                asyncio.run_coroutine_threadsafe(queue.put((batch_num, batch)), loop).result()
+        finally:
+            for _ in range(in_flight):
+                asyncio.run_coroutine_threadsafe(queue.put(None), loop).result()
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            batch_num, batch = item
+            try:
+                n_ops, errors = await loop.run_in_executor(executor, _bulk_write_batch,
+                                                           batch, collection, batch_num, "async")
+            except Exception as e:
+                # Keep draining the queue so the producer is never left blocked
+                get_metrics().error("write", e)
+                n_ops, errors = 0, [{"batch": batch_num, "index": None, "errmsg": str(e)}]
+            if on_written:
+                on_written(written_items(batch, errors))
+            report.n_ops += n_ops
+            report.errors.extend(errors)
+            report.n_batches += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=in_flight + 1) as executor:
+        await asyncio.gather(loop.run_in_executor(executor, produce), *(consume() for _ in range(in_flight)))
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def write_timeseries_samples(samples: Iterable[Dict[str, Any]], collection, batch_size: int,
+                             on_written: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> UploadReport:
+    """
+    Write prepared samples to a time-series collection, one document per measurement.
+
+    :param samples: Prepared samples for MongoDB insertion
+    :param collection: Time-series collection object
+    :param batch_size: Maximum number of documents per insert_many call
+    :param on_written: Optional callback receiving the inserted documents of each batch
+    :return: UploadReport of the run
+    """
+    report = UploadReport()
+    metrics = get_metrics()
+    start = time.perf_counter()
+    for batch_num, documents in enumerate(tqdm(batched(to_timeseries_documents(samples), batch_size))):
+        write_start = time.perf_counter()
+        errors = []
+        try:
+            collection.insert_many(documents, ordered=False)
+            report.n_ops += len(documents)
+        except BulkWriteError as e:
+            write_errors = e.details.get('writeErrors', [])
+            report.n_ops += len(documents) - len(write_errors)
+            for error in write_errors:
+                metrics.error("write", f"code {error.get('code')}")
+                errors.append({"batch": batch_num, "index": error.get('index'),
+                               "code": error.get('code'), "errmsg": error.get('errmsg')})
+        except PyMongoError as e:
+            metrics.error("write", e)
+            errors.append({"batch": batch_num, "index": None, "errmsg": str(e)})
+        report.errors.extend(errors)
+        if on_written:
+            on_written(written_items(documents, errors))
+        latency = time.perf_counter() - write_start
+        metrics.observe("write_latency_seconds", latency, mode="timeseries")
+        metrics.count("stage_seconds", latency, stage="write")
+        report.n_batches += 1
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def upload_samples(data: Iterable[Dict[str, Any]], document_factory: DocumentFactory, config: Dict[str, Any], collection) -> UploadReport:
+    """
+    Upload prepared samples to MongoDB.
+
+    Samples are prepared by stream_samples, so config['WORKERS'] and
+    config['AGGREGATE_BUCKETS'] apply. In 'bulk' upload mode the upserts are sent as unordered bulk_write calls of
+    config['BATCH_SIZE'] operations; in 'single' mode each upsert is its own round trip.
+
+    :param data: Iterable of dictionaries containing the input data
+    :param document_factory: DocumentFactory object
+    :param config: Configuration dictionary
+    :param collection: MongoDB collection object
+    :return: UploadReport of the run
+    """
+    return upload_prepared_samples(stream_samples(data, document_factory, config), config, collection)
+
+def upload_prepared_samples(samples: Iterable[Dict[str, Any]], config: Dict[str, Any], collection,
+                            deduplicator: Optional[Deduplicator] = None) -> UploadReport:
+    """
+    Write already prepared samples using the configured upload mode.
+
+    Devices stored in a time-series collection (see STORAGE_BACKENDS) are written
+    there as one document per measurement instead of as bucket upserts, without
+    deduplication. With config['ROLLUPS'] the measurements whose write
+    succeeded, after deduplication, are also added to the rollup collections.
+
+    :param samples: Prepared samples for MongoDB insertion
+    :param config: Configuration dictionary
+    :param collection: MongoDB collection object
+    :param deduplicator: Deduplicator shared by the batches of an ingest; with config['DEDUPLICATE']
+                         and none given, one is created for this call
+    :return: UploadReport of the run
+    """
+    metrics = get_metrics()
+    accumulator = rollup_accumulator(collection.database, config)
+    if storage_backend(config) == 'timeseries':
+        report = write_timeseries_samples(samples, collection.database[config['TIMESERIES_COLLECTION']],
+                                          config['BATCH_SIZE'], accumulator.add_written_documents if accumulator else None)
+        metrics.count("timeseries_documents", report.n_ops)
+    else:
+        if deduplicator is None and config.get('DEDUPLICATE'):
+            deduplicator = Deduplicator(collection, config)
+        if deduplicator:
+            dropped = deduplicator.dropped
+            samples = deduplicator.filter(samples)
+        samples = mark_rollup_buckets(samples, config)
+
+        on_written = accumulator.add_written if accumulator else None
+        upload_mode = config.get('UPLOAD_MODE', 'bulk')
+        if upload_mode == 'async':
+            report = async_write_samples(samples, collection, config['BATCH_SIZE'],
+                                         config['ASYNC_IN_FLIGHT'], config['ASYNC_QUEUE_SIZE'], on_written)
+        elif upload_mode == 'bulk':
+            report = bulk_write_samples(samples, collection, config['BATCH_SIZE'], on_written)
+        else:
+            report = write_samples(samples, collection, on_written)
+        if deduplicator:
+            report.n_duplicates = deduplicator.dropped - dropped
+        metrics.count("bucket_updates", report.n_ops)
+        metrics.count("duplicates", report.n_duplicates)
+    if accumulator:
+        accumulator.flush()
+    return report
 
-def print_samples(data: List[Dict[str, Any]], document_factory: DocumentFactory, config: Dict[str, Any], quantity: Optional[int] = None):
+def print_samples(data: Iterable[Dict[str, Any]], document_factory: DocumentFactory, config: Dict[str, Any], quantity: Optional[int] = None):
     """
     Print prepared samples.
 
-    :param data: List of dictionaries containing the input data
+    :param data: Iterable of dictionaries containing the input data
     :param document_factory: DocumentFactory object
     :param config: Configuration dictionary
     :param quantity: Optional number of samples to print
     """
-    samples = prepare_samples(data, document_factory, config)
-    for sample in tqdm(samples[:quantity] if quantity else samples):
+    samples = stream_samples(data, document_factory, config)
+    for sample in tqdm(islice(samples, quantity)):
         print(sample['sample_dict'])
         print(sample['collection_dict'])
\ No newline at end of file
@@ -0,0 +1,127 @@
+import struct
+import warnings
+import zlib
+from typing import Any, Optional
+
+import numpy as np
+from bson.binary import Binary, USER_DEFINED_SUBTYPE
+
+# Leading bytes of an encoded signal, followed by the sample dtype, count and first sample
+SIGNAL_MAGIC = b"MDS2"
+_HEADER = struct.Struct("<4scIq")
+# Earlier format, whose deltas start from zero so the first one is the first sample itself
+_V1_MAGIC = b"MDS1"
+_V1_HEADER = struct.Struct("<4scI")
+
+# Header codes of the payload dtypes; integer dtypes are tried narrowest first for the deltas
+_DTYPES = {b"b": np.dtype('<i1'), b"h": np.dtype('<i2'), b"i": np.dtype('<i4'), b"q": np.dtype('<i8'),
+           b"d": np.dtype('<f8')}
+_DELTA_CODES = [b"b", b"h", b"i", b"q"]
+
+def parse_signal(value: str) -> Optional[np.ndarray]:
+    """
+    Parse a signal string such as move_ecg's "[12,-40,...]" into a float64 array.
+
+    The numbers are parsed by numpy directly from the string, without building
+    one Python string per sample.
+
+    :param value: Signal string
+    :return: Array of samples, or None if the string is not a list of numbers
+    """
+    text = value.strip("[] ")
+    if not text or text.endswith(","):
+        return None
+    # numpy stops at the first unparsable number with a DeprecationWarning (a ValueError in later versions)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(text, dtype=np.float64, sep=",")
+        except (ValueError, DeprecationWarning):
+            return None
+
+def encode_signal(signal: np.ndarray, level: int = 1) -> Binary:
+    """
+    Encode a signal into a compact BSON Binary.
+
+    Integral signals (such as ECG samples in microvolts) keep their first sample
+    in the header and store the deltas between consecutive samples in the
+    narrowest integer type that holds them all, so a smooth signal takes one
+    byte per sample before compression whatever its baseline. Other signals are
+    stored as float64. The payload is then zlib-compressed.
+
+    :param signal: Array of samples
+    :param level: zlib compression level
+    :return: Binary with the user-defined subtype, decoded by decode_signal
+    """
+    signal = np.asarray(signal, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        integers = signal.astype(np.int64)
+    if len(signal) and np.array_equal(integers, signal):
+        first = int(integers[0])
+        deltas = np.diff(integers)
+        low, high = (deltas.min(), deltas.max()) if len(deltas) else (0, 0)
+        code = next(c for c in _DELTA_CODES if np.iinfo(_DTYPES[c]).min <= low and high <= np.iinfo(_DTYPES[c]).max)
+    else:
+        code, deltas, first = b"d", signal, 0
+    payload = deltas.astype(_DTYPES[code]).tobytes()
+    header = _HEADER.pack(SIGNAL_MAGIC, code, len(signal), first)
+    return Binary(header + zlib.compress(payload, level), USER_DEFINED_SUBTYPE)
+
+def decode_signal(data: bytes) -> np.ndarray:
+    """
+    Decode a signal written by encode_signal, in the current or the earlier format.
+
+    :param data: Encoded signal, as stored or read back from MongoDB
+    :return: float64 array of samples
+    :raises ValueError: If the data is not an encoded signal
+    """
+    if not is_encoded_signal(data):
+        raise ValueError("Not an encoded signal")
+    if data[:len(_V1_MAGIC)] == _V1_MAGIC:
+        _, code, count = _V1_HEADER.unpack_from(data)
+        first, offset = None, _V1_HEADER.size
+    else:
+        _, code, count, first = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+    dtype = _DTYPES[code]
+    if dtype.kind == 'f':
+        return np.frombuffer(zlib.decompress(bytes(data[offset:])), dtype=dtype, count=count).astype(np.float64)
+    if first is None:
+        deltas = np.frombuffer(zlib.decompress(bytes(data[offset:])), dtype=dtype, count=count)
+        return np.cumsum(deltas, dtype=np.int64).astype(np.float64)
+    deltas = np.frombuffer(zlib.decompress(bytes(data[offset:])), dtype=dtype, count=count - 1)
+    signal = np.empty(count, dtype=np.int64)
+    signal[0] = first
+    np.cumsum(deltas, dtype=np.int64, out=signal[1:])
+    signal[1:] += first
+    return signal.astype(np.float64)
+
+def is_encoded_signal(value: Any) -> bool:
+    """
+    Whether a measurement value is a signal written by encode_signal.
+
+    :param value: Measurement value
+    :return: True for encoded signals
+    """
+    return isinstance(value, bytes) and value[:len(SIGNAL_MAGIC)] in (SIGNAL_MAGIC, _V1_MAGIC)
+
+def encode_signal_value(value: Any) -> Any:
+    """
+    Encode a raw signal string, keeping values that are not signals as they are.
+
+    :param value: Raw value of a record field
+    :return: Encoded signal, or the raw value
+    """
+    if not isinstance(value, str):
+        return value
+    signal = parse_signal(value)
+    return value if signal is None else encode_signal(signal)
+
+def decode_value(value: Any) -> Any:
+    """
+    Decode a measurement value if it is an encoded signal.
+
+    :param value: Measurement value read from MongoDB
+    :return: float64 array for encoded signals, otherwise the value itself
+    """
+    return decode_signal(value) if is_encoded_signal(value) else value
@@ -0,0 +1,136 @@
+import math
+from typing import Dict, Any, Iterable, List, Optional
+
+import numpy as np
+
+# Field of a bucket document holding its running summary
+SUMMARY_FIELD = "summaries"
+
+def numeric_values(values: Iterable[Any]) -> List[float]:
+    """
+    Values that take part in a summary: numbers other than booleans and NaN.
+
+    :param values: Measurement values
+    :return: List of the numeric values
+    """
+    return [value for value in values
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and value == value]
+
+def summary_update(values: Iterable[Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Update operators folding measurement values into the running summary of a bucket.
+
+    The summary holds count, sum, sum_sq, min and max, maintained with $inc, $min
+    and $max in the same upsert that pushes the measurements, so the mean and
+    standard deviation of a bucket are available without reading its array.
+
+    :param values: Measurement values pushed by the update
+    :return: Dictionary of operator to fields, empty if no value is numeric
+    """
+    values = numeric_values(values)
+    if not values:
+        return {}
+    return summary_operators(len(values), math.fsum(values), math.fsum(v * v for v in values),
+                              min(values), max(values))
+
+def value_summary_update(value: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    summary_update for the single value of a per-measurement update.
+
+    :param value: Measurement value
+    :return: Dictionary of operator to fields, empty if the value is not numeric
+    """
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or value != value:
+        return {}
+    return summary_operators(1, float(value), float(value * value), value, value)
+
+def block_summary_update(values: np.ndarray) -> Dict[str, Dict[str, Any]]:
+    """
+    summary_update for a float64 value array.
+
+    :param values: Array of measurement values
+    :return: Dictionary of operator to fields, empty if every value is NaN
+    """
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {}
+    return summary_operators(len(values), float(values.sum()), float(np.dot(values, values)),
+                              float(values.min()), float(values.max()))
+
+def summary_operators(count: int, total: float, total_sq: float,
+                       minimum: float, maximum: float) -> Dict[str, Dict[str, Any]]:
+    """
+    Update operators adding precomputed aggregates to a summary.
+
+    :param count: Number of values
+    :param total: Sum of the values
+    :param total_sq: Sum of the squared values
+    :param minimum: Smallest value
+    :param maximum: Largest value
+    :return: Dictionary of operator to fields
+    """
+    return {
+        "$inc": {f"{SUMMARY_FIELD}.count": count, f"{SUMMARY_FIELD}.sum": total,
+                 f"{SUMMARY_FIELD}.sum_sq": total_sq},
+        "$min": {f"{SUMMARY_FIELD}.min": minimum},
+        "$max": {f"{SUMMARY_FIELD}.max": maximum}
+    }
+
+def add_summary(collection_dict: Dict[str, Any], values: Iterable[Any]) -> Dict[str, Any]:
+    """
+    Add the summary operators of the pushed values to a bucket update, in place.
+
+    Summary fields already in the update are replaced.
+
+    :param collection_dict: Update document of a bucket upsert
+    :param values: Measurement values pushed by the update
+    :return: The same update document
+    """
+    for operator in ("$inc", "$min", "$max"):
+        fields = collection_dict.get(operator)
+        if fields and any(name.startswith(f"{SUMMARY_FIELD}.") for name in fields):
+            collection_dict[operator] = {name: value for name, value in fields.items()
+                                         if not name.startswith(f"{SUMMARY_FIELD}.")}
+    for operator, fields in summary_update(values).items():
+        collection_dict[operator] = {**collection_dict.get(operator, {}), **fields}
+    return collection_dict
+
+def summary_stats(summary: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Statistics of a stored summary.
+
+    :param summary: Summary of a bucket, or the sum of several buckets' summaries
+    :return: Dictionary with count, mean, std (population), min and max, or {} for an empty summary
+    """
+    if not summary or not summary.get('count'):
+        return {}
+    count = summary['count']
+    mean = summary['sum'] / count
+    variance = max(summary['sum_sq'] / count - mean * mean, 0.0)
+    return {"count": count, "mean": mean, "std": math.sqrt(variance),
+            "min": summary['min'], "max": summary['max']}
+
+def daily_summaries(collection, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Daily statistics of the buckets matching a query, read from their summaries.
+
+    The buckets of a series and day (there are several once a day exceeds
+    MAX_SAMPLES) are combined on the server without unwinding their measurements.
+
+    :param collection: Collection of bucket documents
+    :param query: Bucket filter, such as user_id, device_id and type
+    :return: List of dictionaries with type, day and the statistics of summary_stats, ordered by type and day
+    """
+    pipeline = [
+        {"$match": {**query, f"{SUMMARY_FIELD}.count": {"$gt": 0}}},
+        {"$group": {
+            "_id": {"type": "$type", "day": "$day"},
+            "count": {"$sum": f"${SUMMARY_FIELD}.count"},
+            "sum": {"$sum": f"${SUMMARY_FIELD}.sum"},
+            "sum_sq": {"$sum": f"${SUMMARY_FIELD}.sum_sq"},
+            "min": {"$min": f"${SUMMARY_FIELD}.min"},
+            "max": {"$max": f"${SUMMARY_FIELD}.max"}
+        }},
+        {"$sort": {"_id.type": 1, "_id.day": 1}}
+    ]
+    return [{**group['_id'], **summary_stats(group)} for group in collection.aggregate(pipeline)]
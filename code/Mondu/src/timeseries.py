@@ -0,0 +1,77 @@
+from typing import Dict, Any, Iterable, Iterator
+
+import pymongo as pm
+
+from src.device_schemas import device_schema
+
+# Fields of a bucket document that describe the bucket rather than its series
+BUCKET_FIELDS = ("_id", "day", "n_samples", "first", "last", "measurements", "summaries", "rollup", "caught_up")
+
+def storage_backend(config: Dict[str, Any]) -> str:
+    """
+    Storage backend of the configured device.
+
+    :param config: Configuration dictionary
+    :return: 'timeseries' or 'buckets'
+    :raises ValueError: If a time-series collection is configured for a device whose records have no timestamp
+    """
+    device = config['DEVICE'].lower()
+    backend = config['STORAGE_BACKENDS'].get(device, 'buckets')
+    if backend == 'timeseries':
+        schema = device_schema(device, config)
+        if schema is not None and schema.timestamp_field is None:
+            raise ValueError(f"{device} records have no timestamp, so they cannot be stored "
+                             f"in a time-series collection")
+    return backend
+
+def setup_timeseries_collection(db: pm.database.Database, config: Dict[str, Any]) -> pm.collection.Collection:
+    """
+    Get the time-series collection, creating it if it does not exist.
+
+    timestamp is the timeField and meta (user, device, type, period and any
+    context fields) the metaField, so the server groups measurements of the
+    same series into compressed buckets.
+
+    :param db: MongoDB database object
+    :param config: Configuration dictionary
+    :return: Time-series collection object
+    """
+    name = config['TIMESERIES_COLLECTION']
+    if name not in db.list_collection_names(filter={"name": name}):
+        db.create_collection(name, timeseries={
+            "timeField": "timestamp",
+            "metaField": "meta",
+            "granularity": config['TIMESERIES_GRANULARITY']
+        })
+    return db[name]
+
+def to_timeseries_documents(samples: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Flatten prepared bucket upserts into one time-series document per measurement.
+
+    Samples that do not push timestamped measurements have no timeField and are
+    skipped; storage_backend rejects the time-series backend for devices whose
+    records are untimed (MIMIC sepsis and admissions).
+
+    :param samples: Prepared samples for MongoDB insertion
+    :yield: Time-series documents with timestamp, meta and the measurement fields
+    """
+    for sample in samples:
+        pushed = sample['collection_dict'].get('$push', {}).get('measurements')
+        if not isinstance(pushed, dict):
+            continue
+        meta = {k: v for k, v in sample['sample_dict'].items() if k not in BUCKET_FIELDS}
+        for measurement in pushed['$each'] if '$each' in pushed else [pushed]:
+            yield {**measurement, "meta": meta}
+
+def bucket_to_timeseries(bucket: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Flatten a stored bucket document into time-series documents.
+
+    :param bucket: Bucket document of the measurements collection
+    :yield: Time-series documents with timestamp, meta and the measurement fields
+    """
+    meta = {k: v for k, v in bucket.items() if k not in BUCKET_FIELDS}
+    for measurement in bucket.get('measurements', []):
+        if isinstance(measurement, dict) and 'timestamp' in measurement:
+            yield {**measurement, "meta": meta}
@@ -0,0 +1,20 @@
+import inspect
+import os
+import sys
+
+import mongomock
+import mongomock.collection
+import pytest
+
+# Make the src package importable when pytest is run from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def database(monkeypatch):
+    # pymongo 4.9+ passes sort= to the bulk builder, which mongomock 4.3 does not accept yet
+    builder = mongomock.collection.BulkOperationBuilder
+    if 'sort' not in inspect.signature(builder.add_update).parameters:
+        add_update = builder.add_update
+        monkeypatch.setattr(builder, "add_update", lambda self, *args, sort=None, **kwargs:
+                            add_update(self, *args, **kwargs))
+    return mongomock.MongoClient()['mondu_test']
@@ -0,0 +1,63 @@
+from collections import defaultdict
+
+import pytest
+
+from benchmarks.generators import GENERATORS
+from src.config import DEFAULT_CONFIG
+from src.document_factory import DocumentFactory
+from src.file_parser import iter_records
+from src.sample_processor import bulk_write_samples, stream_samples
+from src.summaries import daily_summaries, summary_stats
+
+MAX_SAMPLES = 60
+
+@pytest.fixture
+def collections(database, tmp_path):
+    # The last 120 minutes of the export cross midnight, and a window of 300 samples splits buckets
+    config = {**DEFAULT_CONFIG, 'DEVICE': "flow", 'USERNAME': "anonymous", 'MAX_SAMPLES': MAX_SAMPLES,
+              'AGGREGATE_WINDOW': 300}
+    file_path = tmp_path / "flow.csv"
+    GENERATORS['flow'](str(file_path), 1500)
+    header, *rows = file_path.read_text().splitlines(keepends=True)
+    file_path.write_text(header + "".join(rows[-120:]))
+    file_path = str(file_path)
+    for aggregate in (False, True):
+        samples = stream_samples(iter_records(file_path), DocumentFactory(config),
+                                 {**config, 'AGGREGATE_BUCKETS': aggregate})
+        report = bulk_write_samples(samples, database[f"aggregate_{aggregate}"], batch_size=100)
+        assert report.errors == []
+    return database['aggregate_False'], database['aggregate_True']
+
+def series_days(collection):
+    days = defaultdict(list)
+    for bucket in collection.find():
+        days[(bucket['type'], bucket['day'])].append(bucket)
+    return days
+
+def test_buckets_respect_max_samples(collections):
+    for collection in collections:
+        for bucket in collection.find():
+            assert bucket['n_samples'] == len(bucket['measurements']) <= MAX_SAMPLES
+            timestamps = [m['timestamp'] for m in bucket['measurements']]
+            assert (bucket['first'], bucket['last']) == (min(timestamps), max(timestamps))
+            values = [m['value'] for m in bucket['measurements']]
+            assert summary_stats(bucket['summaries'])['count'] == len(values)
+            assert bucket['summaries']['sum'] == pytest.approx(sum(values))
+            assert (bucket['summaries']['min'], bucket['summaries']['max']) == (min(values), max(values))
+
+def test_aggregation_matches_per_measurement_updates(collections):
+    single, aggregated = (series_days(collection) for collection in collections)
+    assert set(single) == set(aggregated) and len(single) == 16
+    for key, buckets in single.items():
+        merged = aggregated[key]
+        assert sorted(m['timestamp'] for b in merged for m in b['measurements']) == \
+            sorted(m['timestamp'] for b in buckets for m in b['measurements'])
+        assert min(b['first'] for b in merged) == min(b['first'] for b in buckets)
+        assert max(b['last'] for b in merged) == max(b['last'] for b in buckets)
+
+    expected = daily_summaries(collections[0], {})
+    summaries = daily_summaries(collections[1], {})
+    assert len(summaries) == len(expected) == 16
+    for day, expected_day in zip(summaries, expected):
+        assert (day.pop('type'), day.pop('day')) == (expected_day.pop('type'), expected_day.pop('day'))
+        assert day == pytest.approx(expected_day)
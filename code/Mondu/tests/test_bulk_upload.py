@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from benchmarks.generators import GENERATORS
+from src.config import DEFAULT_CONFIG
+from src.document_factory import DocumentFactory
+from src.file_parser import iter_records
+from src.sample_processor import async_write_samples, bulk_write_samples, stream_samples, write_samples
+
+@pytest.fixture(params=["amazfit_bip", "flow", "mimic_chartevents"])
+def prepared_samples(request, tmp_path):
+    device = request.param
+    config = {**DEFAULT_CONFIG, 'DEVICE': device, 'USERNAME': "anonymous", 'MAX_SAMPLES': 50}
+    file_path = str(tmp_path / f"{device}.csv")
+    GENERATORS[device](file_path, 120)
+    return {aggregate: list(stream_samples(iter_records(file_path), DocumentFactory(config),
+                                           {**config, 'AGGREGATE_BUCKETS': aggregate}))
+            for aggregate in (False, True)}
+
+def stored(collection):
+    return sorted((repr(sorted((k, v) for k, v in document.items() if k != '_id'))
+                   for document in collection.find()))
+
+@pytest.mark.parametrize("aggregate", [False, True])
+def test_bulk_write_matches_single_writes(database, prepared_samples, aggregate):
+    samples = prepared_samples[aggregate]
+    single = write_samples(samples, database['single'])
+    bulk = bulk_write_samples(samples, database['bulk'], batch_size=7)
+    assert stored(database['bulk']) == stored(database['single'])
+    assert database['bulk'].count_documents({}) > 0
+    assert bulk.n_ops == single.n_ops == len(samples)
+    assert bulk.n_batches == -(-len(samples) // 7)
+    assert bulk.errors == single.errors == []
+
+def test_bulk_write_errors_are_reported(database):
+    collection = database['measurements']
+    collection.create_index("key", unique=True)
+    collection.insert_one({"key": "taken"})
+    samples = [{"sample_dict": {"series": n}, "collection_dict": {"$set": {"key": key}}}
+               for n, key in enumerate(["a", "taken", "b", "c", "taken"])]
+
+    report = bulk_write_samples(samples, collection, batch_size=2)
+
+    assert report.n_ops == 3
+    assert report.n_batches == 3
+    assert [(error['batch'], error['index'], error['code']) for error in report.errors] == [(0, 1, 11000), (2, 0, 11000)]
+    assert all(error['errmsg'] for error in report.errors)
+    assert collection.count_documents({}) == 4
+    assert "3 operations in 3 batches" in report.summary() and "2 errors" in report.summary()
+
+@pytest.mark.parametrize("error", [RuntimeError("write thread died"), AutoReconnect("connection lost")])
+def test_async_write_error_mid_stream(database, monkeypatch, error):
+    collection = database['measurements']
+    calls = []
+    bulk_write = collection.bulk_write
+
+    def failing_bulk_write(requests, **kwargs):
+        calls.append(None)
+        if len(calls) == 3:
+            raise error
+        return bulk_write(requests, **kwargs)
+    monkeypatch.setattr(collection, "bulk_write", failing_bulk_write)
+    samples = ({"sample_dict": {"series": n}, "collection_dict": {"$set": {"key": n}}} for n in range(50))
+    threads = set(threading.enumerate())
+
+    report = async_write_samples(samples, collection, batch_size=4, in_flight=2, queue_size=1)
+
+    assert len(report.errors) == 1 and str(error) in report.errors[0]['errmsg']
+    assert report.errors[0]['index'] is None
+    assert report.n_batches == 13
+    assert report.n_ops == collection.count_documents({}) == 50 - 4
+    assert set(threading.enumerate()) == threads
+
+def test_async_write_producer_error_stops_the_writers(database):
+    def samples():
+        for n in range(50):
+            if n == 30:
+                raise ValueError("bad record")
+            yield {"sample_dict": {"series": n}, "collection_dict": {"$set": {"key": n}}}
+    threads = set(threading.enumerate())
+
+    with pytest.raises(ValueError, match="bad record"):
+        async_write_samples(samples(), database['measurements'], batch_size=4, in_flight=2, queue_size=1)
+
+    assert database['measurements'].count_documents({}) == 28
+    assert set(threading.enumerate()) == threads
@@ -0,0 +1,98 @@
+import gc
+from collections import Counter
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from benchmarks.generators import GENERATORS
+from src.checkpoint import Checkpoint
+from src.config import DEFAULT_CONFIG
+from src.document_factory import DocumentFactory
+from src.main import ingest_file
+from src.metrics import get_metrics
+
+ROWS = 350
+
+@pytest.fixture
+def config():
+    return {**DEFAULT_CONFIG, 'DEVICE': "flow", 'USERNAME': "anonymous", 'MAX_SAMPLES': 50,
+            'CHECKPOINT_RECORDS': 100, 'BATCH_SIZE': 5}
+
+@pytest.fixture
+def file_path(tmp_path):
+    file_path = str(tmp_path / "flow.csv")
+    GENERATORS['flow'](file_path, ROWS)
+    return file_path
+
+# Makes the given call to collection.bulk_write raise error, until the returned set is cleared
+def fail_bulk_write(collection, monkeypatch, call, error):
+    failing, calls = {call}, []
+    bulk_write = collection.bulk_write
+
+    def flaky(requests, **kwargs):
+        calls.append(None)
+        if len(calls) in failing:
+            raise error
+        return bulk_write(requests, **kwargs)
+    monkeypatch.setattr(collection, "bulk_write", flaky)
+    return failing
+
+def assert_stored_once(collection):
+    stored = Counter((bucket['type'], measurement['timestamp'])
+                     for bucket in collection.find() for measurement in bucket['measurements'])
+    assert len(stored) == 8 * ROWS
+    assert set(stored.values()) == {1}
+
+def ingest(file_path, config, database, resume):
+    get_metrics().reset()
+    return ingest_file(file_path, config, database, database['measurements'], DocumentFactory(config), resume)
+
+def test_resume_after_failed_batch(database, monkeypatch, file_path, config):
+    # The third checkpoint batch is written in four bulk writes, the second of which fails
+    failing = fail_bulk_write(database['measurements'], monkeypatch, 10, AutoReconnect("connection lost"))
+
+    report = ingest(file_path, config, database, resume=False)
+    checkpoint = Checkpoint(database[config['CHECKPOINT_COLLECTION']], file_path, config)
+    assert report.errors
+    assert (checkpoint.committed, checkpoint.completed) == (200, False)
+
+    failing.clear()
+    report = ingest(file_path, config, database, resume=True)
+    assert report.errors == []
+    assert report.n_duplicates > 0
+    assert get_metrics().get("records") == ROWS - 200
+    assert_stored_once(database['measurements'])
+
+def test_resume_after_crash_without_dedup(database, monkeypatch, file_path, config):
+    config = {**config, 'DEDUPLICATE': False}
+    failing = fail_bulk_write(database['measurements'], monkeypatch, 9, RuntimeError("worker killed"))
+
+    with pytest.raises(RuntimeError):
+        ingest(file_path, config, database, resume=False)
+    # The crashed run's readers flush their counts when collected, which must not land in the resumed run
+    gc.collect()
+
+    failing.clear()
+    ingest(file_path, config, database, resume=True)
+    assert get_metrics().get("records") == ROWS - 200
+    assert_stored_once(database['measurements'])
+
+def test_completed_file_is_skipped_until_reset(database, file_path, config):
+    ingest(file_path, config, database, resume=False)
+    checkpoint = Checkpoint(database[config['CHECKPOINT_COLLECTION']], file_path, config)
+    assert (checkpoint.committed, checkpoint.completed) == (ROWS, True)
+
+    report = ingest(file_path, config, database, resume=True)
+    assert report.n_ops == 0
+    assert get_metrics().get("records") == 0
+
+    report = ingest(file_path, config, database, resume=False)
+    assert report.n_duplicates == 8 * ROWS
+    assert_stored_once(database['measurements'])
+
+def test_grown_file_starts_from_scratch(database, file_path, config):
+    checkpoint = Checkpoint(database[config['CHECKPOINT_COLLECTION']], file_path, config)
+    checkpoint.commit(100)
+    with open(file_path, 'a') as file:
+        file.write("\n")
+    assert Checkpoint(database[config['CHECKPOINT_COLLECTION']], file_path, config).committed == 0
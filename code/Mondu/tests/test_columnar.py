@@ -0,0 +1,53 @@
+import time
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from src.columnar import to_datetime64
+from src.device_schemas import timestamp_parser
+
+@pytest.mark.parametrize("values, timestamp_format", [
+    (["2019-05-01T23:30:00+02:00", "2019-05-02T00:30:00-03:00", "2019-05-01T23:30:00+00:00"], None),
+    (["2019-05-01T23:30:00", "2019-05-02T00:30:00"], None),
+    (["2019-05-01 23:30:00", "2019-05-02 00:30:00"], "%Y-%m-%d %H:%M:%S"),
+    (["01/05/2019 23:30 +0200", "02/05/2019 00:30 -0300"], "%d/%m/%Y %H:%M %z"),
+])
+def test_columnar_timestamps_match_per_record_parsing(values, timestamp_format):
+    parse = timestamp_parser(timestamp_format)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        columnar = to_datetime64(np.array(values), timestamp_format).astype(datetime).tolist()
+    assert columnar == [parse(value) for value in values]
+    assert all(timestamp.tzinfo is None for timestamp in columnar)
+
+def test_offset_timestamps_are_converted_to_utc():
+    assert timestamp_parser(None)("2019-05-01T01:30:00+02:00") == datetime(2019, 4, 30, 23, 30)
+
+@pytest.mark.parametrize("value", ["2019-05-01T01:30:00+00:00", "2019-05-01 01:30:00.250+00:00",
+                                   "2019-05-01T03:30:00+02:00", "2019-05-01T01:30:00"])
+def test_iso_timestamps_parse_to_naive_utc(value):
+    expected = datetime.fromisoformat(value)
+    if expected.tzinfo is not None:
+        expected = expected.astimezone(timezone.utc).replace(tzinfo=None)
+    assert timestamp_parser(None)(value) == expected
+
+@pytest.fixture(params=["Europe/London", "America/St_Johns", "UTC"])
+def local_zone(request, monkeypatch):
+    monkeypatch.setenv("TZ", request.param)
+    time.tzset()
+    yield request.param
+    monkeypatch.undo()
+    time.tzset()
+
+def test_epoch_timestamps_match_fromtimestamp_across_dst(local_zone):
+    # Every 20 minutes over the 2019 spring and autumn transitions, as strings like the CSV exports
+    start = int(datetime(2019, 3, 30, tzinfo=timezone.utc).timestamp())
+    autumn = int(datetime(2019, 10, 26, tzinfo=timezone.utc).timestamp())
+    seconds = [base + step * 1200 for base in (start, autumn) for step in range(2 * 24 * 3)]
+    values = np.array([str(value) for value in seconds])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        columnar = to_datetime64(values, "epoch").astype(datetime).tolist()
+    assert columnar == [timestamp_parser("epoch")(value) for value in values]
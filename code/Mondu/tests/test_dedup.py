@@ -0,0 +1,42 @@
+import pytest
+
+from benchmarks.generators import GENERATORS
+from src.config import DEFAULT_CONFIG
+from src.dedup import Deduplicator
+from src.document_factory import DocumentFactory
+from src.main import ingest_file
+
+@pytest.fixture
+def config():
+    return {**DEFAULT_CONFIG, 'DEVICE': "flow", 'USERNAME': "anonymous", 'MAX_SAMPLES': 50,
+            'CHECKPOINT_RECORDS': 100}
+
+def stored_measurements(collection):
+    return sum(len(bucket['measurements']) for bucket in collection.find())
+
+def test_one_deduplicator_per_file(database, monkeypatch, tmp_path, config):
+    loads = []
+    load_ranges = Deduplicator._load_ranges
+    monkeypatch.setattr(Deduplicator, "_load_ranges", lambda self, series_filter:
+                        loads.append(series_filter) or load_ranges(self, series_filter))
+    file_path = str(tmp_path / "flow.csv")
+    GENERATORS['flow'](file_path, 350)
+    collection = database['measurements']
+
+    first = ingest_file(file_path, config, database, collection, DocumentFactory(config), resume=False)
+    again = ingest_file(file_path, config, database, collection, DocumentFactory(config), resume=False)
+
+    assert len(loads) == 2 * 8
+    assert first.n_duplicates == 0
+    assert again.n_duplicates == stored_measurements(collection) == 8 * 350
+
+def test_later_batches_drop_what_earlier_batches_wrote(database, tmp_path, config):
+    file_path = tmp_path / "flow.csv"
+    GENERATORS['flow'](str(file_path), 100)
+    header, *rows = file_path.read_text().splitlines(keepends=True)
+    file_path.write_text(header + "".join(rows + rows))
+    collection = database['measurements']
+
+    report = ingest_file(str(file_path), config, database, collection, DocumentFactory(config), resume=False)
+
+    assert report.n_duplicates == stored_measurements(collection) == 8 * 100
@@ -0,0 +1,32 @@
+from itertools import islice
+
+import pytest
+
+from benchmarks.generators import GENERATORS
+from src.config import DEFAULT_CONFIG
+from src.diagnose import diagnostic_queries
+from src.document_factory import DocumentFactory
+from src.file_parser import iter_records
+from src.rollups import ROLLUP_FIELD
+from src.sample_processor import stream_samples, upload_prepared_samples
+
+@pytest.mark.parametrize("device", ["flow", "mimic_chartevents"])
+@pytest.mark.parametrize("rollups", [False, True])
+def test_upsert_filters_match_the_upload(database, monkeypatch, tmp_path, device, rollups):
+    config = {**DEFAULT_CONFIG, 'DEVICE': device, 'USERNAME': "anonymous", 'UPLOAD_MODE': 'single',
+              'ROLLUPS': rollups}
+    file_path = str(tmp_path / f"{device}.csv")
+    GENERATORS[device](file_path, 40)
+    samples = list(stream_samples(islice(iter_records(file_path), 20), DocumentFactory(config), config))
+
+    collection = database['measurements']
+    sent = []
+    update_one = collection.update_one
+    monkeypatch.setattr(collection, "update_one", lambda query, update, **kwargs:
+                        sent.append(query) or update_one(query, update, **kwargs))
+    upload_prepared_samples(samples, config, collection)
+
+    upserts = [query for description, query, update in diagnostic_queries(samples, config)
+               if description == "bucket upsert"]
+    assert upserts == sent
+    assert all((ROLLUP_FIELD in query) == (device in config['ROLLUP_DEVICES']) for query in upserts)
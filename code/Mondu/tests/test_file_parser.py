@@ -0,0 +1,85 @@
+import json
+import os
+from itertools import islice
+
+import pytest
+
+from src.file_parser import expand_paths, iter_json, iter_records
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+EXPORTS = os.path.join(FIXTURES, "exports")
+FIXTURE_RECORDS = [{"id": 1, "note": "first"}, {"id": 2, "note": 'a "quoted" ] bracket, and a comma'},
+                   {"id": 3, "nested": {"values": [1, 2, 3]}}]
+
+RECORDS = [{"id": str(n), "note": "two\nlines" if n == 3 else f"note {n}"} for n in range(8)]
+
+def write_csv(path):
+    lines = ["id,note"] + [f'{r["id"]},"{r["note"]}"' for r in RECORDS]
+    lines.insert(4, "")
+    path.write_text("\n".join(lines) + "\n")
+
+def write_ndjson(path):
+    lines = [json.dumps(record) for record in RECORDS]
+    lines.insert(2, "")
+    lines.insert(5, "   ")
+    path.write_text("\n".join(lines) + "\n")
+
+def write_json(path):
+    path.write_text(json.dumps(RECORDS, indent=2))
+
+@pytest.mark.parametrize("name, write", [("records.csv", write_csv), ("records.ndjson", write_ndjson),
+                                         ("records.jsonl", write_ndjson), ("records.json", write_json)])
+@pytest.mark.parametrize("skip", [0, 1, 3, 4, 8, 20])
+def test_skip_matches_reading_past_the_records(tmp_path, name, write, skip):
+    path = tmp_path / name
+    write(path)
+    assert list(iter_records(str(path))) == RECORDS
+    assert list(iter_records(str(path), skip=skip)) == list(islice(iter_records(str(path)), skip, None))
+
+# Chunks smaller than a record make records straddle one or several chunk boundaries
+@pytest.mark.parametrize("name", ["records.json", "records.ndjson"])
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 30, 1 << 16])
+def test_iter_json_across_chunk_boundaries(name, chunk_size):
+    with open(os.path.join(FIXTURES, name)) as file:
+        assert list(iter_json(file, chunk_size=chunk_size)) == FIXTURE_RECORDS
+
+@pytest.mark.parametrize("name", ["records.json", "records.ndjson"])
+def test_iter_records_reads_json_fixtures(name):
+    assert list(iter_records(os.path.join(FIXTURES, name))) == FIXTURE_RECORDS
+
+@pytest.mark.parametrize("text, expected", [("", []), ("  \n", []), ("[]", []), (" [ ] ", []),
+                                            ("[1, 2]", [1, 2]), ("1 2\n3", [1, 2, 3]), ('"a"\n\n"b"', ["a", "b"]),
+                                            ("[12345, 678]", [12345, 678]), ("12345\n678", [12345, 678])])
+def test_iter_json_shapes(tmp_path, text, expected):
+    path = tmp_path / "values.json"
+    path.write_text(text)
+    with open(path) as file:
+        assert list(iter_json(file, chunk_size=3)) == expected
+
+@pytest.mark.parametrize("text", ['[{"id": 1}, {"id": ', '{"id": 1}\n{"id": }', '[1, 2'])
+def test_iter_json_rejects_truncated_files(tmp_path, text):
+    path = tmp_path / "broken.json"
+    path.write_text(text)
+    with open(path) as file, pytest.raises(json.JSONDecodeError):
+        list(iter_json(file, chunk_size=4))
+
+def exports(*names):
+    return sorted(os.path.join(EXPORTS, *name.split("/")) for name in names)
+
+@pytest.mark.parametrize("paths, expected", [
+    ([EXPORTS], ["day1.csv", "DAY2.CSV", "nested/day3.jsonl"]),
+    ([os.path.join(EXPORTS, "*")], ["day1.csv", "DAY2.CSV", "nested/day3.jsonl"]),
+    ([os.path.join(EXPORTS, "*.csv")], ["day1.csv"]),
+    ([os.path.join(EXPORTS, "**", "*.jsonl")], ["nested/day3.jsonl"]),
+    ([os.path.join(EXPORTS, "nested"), os.path.join(EXPORTS, "nested", "day3.jsonl")], ["nested/day3.jsonl"]),
+    ([os.path.join(EXPORTS, "nested", "readme.txt")], ["nested/readme.txt"]),
+    ([os.path.join(EXPORTS, "missing"), os.path.join(EXPORTS, "*.json")], []),
+])
+def test_expand_paths(paths, expected):
+    assert expand_paths(paths) == exports(*expected)
+
+def test_expanded_files_are_read():
+    records = [record for path in expand_paths([EXPORTS]) for record in iter_records(path)]
+    assert records == [{"id": "2", "note": "second"}, {"id": "1", "note": "first"}] + FIXTURE_RECORDS
+    with pytest.raises(ValueError, match="Unsupported file format: txt"):
+        iter_records(os.path.join(EXPORTS, "nested", "readme.txt"))
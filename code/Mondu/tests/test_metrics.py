@@ -0,0 +1,41 @@
+import pytest
+
+from benchmarks.generators import GENERATORS
+from src.config import DEFAULT_CONFIG
+from src.document_factory import DocumentFactory
+from src.file_parser import iter_records
+from src.metrics import FLUSH_ITEMS, get_metrics
+from src.sample_processor import iter_samples
+
+@pytest.fixture
+def metrics():
+    metrics = get_metrics()
+    metrics.reset()
+    yield metrics
+    metrics.reset()
+
+def test_iter_samples_counts_every_record(metrics, tmp_path):
+    rows = 2 * FLUSH_ITEMS + 17
+    file_path = str(tmp_path / "flow.csv")
+    GENERATORS['flow'](file_path, rows)
+    config = {**DEFAULT_CONFIG, 'DEVICE': "flow", 'USERNAME': "anonymous"}
+
+    records = metrics.timed(iter_records(file_path), "parse", "records")
+    samples = list(iter_samples(records, DocumentFactory(config), config, progress=False))
+
+    assert metrics.get("records") == rows
+    assert metrics.get("documents") == 8 * rows
+    assert metrics.get("samples") == len(samples) > 0
+    for stage in ("parse", "transform", "prepare"):
+        assert metrics.get("stage_seconds", stage=stage) > 0
+
+def test_abandoned_iteration_still_counts(metrics, tmp_path):
+    file_path = str(tmp_path / "flow.csv")
+    GENERATORS['flow'](file_path, 50)
+    config = {**DEFAULT_CONFIG, 'DEVICE': "flow", 'USERNAME': "anonymous"}
+
+    samples = iter_samples(iter_records(file_path), DocumentFactory(config), config, progress=False)
+    next(samples)
+    samples.close()
+
+    assert metrics.get("documents") == 8
@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+import requests
+
+import src.ols_client as ols_client
+from src.config import DEFAULT_CONFIG
+from src.ols_client import OLSCache, OLSClient
+
+class StandInOLS(BaseHTTPRequestHandler):
+    """Answers /api/search like OLS, with one document labelled after the query."""
+
+    def do_GET(self):
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        self.server.requests.append(params)
+        if params['q'] == "slow":
+            time.sleep(1.0)
+        if params['q'] == "broken":
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = json.dumps({"response": {"docs": [
+            {"iri": f"http://example.org/{params['q']}", "label": params['q'],
+             "ontology_name": "efo", "description": [params.get('queryFields', "")]}
+        ]}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def ols_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInOLS)
+    server.daemon_threads = True
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the clock of the cache with one the test advances."""
+    class Clock:
+        now = 1000.0
+
+        def time(self):
+            return self.now
+
+    fake = Clock()
+    monkeypatch.setattr(ols_client, "time", fake)
+    return fake
+
+def make_client(server, tmp_path, **options) -> OLSClient:
+    return OLSClient({**DEFAULT_CONFIG,
+                      'OLS_URL': f"http://127.0.0.1:{server.server_address[1]}/api/search",
+                      'OLS_CACHE_FILE': str(tmp_path / "ols.sqlite3"), 'OLS_TIMEOUT': 0.3, **options})
+
+def test_cache_miss_then_hit(ols_server, tmp_path):
+    client = make_client(ols_server, tmp_path)
+    first = client.search("Heart Rate")
+    assert first[0]['label'] == "Heart Rate"
+    assert client.search("Heart Rate") == first
+    assert len(ols_server.requests) == 1
+    assert ols_server.requests[0] == {"q": "Heart Rate", "queryFields": "label,synonym",
+                                      "fieldList": ols_client.FIELD_LIST, "exact": "true"}
+
+def test_cache_keyed_by_filter_options(ols_server, tmp_path):
+    client = make_client(ols_server, tmp_path)
+    client.search("SpO2")
+    client.search("SpO2", exact=False)
+    client.search("SpO2", query_fields="label")
+    client.search("SpO2", exact=False)
+    assert len(ols_server.requests) == 3
+
+def test_cache_persists_across_clients(ols_server, tmp_path):
+    make_client(ols_server, tmp_path).search("creatinine")
+    make_client(ols_server, tmp_path).search("creatinine")
+    assert len(ols_server.requests) == 1
+
+def test_expired_response_is_fetched_again(ols_server, tmp_path, clock):
+    client = make_client(ols_server, tmp_path, OLS_CACHE_TTL=60)
+    client.search("Heart Rate")
+    clock.now += 59
+    client.search("Heart Rate")
+    assert len(ols_server.requests) == 1
+    clock.now += 2
+    client.search("Heart Rate")
+    assert len(ols_server.requests) == 2
+
+def test_least_recently_used_evicted_by_size(tmp_path, clock):
+    response = [{"label": "x" * 100}]
+    size = len(json.dumps(response))
+    cache = OLSCache(str(tmp_path / "cache.sqlite3"), ttl=3600, max_bytes=2 * size)
+    cache.put("a", response)
+    clock.now += 1
+    cache.put("b", response)
+    clock.now += 1
+    assert cache.get("a") == response
+    clock.now += 1
+    cache.put("c", response)
+    assert cache.get("b") is None
+    assert cache.get("a") == response
+    assert cache.get("c") == response
+
+def test_timeout_raises_and_is_not_cached(ols_server, tmp_path):
+    client = make_client(ols_server, tmp_path)
+    with pytest.raises(requests.Timeout):
+        client.search("slow")
+    key = json.dumps({"q": "slow", "queryFields": "label,synonym", "fieldList": ols_client.FIELD_LIST,
+                      "exact": "true"}, sort_keys=True)
+    assert client.cache.get(key) is None
+
+def test_search_many(ols_server, tmp_path):
+    client = make_client(ols_server, tmp_path, OLS_WORKERS=4)
+    client.search("Heart Rate")
+    queries = ["Heart Rate", "SpO2", "creatinine", "SpO2", "broken", "slow"]
+    results = client.search_many(queries)
+    assert list(results) == ["Heart Rate", "SpO2", "creatinine", "broken", "slow"]
+    for query in ("Heart Rate", "SpO2", "creatinine"):
+        assert results[query][0]['label'] == query
+    assert isinstance(results["broken"], requests.HTTPError)
+    assert isinstance(results["slow"], requests.Timeout)
+    # Heart Rate came from the cache and SpO2 was only requested once
+    assert sorted(params['q'] for params in ols_server.requests) == [
+        "Heart Rate", "SpO2", "broken", "creatinine", "slow"]
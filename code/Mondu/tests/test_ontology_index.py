@@ -0,0 +1,25 @@
+from src.ontology_index import OntologyIndex, normalize
+
+LONG_COMMENT = ("The number of times the heart contracts in one minute, as recorded by a wearable "
+                "monitoring device over the day, reported next to SpO2")
+
+def make_index() -> OntologyIndex:
+    terms = [("Heart rate", "iri:hr"), ("Pulse", "iri:pulse"), ("Heart", "iri:heart"), ("Spot", "iri:spot")]
+    texts = [(0, normalize("Heart rate"), 1.0), (1, normalize("Pulse"), 1.0), (1, normalize(LONG_COMMENT), 0.5),
+             (2, normalize("Heart"), 1.0), (3, normalize("Spot"), 1.0)]
+    return OntologyIndex(terms, texts)
+
+def test_comment_containing_query_is_kept_below_min_score():
+    results = make_index().search("SpO2")
+    assert results[0].iri == "iri:pulse"
+    assert results[0].score < 0.3
+    assert [term.iri for term in results] == ["iri:pulse", "iri:spot"]
+
+def test_containment_ranked_before_similar_terms():
+    results = make_index().search("heart rat")
+    assert [term.iri for term in results][:2] == ["iri:hr", "iri:heart"]
+
+def test_exact_label_scores_highest():
+    results = make_index().search("Heart")
+    assert results[0].iri == "iri:heart"
+    assert results[0].score == 2.0
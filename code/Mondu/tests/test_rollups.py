@@ -0,0 +1,100 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+
+from benchmarks.generators import GENERATORS, START
+from src.config import DEFAULT_CONFIG
+from src.dedup import timestamp_key
+from src.document_factory import DocumentFactory
+from src.file_parser import iter_records
+from src.rollups import (CAUGHT_UP_FIELD, RESOLUTIONS, ROLLUP_FIELD, catch_up, choose_resolution,
+                         rollup_collection)
+from src.sample_processor import stream_samples, upload_prepared_samples
+
+@pytest.fixture
+def config():
+    return {**DEFAULT_CONFIG, 'DEVICE': "flow", 'USERNAME': "anonymous", 'MAX_SAMPLES': 50,
+            'ROLLUP_FLUSH_WINDOWS': 20}
+
+@pytest.fixture
+def write_rows(database, tmp_path, config):
+    file_path = tmp_path / "flow.csv"
+    GENERATORS['flow'](str(file_path), 1500)
+    header, *rows = file_path.read_text().splitlines(keepends=True)
+
+    def write(start, stop, rollups):
+        part = tmp_path / f"flow_{start}.csv"
+        part.write_text(header + "".join(rows[start:stop]))
+        part_config = {**config, 'ROLLUPS': rollups}
+        samples = stream_samples(iter_records(str(part)), DocumentFactory(part_config), part_config)
+        return upload_prepared_samples(samples, part_config, database['measurements'])
+    return write
+
+def stored_windows(collection, resolution):
+    width = RESOLUTIONS[resolution]
+    windows = defaultdict(lambda: [0, 0.0])
+    for bucket in collection.find():
+        for measurement in bucket['measurements']:
+            window = windows[(bucket['type'], timestamp_key(measurement['timestamp']) // width * width)]
+            window[0] += 1
+            window[1] += measurement['value']
+    return windows
+
+def rollup_windows(database, config, resolution):
+    return {(window['type'], timestamp_key(window['start'])): [window['summaries']['count'],
+                                                             window['summaries']['sum']]
+            for window in rollup_collection(database, config, resolution).find()}
+
+def assert_rolled_up_once(database, config):
+    for resolution in config['ROLLUP_RESOLUTIONS']:
+        expected = stored_windows(database['measurements'], resolution)
+        windows = rollup_windows(database, config, resolution)
+        assert windows.keys() == expected.keys()
+        for key, (count, total) in windows.items():
+            assert count == expected[key][0]
+            assert total == pytest.approx(expected[key][1])
+
+def test_ingest_and_catch_up_roll_up_each_measurement_once(database, write_rows, config):
+    # Rows 1430 to 1435 are sent twice and dropped as duplicates; midnight is at row 1440
+    write_rows(1420, 1435, rollups=True)
+    report = write_rows(1430, 1445, rollups=False)
+    assert report.n_duplicates == 8 * 5
+    assert catch_up(database, database['measurements'], config) > 0
+
+    write_rows(1445, 1460, rollups=False)
+    write_rows(1410, 1420, rollups=True)
+    catch_up(database, database['measurements'], config)
+    assert catch_up(database, database['measurements'], config) == 0
+
+    buckets = list(database['measurements'].find())
+    assert {bucket.get(ROLLUP_FIELD) for bucket in buckets} == {"ingest", None}
+    for bucket in buckets:
+        if bucket.get(ROLLUP_FIELD) == "ingest":
+            assert CAUGHT_UP_FIELD not in bucket
+        else:
+            assert bucket[CAUGHT_UP_FIELD] == bucket['n_samples']
+    assert_rolled_up_once(database, config)
+
+def test_catch_up_reads_only_appended_measurements(database, write_rows, config):
+    write_rows(1420, 1430, rollups=False)
+    catch_up(database, database['measurements'], config)
+    # The next rows are appended to the same buckets, whose first measurements are already rolled up
+    write_rows(1430, 1435, rollups=False)
+    catch_up(database, database['measurements'], config)
+    assert_rolled_up_once(database, config)
+
+@pytest.mark.parametrize("start, end, max_points, resolutions, expected", [
+    (START, START + timedelta(hours=1), 61, ["minute", "hour", "day"], "minute"),
+    (START, START + timedelta(hours=1), 60, ["minute", "hour", "day"], "hour"),
+    (START + timedelta(seconds=30), START + timedelta(minutes=2), 3, ["minute", "hour"], "minute"),
+    (START, START + timedelta(days=2), 100, ["day", "minute", "hour"], "hour"),
+    (START, START + timedelta(days=60), 10, ["minute", "hour", "day"], "day"),
+    (START, START + timedelta(hours=5), 2, ["minute", "hour"], "hour"),
+])
+def test_choose_resolution(start, end, max_points, resolutions, expected):
+    assert choose_resolution(start, end, max_points, resolutions) == expected
+
+def test_choose_resolution_with_offset_timestamps():
+    start = datetime.fromisoformat("2019-05-01T02:00:00+02:00")
+    assert choose_resolution(start, start + timedelta(minutes=59), 60, ["minute", "hour"]) == "minute"
@@ -0,0 +1,43 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from src.signal_codec import decode_signal, encode_signal, encode_signal_value, is_encoded_signal, parse_signal
+
+@pytest.mark.parametrize("value, expected", [
+    ("[12,-40,7]", [12, -40, 7]),
+    ("[ 1.5, -2 ,3e2 ]", [1.5, -2, 300]),
+    ("[nan,inf]", [np.nan, np.inf]),
+])
+def test_parse_signal(value, expected):
+    np.testing.assert_array_equal(parse_signal(value), np.array(expected, dtype=np.float64))
+
+@pytest.mark.parametrize("value", ["[]", "[ ]", "[1,,2]", "[1,a]", "[1,2,]", "[,1]", "[1 2]", "abc"])
+def test_parse_signal_rejects_other_strings(value):
+    assert parse_signal(value) is None
+
+def test_encoded_signal_round_trip():
+    signal = np.random.default_rng(0).integers(-900, 900, 9000)
+    value = "[" + ",".join(map(str, signal.tolist())) + "]"
+    np.testing.assert_array_equal(decode_signal(encode_signal_value(value)), signal.astype(np.float64))
+    assert encode_signal_value("[1,a]") == "[1,a]"
+
+@pytest.mark.parametrize("baseline", [0, 1000, -1000000])
+def test_deltas_start_after_the_first_sample(baseline):
+    signal = baseline + np.round(50 * np.sin(np.arange(100) / 5))
+    encoded = encode_signal(signal)
+    assert encoded[4:5] == b"b"
+    np.testing.assert_array_equal(decode_signal(encoded), signal)
+
+@pytest.mark.parametrize("signal", [[], [7], [1.5, 2], [3, 3, 3]])
+def test_short_signals_round_trip(signal):
+    np.testing.assert_array_equal(decode_signal(encode_signal(signal)), np.array(signal, dtype=np.float64))
+
+def test_earlier_format_still_decodes():
+    signal = np.array([1000, 1003, 998], dtype=np.int64)
+    deltas = np.diff(signal, prepend=0).astype('<i2').tobytes()
+    data = struct.pack("<4scI", b"MDS1", b"h", len(signal)) + zlib.compress(deltas)
+    assert is_encoded_signal(data)
+    np.testing.assert_array_equal(decode_signal(data), signal.astype(np.float64))
@@ -0,0 +1,62 @@
+import pytest
+
+from benchmarks.generators import GENERATORS
+from src.config import DEFAULT_CONFIG
+from src.document_factory import DocumentFactory
+from src.file_parser import iter_records
+from src.migrate import migrate_buckets
+from src.sample_processor import stream_samples, upload_prepared_samples
+
+@pytest.fixture
+def upload(database, tmp_path):
+    file_path = tmp_path / "flow.csv"
+    GENERATORS['flow'](str(file_path), 130)
+    header, *rows = file_path.read_text().splitlines(keepends=True)
+
+    # Uploads rows of the export both as buckets and straight to the 'direct' time-series collection
+    def upload(start, stop):
+        part = tmp_path / f"flow_{start}.csv"
+        part.write_text(header + "".join(rows[start:stop]))
+        for backend in ("buckets", "timeseries"):
+            config = {**DEFAULT_CONFIG, 'DEVICE': "flow", 'USERNAME': "anonymous", 'MAX_SAMPLES': 50,
+                      'STORAGE_BACKENDS': {"flow": backend}, 'TIMESERIES_COLLECTION': "direct"}
+            samples = stream_samples(iter_records(str(part)), DocumentFactory(config), config)
+            assert upload_prepared_samples(samples, config, database['measurements']).errors == []
+    return upload
+
+def documents(collection):
+    return sorted(repr(sorted((k, sorted(v.items()) if k == 'meta' else v)
+                              for k, v in document.items() if k != '_id'))
+                  for document in collection.find())
+
+def migrate(database):
+    return migrate_buckets(database['measurements'], database['migrated'], batch_size=7,
+                           state=database['migration_state'])
+
+def test_migration_matches_direct_writes_and_reruns_copy_nothing(database, tmp_path, upload):
+    sepsis_config = {**DEFAULT_CONFIG, 'DEVICE': "mimic_sepsis", 'USERNAME': "anonymous"}
+    GENERATORS['mimic_sepsis'](str(tmp_path / "sepsis.csv"), 3)
+    upload_prepared_samples(stream_samples(iter_records(str(tmp_path / "sepsis.csv")),
+                                           DocumentFactory(sepsis_config), sepsis_config),
+                            sepsis_config, database['measurements'])
+    upload(0, 100)
+
+    report = migrate(database)
+    assert report.n_ops == database['migrated'].count_documents({}) == 8 * 100
+    assert documents(database['migrated']) == documents(database['direct'])
+
+    report = migrate(database)
+    assert (report.n_ops, report.errors) == (0, [])
+    assert database['migrated'].count_documents({}) == 8 * 100
+
+    # Rows appended to the migrated buckets, and to new ones, are the only ones copied next time
+    upload(100, 130)
+    assert migrate(database).n_ops == 8 * 30
+    assert migrate(database).n_ops == 0
+    assert documents(database['migrated']) == documents(database['direct'])
+
+def test_migration_without_state_copies_everything_again(database, upload):
+    upload(0, 20)
+    migrate_buckets(database['measurements'], database['migrated'], batch_size=7)
+    migrate_buckets(database['measurements'], database['migrated'], batch_size=7)
+    assert database['migrated'].count_documents({}) == 2 * 8 * 20
@@ -5,9 +5,14 @@ from tqdm import tqdm
 import pymongo as pm
 import pprint as pp
 import requests
+import tempfile
+import hashlib
 import click
 import types
 import json
+import glob
+import os
+import time
 import csv
 
 
@@ -21,6 +26,15 @@ DEBUG_MODE = False
 COLLECTION = ""
 USERNAME = ""
 DEVICE = ""
+ONTO_CACHE_DIR = os.path.expanduser("~/.cache/mondu/ontology")
+MONGO_CLIENT = None
+MONGO_OPTIONS = {
+    "maxPoolSize": 50,
+    "w": 1,
+    "connectTimeoutMS": 10000,
+    "socketTimeoutMS": 120000,
+    "serverSelectionTimeoutMS": 30000
+}
 
 devices = {
     "move_ecg": "0",
@@ -36,6 +50,8 @@ devices = {
 }
 
 mongo_prescriptions = []
+# (day, drug) -> highest drug_dosage_num already stored in MongoDB
+mongo_dosages = {}
 
 users = {
     "daniel bloor": "0",
@@ -49,7 +65,8 @@ previous_drug = ""
 previous_days = []
 previous_context = {
     'user': "Placeholder",
-    'prescriptions': []
+    # day -> {drug: highest drug_dosage_num} for the current subject
+    'dosages': {}
 }
 
 
@@ -66,6 +83,64 @@ def get_days(start_date_, end_date_):
     return days
 
 
+def index_prescriptions(records):
+    # Build the (day, drug) -> highest drug_dosage_num index from stored
+    # prescriptions, either flat records or bucket documents with measurements.
+    index = {}
+    for record in records:
+        for prescription in record.get('measurements', [record]):
+            if 'drug_dosage_num' not in prescription:
+                continue
+            key = (prescription.get('day'), prescription.get('drug'))
+            index[key] = max(index.get(key, 0), prescription['drug_dosage_num'])
+
+    return index
+
+
+def get_client():
+    # One pooled client per process, shared by every upload and lookup
+    global MONGO_CLIENT
+    if MONGO_CLIENT is None:
+        MONGO_CLIENT = pm.MongoClient(**MONGO_OPTIONS)
+
+    return MONGO_CLIENT
+
+
+def load_cached_ontology(iri):
+    # Reuse a parsed quadstore keyed by the IRI and the ontology file contents,
+    # rebuilding it (and dropping older versions) when the file changes
+    iri_key = hashlib.sha256(iri.encode()).hexdigest()[:16]
+    content_hash = hashlib.sha256(iri.encode())
+    name = iri.rstrip('/#').rpartition('/')[-1]
+    candidates = [os.path.join(directory, name + extension) for directory in owl.onto_path
+                  for extension in ("", ".owl", ".rdf", ".xml", ".nt", ".ntriples")]
+    ontology_file = next((path for path in candidates if os.path.isfile(path)), None)
+    if ontology_file:
+        with open(ontology_file, 'rb') as file:
+            content_hash.update(file.read())
+
+    cache_file = os.path.join(ONTO_CACHE_DIR, f"{iri_key}-{content_hash.hexdigest()[:16]}.sqlite3")
+    if not os.path.exists(cache_file):
+        os.makedirs(ONTO_CACHE_DIR, exist_ok=True)
+        file_descriptor, temp_file = tempfile.mkstemp(dir=ONTO_CACHE_DIR, suffix=".tmp")
+        os.close(file_descriptor)
+        try:
+            world = owl.World(filename=temp_file)
+            world.get_ontology(iri).load()
+            world.save()
+            world.close()
+            os.replace(temp_file, cache_file)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        for stale_file in glob.glob(os.path.join(ONTO_CACHE_DIR, f"{iri_key}-*.sqlite3")):
+            if stale_file != cache_file:
+                os.remove(stale_file)
+
+    world = owl.World(filename=cache_file, read_only=True, exclusive=False)
+    return world.get_ontology(iri).load()
+
+
 class Metadata(me.Document):
     document_version = me.StringField(required=True)
     ontology_name = me.StringField(required=True)
@@ -279,13 +354,10 @@ class DocumentFactory:
         global SAMPLE_PERIOD
         SAMPLE_PERIOD = "Manual/day"
         created_samples = []
-        highest_dose_num = 0
-        mongo_dosage_num = 0
-        drug_dosage_num = 0
 
         if record_data['subject_id'] != previous_context['user']:
             previous_context['user'] = record_data['subject_id']
-            previous_context['prescriptions'] = []
+            previous_context['dosages'] = {}
 
         try:
             startdate_formatted = datetime.fromisoformat(
@@ -305,28 +377,17 @@ class DocumentFactory:
         days = get_days(startdate_formatted, enddate_formatted)
 
         for day in days:
-            if len(previous_context['prescriptions']) > 0:
-                for prescription in previous_context['prescriptions']:
-                    if day == prescription['day'] and record_data['drug'] in prescription['drug']:
-                        if prescription['drug_dosage_num'] > highest_dose_num:
-                            highest_dose_num = prescription['drug_dosage_num']
-
-            result = [record for record in mongo_prescriptions if record['day'] == day and record['drug'] == record_data['drug']]
-            if len(result) > 0:
-                dosages = []
-                for record in result:
-                    for key, value in record.items():
-                        if key == 'drug_dosage_num':
-                            dosages.append(value)
-                    mongo_dosage_num = max(dosages)
-
-            highest_sample_dose_num = 0
-            if len(created_samples) > 0:
-                sample_dose_nums = [sample['samples']['prescriptions']['drug_dosage_num'] for sample in created_samples if sample['samples']['prescriptions']['day'] == day and sample['samples']['prescriptions']['drug'] == record_data['drug']]
-                if len(sample_dose_nums) > 0:
-                    highest_sample_dose_num = max(sample_dose_nums)
-
-            drug_dosage_num = max(mongo_dosage_num, highest_dose_num, highest_sample_dose_num)+1
+            # Highest number already given to this drug on this day for the current
+            # subject. Earlier prescriptions are matched on the drug name containing
+            # this record's drug, as the previous linear scan did.
+            day_dosages = previous_context['dosages'].setdefault(day, {})
+            highest_dose_num = max(
+                (dose_num for drug, dose_num in day_dosages.items() if record_data['drug'] in drug),
+                default=0)
+
+            mongo_dosage_num = mongo_dosages.get((day, record_data['drug']), 0)
+
+            drug_dosage_num = max(mongo_dosage_num, highest_dose_num)+1
 
             sample = {
                 'day': day,
@@ -336,19 +397,12 @@ class DocumentFactory:
                 'drug_dosage_num': drug_dosage_num
             }
 
-            mongo_dosage_num = 0
-            highest_dose_num = 0
-            drug_dosage_num = 0
-
             measurements = {'prescriptions': sample}
 
 
             context = {"user_id": record_data["subject_id"]}
             created_samples.append({'samples': measurements, 'context': context})
-            previous_context['prescriptions'].append(
-                {'day': sample['day'],
-                 'drug': sample['drug'],
-                 'drug_dosage_num': sample['drug_dosage_num']})
+            day_dosages[sample['drug']] = max(day_dosages.get(sample['drug'], 0), drug_dosage_num)
 
         return created_samples
 
@@ -451,6 +505,7 @@ def parse_file(file_path):
 
 def prepare_samples(data_, document_factory_):
     global mongo_prescriptions
+    global mongo_dosages
     if DEVICE == "mimic_prescriptions":
         mongo_prescriptions = COLLECTION.find(
             {
@@ -460,6 +515,7 @@ def prepare_samples(data_, document_factory_):
             },
             {"measurements": 1}
         )
+        mongo_dosages = index_prescriptions(mongo_prescriptions)
 
     prepared_samples = []
     for record in tqdm(data_):
@@ -558,16 +614,37 @@ def prepare_samples(data_, document_factory_):
 
     return tuple(prepared_samples)
 
-def upload_samples(data_, document_factory_):
+def upload_samples(data_, document_factory_, batch_size=None):
 
     samples_for_mongodb = prepare_samples(data_ = data_, document_factory_ = document_factory_)
 
-    for sample in tqdm(samples_for_mongodb):
-        COLLECTION.update_one(
-            sample['sample_dict'],
-            sample['collection_dict'],
-            upsert=True
-        )
+    if not batch_size:
+        for sample in tqdm(samples_for_mongodb):
+            COLLECTION.update_one(
+                sample['sample_dict'],
+                sample['collection_dict'],
+                upsert=True
+            )
+        return []
+
+    errors = []
+    n_ops = 0
+    start = time.perf_counter()
+    for batch_start in tqdm(range(0, len(samples_for_mongodb), batch_size)):
+        operations = [pm.UpdateOne(sample['sample_dict'], sample['collection_dict'], upsert=True)
+                      for sample in samples_for_mongodb[batch_start:batch_start + batch_size]]
+        try:
+            COLLECTION.bulk_write(operations, ordered=False)
+            n_ops += len(operations)
+        except pm.errors.BulkWriteError as e:
+            write_errors = e.details.get('writeErrors', [])
+            n_ops += len(operations) - len(write_errors)
+            errors.extend({'batch_start': batch_start, **error} for error in write_errors)
+    elapsed = time.perf_counter() - start
+    print(f"Uploaded {n_ops} operations ({n_ops / elapsed if elapsed else 0:.0f} ops/s), "
+          f"{len(errors)} errors")
+
+    return errors
 
 
 def print_samples(data_, document_factory_, quantity=None):
@@ -597,28 +674,27 @@ def print_samples(data_, document_factory_, quantity=None):
 @click.option("-db", "--database", help="Database to upload to.", default='COPH')
 @click.option("-c", "--collection",
               help="Collection to upload to.", default='measurements')
+@click.option("-b", "--batch_size", type=int, default=1000,
+              help="Upserts per bulk write, 0 to send them one at a time.")
 def main(filepath: str, sample_period: str,
          database: str, max_samples: int,
          collection: str, device: str,
-         user_name: str):
+         user_name: str, batch_size: int):
     # Setup
     global MAX_SAMPLES
     global SAMPLE_PERIOD
     MAX_SAMPLES = max_samples
     SAMPLE_PERIOD = sample_period
 
-    world = owl.default_world
-    _, filename = owl.tempfile.mkstemp()
-    world.set_backend(filename=filename)
-    onto = world.get_ontology(COPH_IRI).load()
+    onto = load_cached_ontology(COPH_IRI)
 
-    client = pm.MongoClient()
+    client = get_client()
     db = client[database]
     collection = db[collection]
     data = parse_file(filepath)
     document_factory = DocumentFactory()
 
-    upload_samples(data_=data, document_factory_=document_factory)
+    upload_samples(data_=data, document_factory_=document_factory, batch_size=batch_size)
 
 
 def direct_main():
@@ -632,7 +708,7 @@ def direct_main():
     SAMPLE_PERIOD = "1/min"
 
     filepath = f"{START_PATH}{FILE_NAME}"
-    client = pm.MongoClient()
+    client = get_client()
     db = client[DATABASE]
     COLLECTION = db["mimic"]
     data = parse_file(filepath)
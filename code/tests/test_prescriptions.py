@@ -0,0 +1,101 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import mondu
+
+DRUGS = ["Heparin", "Heparin Sodium", "Insulin", "Insulin Glargine", "NS", "Potassium Chloride", "Sodium Chloride"]
+
+def synthetic_history(seed, subjects=4, records=60):
+    """Prescription records of several subjects spanning overlapping multi-day ranges."""
+    rng = random.Random(seed)
+    history = []
+    for subject_id in range(subjects):
+        for _ in range(records):
+            start = datetime(2130, 1, 1) + timedelta(days=rng.randrange(6))
+            end = start + timedelta(days=rng.randrange(1, 4))
+            history.append({
+                'subject_id': subject_id,
+                'startdate': start.isoformat(sep=' '),
+                'enddate': end.isoformat(sep=' '),
+                'drug': rng.choice(DRUGS),
+                'dose_val_rx': str(rng.randrange(1, 500)),
+                'dose_unit_rx': "mg"
+            })
+    return history
+
+def stored_prescriptions(seed):
+    """Prescriptions already in MongoDB, as flat records."""
+    rng = random.Random(seed)
+    return [{'day': (datetime(2130, 1, 1) + timedelta(days=rng.randrange(8))).strftime("%Y-%m-%d"),
+             'drug': rng.choice(DRUGS), 'drug_dosage_num': rng.randrange(1, 4)}
+            for _ in range(40)]
+
+def linear_scan_numbering(history, stored):
+    """Dosage numbers as the linear scans before the (day, drug) index gave them."""
+    numbers = []
+    previous = {'user': "Placeholder", 'prescriptions': []}
+    for record in history:
+        if record['subject_id'] != previous['user']:
+            previous['user'] = record['subject_id']
+            previous['prescriptions'] = []
+        created_samples = []
+        days = mondu.get_days(datetime.fromisoformat(record['startdate']), datetime.fromisoformat(record['enddate']))
+        for day in days:
+            highest_dose_num = 0
+            for prescription in previous['prescriptions']:
+                if day == prescription['day'] and record['drug'] in prescription['drug']:
+                    highest_dose_num = max(highest_dose_num, prescription['drug_dosage_num'])
+            mongo_dosage_num = max((r['drug_dosage_num'] for r in stored
+                                    if r['day'] == day and r['drug'] == record['drug']), default=0)
+            highest_sample_dose_num = max((s['drug_dosage_num'] for s in created_samples
+                                           if s['day'] == day and s['drug'] == record['drug']), default=0)
+            sample = {'day': day, 'drug': record['drug'],
+                      'drug_dosage_num': max(mongo_dosage_num, highest_dose_num, highest_sample_dose_num) + 1}
+            created_samples.append(sample)
+            previous['prescriptions'].append(sample)
+            numbers.append((record['subject_id'], day, record['drug'], sample['drug_dosage_num']))
+    return numbers
+
+def indexed_numbering(history, stored, monkeypatch):
+    """Dosage numbers given by DocumentFactory._create_mimic_prescriptions."""
+    monkeypatch.setattr(mondu, "previous_context", {'user': "Placeholder", 'dosages': {}})
+    monkeypatch.setattr(mondu, "mongo_dosages", mondu.index_prescriptions(stored))
+    factory = mondu.DocumentFactory()
+    numbers = []
+    for record in history:
+        for sample in factory.create_samples("mimic_prescriptions", record):
+            prescription = sample['samples']['prescriptions']
+            numbers.append((sample['context']['user_id'], prescription['day'], prescription['drug'],
+                            prescription['drug_dosage_num']))
+    return numbers
+
+@pytest.mark.parametrize("seed", range(5))
+def test_indexed_numbering_matches_linear_scans(seed, monkeypatch):
+    history, stored = synthetic_history(seed), stored_prescriptions(seed)
+    expected = linear_scan_numbering(history, stored)
+    assert indexed_numbering(history, stored, monkeypatch) == expected
+    # Substring matches on earlier drug names must have raised some numbers
+    assert any(number > 1 for *_, number in expected)
+
+def test_numbering_without_stored_prescriptions(monkeypatch):
+    history = synthetic_history(7)
+    assert indexed_numbering(history, [], monkeypatch) == linear_scan_numbering(history, [])
+
+def test_substring_drugs_continue_numbering(monkeypatch):
+    record = {'subject_id': 1, 'startdate': "2130-01-01 00:00:00", 'enddate': "2130-01-02 00:00:00",
+              'dose_val_rx': "1", 'dose_unit_rx': "mg"}
+    history = [{**record, 'drug': "Insulin Glargine"}, {**record, 'drug': "Insulin"}, {**record, 'drug': "Heparin"}]
+    numbers = [number for *_, number in indexed_numbering(history, [], monkeypatch)]
+    assert numbers == [1, 2, 1]
+
+def test_index_prescriptions_reads_buckets_and_flat_records():
+    stored = [
+        {'measurements': [{'day': "2130-01-01", 'drug': "NS", 'drug_dosage_num': 2},
+                          {'day': "2130-01-01", 'drug': "NS", 'drug_dosage_num': 3}]},
+        {'day': "2130-01-01", 'drug': "NS", 'drug_dosage_num': 1},
+        {'day': "2130-01-02", 'drug': "Heparin", 'drug_dosage_num': 4},
+        {'measurements': [{'day': "2130-01-02", 'value': 1.0}]}
+    ]
+    assert mondu.index_prescriptions(stored) == {("2130-01-01", "NS"): 3, ("2130-01-02", "Heparin"): 4}